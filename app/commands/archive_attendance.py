@@ -0,0 +1,43 @@
+"""Move attendance older than a cutoff day into the archive.
+
+Writes the per (course, student) archive totals, raises the archive
+watermark, waits for every worker's cached watermark to expire, then moves
+the marks of earlier days out of the hot store in batches. An interrupted
+run can simply be started again.
+
+    python -m app.commands.archive_attendance --before 2024-07-01 [--batch-size 1000]
+    python -m app.commands.archive_attendance --keep-days 365
+"""
+
+import argparse
+import asyncio
+import json
+import re
+from datetime import datetime, timedelta
+
+from app.services.attendance_archive import archive_attendance
+from app.system.database import connect, ensure_indexes
+from app.system.dates import DAY_PATTERN, day_bucket
+
+
+async def main(before: str, batch_size: int):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = await archive_attendance(db, before, batch_size)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cutoff = parser.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument("--before", help="archive days before this one (YYYY-MM-DD)")
+    cutoff.add_argument("--keep-days", type=int, help="archive all but the last N days")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    before = args.before
+    if before is None:
+        before = day_bucket(datetime.utcnow() - timedelta(days=args.keep_days))
+    elif not re.match(DAY_PATTERN, before):
+        parser.error("--before must be YYYY-MM-DD")
+    asyncio.run(main(before, args.batch_size))
@@ -0,0 +1,85 @@
+"""Backfill the ``day`` bucket on legacy attendance_log documents.
+
+Older records only carry ``date`` (a unix timestamp), which the unique
+(student_id, course_id, day) index cannot see. This walks those records in
+``_id`` order and sets ``day`` in batches. Records that collide with an
+already bucketed record for the same student, course and day are left
+untouched and reported so they can be reviewed by hand.
+
+    python -m app.commands.backfill_attendance_day --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.system.database import connect, ensure_indexes, DUPLICATE_KEY_ERROR
+from app.system.dates import day_bucket, day_bucket_from_timestamp
+
+
+def legacy_day(doc: dict) -> str:
+    """Work out the day bucket for a record written before ``day`` existed"""
+    if isinstance(doc.get("date"), (int, float)):
+        return day_bucket_from_timestamp(doc["date"])
+    if isinstance(doc.get("updated_at"), datetime):
+        return day_bucket(doc["updated_at"])
+    return day_bucket(doc["_id"].generation_time)
+
+
+async def backfill(database, batch_size: int = 1000) -> dict:
+    report = {"scanned": 0, "updated": 0, "duplicates": []}
+    last_id = None
+
+    while True:
+        query = {"day": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = (
+            await database.attendance_log.find(query, {"date": 1, "updated_at": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], "day": {"$exists": False}},
+                {"$set": {"day": legacy_day(doc)}},
+            )
+            for doc in batch
+        ]
+        try:
+            result = await database.attendance_log.bulk_write(operations, ordered=False)
+            report["updated"] += result.modified_count
+        except BulkWriteError as e:
+            report["updated"] += e.details["nModified"]
+            for error in e.details["writeErrors"]:
+                if error["code"] != DUPLICATE_KEY_ERROR:
+                    raise
+                report["duplicates"].append(str(batch[error["index"]]["_id"]))
+
+        report["scanned"] += len(batch)
+        last_id = batch[-1]["_id"]
+
+    return report
+
+
+async def main(batch_size: int):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = await backfill(db, batch_size)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,77 @@
+"""Backfill the normalized search fields on students and users.
+
+Name search (``/api/students/search``, ``/api/users/search``) matches on
+``search_name`` and ``search_username``, which create, update and import set.
+This walks documents written before those fields existed, or whose name
+changed outside the API, in ``_id`` order and sets them in batches.
+
+    python -m app.commands.backfill_search_names --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+
+from pymongo import UpdateOne
+
+from app.system.database import connect, ensure_indexes
+from app.system.search import normalize
+
+# Collection -> (source field, normalized field)
+SEARCH_FIELDS = {
+    "students": ("full_name", "search_name"),
+    "users": ("username", "search_username"),
+}
+
+
+async def backfill(database, collection: str, batch_size: int = 1000) -> dict:
+    source, target = SEARCH_FIELDS[collection]
+    report = {"scanned": 0, "updated": 0}
+    last_id = None
+
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = (
+            await database[collection]
+            .find(query, {source: 1, target: 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], source: doc[source]},
+                {"$set": {target: normalize(doc[source])}},
+            )
+            for doc in batch
+            if isinstance(doc.get(source), str)
+            and doc.get(target) != normalize(doc[source])
+        ]
+        if operations:
+            result = await database[collection].bulk_write(operations, ordered=False)
+            report["updated"] += result.modified_count
+
+        report["scanned"] += len(batch)
+        last_id = batch[-1]["_id"]
+
+    return report
+
+
+async def main(batch_size: int):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = {
+            collection: await backfill(db, collection, batch_size)
+            for collection in SEARCH_FIELDS
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
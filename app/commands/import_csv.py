@@ -0,0 +1,45 @@
+"""Import departments, courses or students from a CSV file.
+
+Same validation, de-duplication and report as the POST /api/<kind>/import
+endpoints: one JSON line per rejected row, then a summary. Import
+departments before the courses and students that reference them.
+
+    python -m app.commands.import_csv students students.csv --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+
+from app.services.csv_import import (
+    IMPORT_BATCH_SIZE,
+    IMPORTS,
+    csv_records,
+    import_rows,
+)
+from app.system.database import connect, ensure_indexes
+
+READ_SIZE = 64 * 1024
+
+
+async def read_chunks(f):
+    while chunk := f.read(READ_SIZE):
+        yield chunk
+
+
+async def main(kind: str, path: str, batch_size: int):
+    async with connect() as db:
+        await ensure_indexes(db)
+        with open(path, "rb") as f:
+            records = csv_records(read_chunks(f))
+            async for entry in import_rows(db, kind, records, batch_size):
+                print(json.dumps(entry))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=sorted(IMPORTS))
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.kind, args.path, args.batch_size))
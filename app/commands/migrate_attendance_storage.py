@@ -0,0 +1,70 @@
+"""Copy attendance between the log and bucketed storage layouts.
+
+Reads every record of the source layout in batches and writes them to the
+other one, keeping each mark's _id. Marks already present in the target are
+counted as duplicates, so an interrupted run can simply be started again.
+Log records without a ``day`` (run backfill_attendance_day first) or with an
+invalid student id are skipped and reported. The source is left in place;
+switch ATTENDANCE_STORAGE once the report looks right, then drop it.
+
+    python -m app.commands.migrate_attendance_storage --to buckets --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+
+from bson import ObjectId
+
+from app.services.attendance_store import BUCKETS, LOG, attendance_store
+from app.system.database import connect, ensure_indexes, DUPLICATE_KEY_ERROR
+
+
+async def migrate(database, target: str, batch_size: int = 1000) -> dict:
+    source = LOG if target == BUCKETS else BUCKETS
+    report = {
+        "from": source,
+        "to": target,
+        "read": 0,
+        "written": 0,
+        "duplicates": 0,
+        "skipped": [],
+    }
+    store = attendance_store(database, target)
+
+    async def flush(batch: list[dict]):
+        errors = await store.insert_many(batch)
+        for error in errors.values():
+            if error["code"] != DUPLICATE_KEY_ERROR:
+                raise RuntimeError(f"Migration failed: {error['errmsg']}")
+        report["duplicates"] += len(errors)
+        report["written"] += len(batch) - len(errors)
+
+    batch = []
+    async for record in attendance_store(database, source).find({}, batch_size):
+        report["read"] += 1
+        if not record.get("day") or not ObjectId.is_valid(record.get("student_id")):
+            report["skipped"].append(str(record["_id"]))
+            continue
+        batch.append(record)
+        if len(batch) == batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return report
+
+
+async def main(target: str, batch_size: int):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = await migrate(db, target, batch_size)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--to", choices=(LOG, BUCKETS), required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.to, args.batch_size))
@@ -0,0 +1,78 @@
+"""Rebuild attendance_rollups from the attendance records and report drift.
+
+Recomputes every course, (course, student) and (course, day) counter from
+the records of the configured storage layout, compares it with what is
+stored and rewrites the rollups that differ. Use --check to only report.
+
+    python -m app.commands.rebuild_rollups [--check]
+"""
+
+import argparse
+import asyncio
+import json
+
+from pymongo import DeleteOne, ReplaceOne
+
+from app.services.rollups import compute_rollups
+from app.system.database import connect, ensure_indexes
+
+WRITE_BATCH = 1000
+
+
+async def reconcile(database, check_only: bool = False) -> dict:
+    expected = await compute_rollups(database)
+    report = {"rollups": len(expected), "drifted": [], "missing": [], "stale": []}
+    operations = []
+
+    async for stored in database.attendance_rollups.find():
+        rollup = expected.pop(stored["_id"], None)
+        if rollup is None:
+            report["stale"].append(stored["_id"])
+            operations.append(DeleteOne({"_id": stored["_id"]}))
+        elif (stored.get("total"), stored.get("present")) != (
+            rollup["total"],
+            rollup["present"],
+        ):
+            report["drifted"].append(
+                {
+                    "_id": stored["_id"],
+                    "stored": {
+                        "total": stored.get("total"),
+                        "present": stored.get("present"),
+                    },
+                    "expected": {
+                        "total": rollup["total"],
+                        "present": rollup["present"],
+                    },
+                }
+            )
+            operations.append(ReplaceOne({"_id": rollup["_id"]}, rollup))
+
+    # Whatever is left was never written
+    for rollup in expected.values():
+        report["missing"].append(rollup["_id"])
+        operations.append(ReplaceOne({"_id": rollup["_id"]}, rollup, upsert=True))
+
+    if not check_only:
+        for i in range(0, len(operations), WRITE_BATCH):
+            await database.attendance_rollups.bulk_write(
+                operations[i : i + WRITE_BATCH], ordered=False
+            )
+    report["repaired"] = 0 if check_only else len(operations)
+    return report
+
+
+async def main(check_only: bool):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = await reconcile(db, check_only)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--check", action="store_true", help="report drift without repairing it"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.check))
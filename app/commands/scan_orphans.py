@@ -0,0 +1,85 @@
+"""Find attendance that refers to students or courses that no longer exist.
+
+Lists every missing student and course the attendance records of the
+configured storage layout, hot or archived, still refer to. With --schedule
+a cleanup job is queued for each (the API workers run them); --run also
+runs them here, throttled like in the API.
+
+    python -m app.commands.scan_orphans [--schedule] [--run]
+"""
+
+import argparse
+import asyncio
+import json
+
+from bson import ObjectId
+
+from app.services.attendance_cleanup import (
+    TARGETS,
+    AttendanceCleaner,
+    schedule_cleanup,
+)
+from app.services.attendance_archive import archive_store
+from app.services.attendance_store import attendance_store
+from app.system.config import settings
+from app.system.database import connect, ensure_indexes
+
+CHECK_BATCH = 1000
+
+
+async def missing(db, collection: str, ids: list[str]) -> list[str]:
+    """The ids that have no document in ``collection``"""
+    valid = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    found = {
+        str(doc["_id"])
+        async for doc in db[collection].find({"_id": {"$in": valid}}, {"_id": 1})
+    }
+    return [i for i in ids if i not in found]
+
+
+async def scan(db, kind: str) -> list[str]:
+    """Ids of the missing students or courses of ``kind`` with attendance"""
+    orphans, batch, seen = [], [], set()
+    for store in (attendance_store(db), archive_store(db)):
+        async for target_id in store.referenced(TARGETS[kind]):
+            if target_id in seen:
+                continue
+            seen.add(target_id)
+            batch.append(target_id)
+            if len(batch) == CHECK_BATCH:
+                orphans += await missing(db, f"{kind}s", batch)
+                batch = []
+    if batch:
+        orphans += await missing(db, f"{kind}s", batch)
+    return orphans
+
+
+async def main(schedule: bool, run: bool):
+    async with connect() as db:
+        await ensure_indexes(db)
+        report = {kind: await scan(db, kind) for kind in TARGETS}
+        if schedule or run:
+            for kind, orphans in report.items():
+                for target_id in orphans:
+                    await schedule_cleanup(db, kind, target_id, delay=0)
+        if run:
+            cleaner = AttendanceCleaner(
+                db,
+                batch_size=settings.cleanup_batch_size,
+                batch_delay_ms=settings.cleanup_batch_delay_ms,
+            )
+            await cleaner.drain()
+            report["cleanup"] = cleaner.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--schedule", action="store_true", help="queue a cleanup job per orphan"
+    )
+    parser.add_argument(
+        "--run", action="store_true", help="queue the jobs and run them here"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.schedule, args.run))
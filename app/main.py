@@ -1,24 +1,83 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import asyncio
 import os
 from datetime import datetime
+from typing import Optional
 from bson import ObjectId
 
 # Import routers
-from app.routers import courses, students, departments, users, attendance
+from app.routers import courses, students, departments, users, attendance, analytics
+from app.services.attendance_batcher import AttendanceBatcher
+from app.services.attendance_cleanup import AttendanceCleaner, cleanup_jobs
+from app.services.attendance_feed import ChangeStreamSource, attendance_feed
+from app.system.admission import AdmissionMiddleware, admission_controller
+from app.system.cache import reference_cache
+from app.system.conditional import response_cache
+from app.system.config import settings
+from app.system.metrics import MetricsMiddleware, register_stats, registry
+from app.system.passwords import password_hasher
+from app.system.database import connect, get_db, ping, prepare
+from app.system.pagination import NEXT_CURSOR_HEADER
 
 load_dotenv()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each worker process opens its own client after it has been forked.
+    # Index creation runs in the background so startup never waits on MongoDB.
+    async with connect() as db:
+        app.state.db = db
+        app.state.indexes_ready = False
+        preparing = asyncio.create_task(prepare(db, app.state))
+
+        if settings.attendance_write_behind:
+            app.state.attendance_batcher = AttendanceBatcher(
+                db,
+                max_batch=settings.attendance_batch_size,
+                max_delay_ms=settings.attendance_batch_delay_ms,
+                max_queue=settings.attendance_queue_size,
+            )
+            app.state.attendance_batcher.start()
+
+        if settings.attendance_feed_source == "change_stream":
+            app.state.attendance_events = ChangeStreamSource(db, attendance_feed)
+            app.state.attendance_events.start()
+
+        if settings.cleanup_worker:
+            app.state.attendance_cleaner = AttendanceCleaner(
+                db,
+                batch_size=settings.cleanup_batch_size,
+                batch_delay_ms=settings.cleanup_batch_delay_ms,
+                busy_requests=settings.cleanup_busy_requests,
+            )
+            app.state.attendance_cleaner.start()
+
+        yield
+
+        # Write out queued marks before the client closes
+        if settings.attendance_write_behind:
+            await app.state.attendance_batcher.close()
+        if settings.attendance_feed_source == "change_stream":
+            await app.state.attendance_events.close()
+        if settings.cleanup_worker:
+            await app.state.attendance_cleaner.close()
+        preparing.cancel()
+
 
 app = FastAPI(
     title="Attendance Management System",
     description="FastAPI + MongoDB",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Innermost, so shed requests still get CORS headers and are counted
+app.add_middleware(AdmissionMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -26,7 +85,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Retry-After"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(departments.router)
@@ -34,7 +95,7 @@ app.include_router(courses.router)
 app.include_router(students.router)
 app.include_router(users.router)
 app.include_router(attendance.router)
-
+app.include_router(analytics.router)
 
 
 @app.get("/")
@@ -43,6 +104,7 @@ async def root():
         "message": "Attendance Management System API",
         "docs": "http://localhost:8000/docs",
         "health": "http://localhost:8000/health",
+        "ready": "http://localhost:8000/ready",
     }
 
 
@@ -51,6 +113,90 @@ async def health():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
 
+@app.get("/ready")
+async def ready(response: Response, db=Depends(get_db)):
+    """Readiness: MongoDB answers a ping and startup indexes exist"""
+    database = await ping(db, settings.readiness_timeout)
+    indexes = getattr(app.state, "indexes_ready", False)
+    if not (database and indexes):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if database and indexes else "not ready",
+        "database": database,
+        "indexes": indexes,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters of this worker's reference and response caches"""
+    return {"reference": reference_cache.stats(), "response": response_cache.stats()}
+
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Slots, queue and rejection counters per route class of this worker"""
+    return admission_controller.stats()
+
+
+@app.get("/cleanup/jobs")
+async def cleanup_job_progress(state: Optional[str] = None, db=Depends(get_db)):
+    """Progress of the background attendance cleanup after deletes"""
+    return {
+        "jobs": await cleanup_jobs(db, state),
+        "worker": (
+            app.state.attendance_cleaner.stats()
+            if hasattr(app.state, "attendance_cleaner")
+            else None
+        ),
+    }
+
+
+@app.get("/hashing/stats")
+async def hashing_stats():
+    """Queue and run time of this worker's password hashing pool"""
+    return {"password": password_hasher.stats()}
+
+
+register_stats(
+    "reference_cache", "Reference-data cache counters", reference_cache.stats
+)
+register_stats("response_cache", "ETag response cache counters", response_cache.stats)
+register_stats(
+    "password_hasher", "Password hashing pool counters", password_hasher.stats
+)
+register_stats(
+    "attendance_feed", "Live attendance feed counters", attendance_feed.stats
+)
+register_stats(
+    "attendance_batcher",
+    "Attendance write-behind queue counters",
+    lambda: (
+        app.state.attendance_batcher.stats()
+        if hasattr(app.state, "attendance_batcher")
+        else None
+    ),
+)
+register_stats(
+    "attendance_cleaner",
+    "Background attendance cleanup counters",
+    lambda: (
+        app.state.attendance_cleaner.stats()
+        if hasattr(app.state, "attendance_cleaner")
+        else None
+    ),
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """This worker's request, MongoDB and component metrics for Prometheus"""
+    return Response(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, create_model
 from typing import Optional, List
 from datetime import datetime
+from functools import lru_cache
 
 
 # Department Models
@@ -99,8 +100,92 @@ class AttendanceResponse(BaseModel):
     student_id: str
     course_id: str
     present: bool
+    day: Optional[str] = None
     submitted_by: Optional[str] = None
     updated_at: Optional[datetime] = None
 
     class Config:
         populate_by_name = True
+
+
+class StudentSummary(BaseModel):
+    id: str = Field(alias="_id")
+    full_name: str
+    class_: str = Field(alias="class")
+
+    class Config:
+        populate_by_name = True
+
+
+class CourseSummary(BaseModel):
+    id: str = Field(alias="_id")
+    course_name: str
+    semester: int
+
+    class Config:
+        populate_by_name = True
+
+
+class AttendanceView(AttendanceResponse):
+    """Attendance record with ``?expand=`` references resolved"""
+
+    student: Optional[StudentSummary] = None
+    course: Optional[CourseSummary] = None
+
+
+class AttendanceBulkEntry(BaseModel):
+    student_id: str
+    present: bool
+
+
+class AttendanceBulkCreate(BaseModel):
+    course_id: str
+    entries: List[AttendanceBulkEntry] = Field(min_length=1, max_length=1000)
+
+
+class AttendanceBulkResult(BaseModel):
+    student_id: str
+    status: str = Field(pattern="^(created|duplicate|unknown_student)$")
+    id: Optional[str] = Field(default=None, alias="_id")
+
+    class Config:
+        populate_by_name = True
+
+
+class AttendanceBulkResponse(BaseModel):
+    course_id: str
+    created: int
+    duplicates: int
+    unknown_students: int
+    results: List[AttendanceBulkResult]
+
+
+# Response serialization helpers
+@lru_cache
+def response_fields(model: type[BaseModel]) -> tuple[str, ...]:
+    """Document keys a response model is built from (its field aliases)"""
+    return tuple(field.alias or name for name, field in model.model_fields.items())
+
+
+@lru_cache
+def response_projection(model: type[BaseModel]) -> dict:
+    """Mongo projection that fetches only the fields of a response model"""
+    return {key: 1 for key in response_fields(model)}
+
+
+class PartialResponse(BaseModel):
+    """Base of response models reduced to a ``?fields=`` selection"""
+
+    class Config:
+        populate_by_name = True
+
+
+@lru_cache
+def partial_model(model: type[BaseModel], keys: tuple[str, ...]) -> type[BaseModel]:
+    """``model`` with only the fields whose document keys are in ``keys``"""
+    fields = {
+        name: (field.annotation, field)
+        for name, field in model.model_fields.items()
+        if (field.alias or name) in keys
+    }
+    return create_model(model.__name__, __base__=PartialResponse, **fields)
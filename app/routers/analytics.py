@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Awaitable, Callable, Optional
+from app.system.database import get_db
+from app.system.dates import DAY_PATTERN
+from app.system.cache import get_reference, get_references
+from app.system.conditional import (
+    current_version,
+    etag_headers,
+    request_etag,
+    response_cache,
+    revalidate,
+)
+from app.services.analytics import (
+    daily_trend,
+    data_version,
+    scope_courses,
+    student_percentages,
+)
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+class Scope:
+    """Courses an analytics query covers: one course, or all courses of a
+    department and/or semester (every course when no filter is given)"""
+
+    def __init__(
+        self,
+        course_id: Optional[str] = None,
+        department_id: Optional[str] = None,
+        semester: Optional[int] = Query(None, ge=1, le=8),
+    ):
+        self.course_id = course_id
+        self.department_id = department_id
+        self.semester = semester
+
+    async def courses(self, db: AsyncIOMotorDatabase) -> list[str]:
+        if self.course_id:
+            if not ObjectId.is_valid(self.course_id):
+                raise HTTPException(status_code=400, detail="Invalid course ID")
+            if not await get_reference(db, "courses", self.course_id):
+                raise HTTPException(status_code=404, detail="Course not found")
+        if self.department_id:
+            if not ObjectId.is_valid(self.department_id):
+                raise HTTPException(status_code=400, detail="Invalid department ID")
+            if not await get_reference(db, "departments", self.department_id):
+                raise HTTPException(status_code=404, detail="Department not found")
+        return await scope_courses(
+            db, self.course_id, self.department_id, self.semester
+        )
+
+
+async def cached_result(
+    request: Request, version: str, compute: Callable[[], Awaitable[dict]]
+) -> Response:
+    """Serve a result by ETag: 304, the cached body, or computed and cached"""
+    tag = request_etag(request, "analytics", version)
+    cached = revalidate(request, tag)
+    if cached:
+        return cached
+
+    response = JSONResponse(await compute(), headers=etag_headers(tag))
+    response_cache.put(tag, response)
+    return response
+
+
+@router.get("/daily")
+async def get_daily_trend(
+    request: Request,
+    scope: Scope = Depends(),
+    from_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    to_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    by_course: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Attendance per day across the scope, optionally per course"""
+
+    courses = await scope.courses(db)
+    return await cached_result(
+        request,
+        await data_version(db, courses),
+        lambda: daily_trend(db, courses, from_day, to_day, by_course),
+    )
+
+
+@router.get("/students")
+async def get_student_percentages(
+    request: Request,
+    scope: Scope = Depends(),
+    below: Optional[float] = Query(
+        None, ge=0, le=100, description="Only students under this percentage"
+    ),
+    min_records: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=10000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Attendance percentage per student across the scope, lowest first"""
+
+    courses = await scope.courses(db)
+
+    async def compute() -> dict:
+        result = await student_percentages(db, courses, below, min_records, limit)
+        names = await get_references(
+            db, "students", (s["student_id"] for s in result["students"])
+        )
+        for s in result["students"]:
+            student = names.get(s["student_id"]) or {}
+            s["full_name"] = student.get("full_name")
+            s["class"] = student.get("class")
+        return result
+
+    # Names come from students, so renames invalidate the cached result too
+    version = await data_version(db, courses)
+    students_version = await current_version(db, "students")
+    return await cached_result(request, f"{version}.{students_version}", compute)
@@ -1,138 +1,537 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
-from app.models import AttendanceCreate, AttendanceResponse
-from app.system.database import db
+from typing import Optional
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app.models import (
+    AttendanceCreate,
+    AttendanceResponse,
+    AttendanceBulkCreate,
+    AttendanceBulkResponse,
+    AttendanceView,
+    CourseSummary,
+    StudentSummary,
+    response_fields,
+)
+from app.system.config import settings
+from app.system.database import get_db, DUPLICATE_KEY_ERROR
+from app.system.dates import DAY_PATTERN, day_bucket, day_match, day_range
+from app.system.fieldsets import select_fields, split_fields
+from app.system.pagination import PageParams
+from app.system.serialization import list_response
+from app.system.cache import get_reference, get_references
+from app.services import rollups
+from app.services.rollups import attendance_summary, record_rollups
+from app.services.attendance_export import ENCODERS, accepts_gzip, stream_export
+from app.services.attendance_feed import (
+    DELETED,
+    MARKED,
+    UPDATED,
+    attendance_feed,
+    stream_events,
+)
+from app.services.attendance_archive import history_page, history_student_counts
+from app.services.attendance_store import attendance_store
+from app.services.attendance_batcher import (
+    AttendanceBatcher,
+    AttendanceQueueFull,
+    get_attendance_batcher,
+)
 import time
 
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
+# ?expand= name -> (collection, attendance field, summary model)
+EXPANSIONS = {
+    "student": ("students", "student_id", StudentSummary),
+    "course": ("courses", "course_id", CourseSummary),
+}
+EXPAND_PATTERN = "^(student|course)(,(student|course))*$"
+
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated fields to return (default all stored fields): "
+    + ", ".join(response_fields(AttendanceView))
+    + "; student and course imply expanding them"
+)
+
+
+def view_fields(
+    fields: Optional[str], expand: Optional[str]
+) -> tuple[type[BaseModel], dict, list[str]]:
+    """Response model, record projection and references to expand for
+    ``?fields=`` and ``?expand=``.
+
+    ``student``/``course`` keys are only returned when expanded, either by
+    ``expand`` or by selecting them in ``fields``.
+    """
+    keys = split_fields(fields) if fields else list(response_fields(AttendanceResponse))
+    names = expand.split(",") if expand else []
+    names = list(dict.fromkeys([*names, *(key for key in keys if key in EXPANSIONS)]))
+    model = select_fields(AttendanceView, [*keys, *names])
+    stored = response_fields(AttendanceResponse)
+    projected = [key for key in response_fields(model) if key in stored]
+    projected += [EXPANSIONS[name][1] for name in names]
+    return model, {key: 1 for key in projected}, names
+
+
+async def expand_records(
+    db: AsyncIOMotorDatabase, records: list[dict], names: list[str]
+) -> list[dict]:
+    """Attach student/course summaries to a page of attendance records.
+
+    Each expansion is one batched lookup through the reference cache, so a
+    page costs at most one query per collection instead of one per row.
+    """
+    for name in names:
+        collection, field, model = EXPANSIONS[name]
+        docs = await get_references(db, collection, (r[field] for r in records))
+        fields = response_fields(model)
+        summaries = {
+            key: {**{f: doc.get(f) for f in fields}, "_id": key}
+            for key, doc in docs.items()
+            if doc
+        }
+        for record in records:
+            record[name] = summaries.get(record[field])
+    return records
+
 
 @router.post("", response_model=AttendanceResponse, status_code=status.HTTP_201_CREATED)
-async def mark_attendance(attendance: AttendanceCreate):
+async def mark_attendance(
+    attendance: AttendanceCreate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    batcher: Optional[AttendanceBatcher] = Depends(get_attendance_batcher),
+):
     """Mark attendance for a student in a course"""
 
     # Verify student exists
-    student = await db.students.find_one({"_id": ObjectId(attendance.student_id)})
+    student = await get_reference(db, "students", attendance.student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
     # Verify course exists
-    course = await db.courses.find_one({"_id": ObjectId(attendance.course_id)})
+    course = await get_reference(db, "courses", attendance.course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    # Check if attendance already marked today
-    today = int(time.time())
-    existing = await db.attendance_log.find_one(
-        {
-            "student_id": attendance.student_id,
-            "course_id": attendance.course_id,
-            "date": today,
-        }
-    )
-
-    if existing:
-        raise HTTPException(
-            status_code=400, detail="Attendance already marked for this student today"
-        )
-
     attendance_doc = {
         "student_id": attendance.student_id,
         "course_id": attendance.course_id,
         "present": attendance.present,
-        "date": today,
+        "date": int(time.time()),
+        "day": day_bucket(),
         "submitted_by": "system",
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.attendance_log.insert_one(attendance_doc)
-    created = await db.attendance_log.find_one({"_id": result.inserted_id})
+    # The (student_id, course_id, day) unique index rejects a second mark
+    try:
+        if batcher:
+            created = await batcher.submit(attendance_doc)
+        else:
+            created = await attendance_store(db).insert(attendance_doc)
+            await record_rollups(db, added=[created])
+            attendance_feed.record(MARKED, created)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400, detail="Attendance already marked for this student today"
+        )
+    except AttendanceQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many attendance marks in flight, retry shortly",
+            headers={"Retry-After": "1"},
+        )
 
     return {**created, "_id": str(created["_id"])}
 
 
-@router.get("/student/{student_id}", response_model=list[AttendanceResponse])
-async def get_student_attendance(student_id: str):
-    """Get all attendance records for a student"""
+# Rows that were not created have no _id; leave the key out rather than null
+@router.post(
+    "/bulk", response_model=AttendanceBulkResponse, response_model_exclude_none=True
+)
+async def bulk_mark_attendance(
+    roll_call: AttendanceBulkCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Mark attendance for a whole class in a course in one request"""
+
+    if not ObjectId.is_valid(roll_call.course_id):
+        raise HTTPException(status_code=400, detail="Invalid course ID")
+
+    # Verify course exists
+    course = await get_reference(db, "courses", roll_call.course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    # Verify all students in a single query
+    requested = {
+        e.student_id for e in roll_call.entries if ObjectId.is_valid(e.student_id)
+    }
+    known = {
+        str(s["_id"])
+        async for s in db.students.find(
+            {"_id": {"$in": [ObjectId(sid) for sid in requested]}}, {"_id": 1}
+        )
+    }
+
+    now = datetime.utcnow()
+    timestamp = int(time.time())
+    today = day_bucket()
+    results = []
+    documents = []
+    for entry in roll_call.entries:
+        if entry.student_id not in known:
+            results.append(
+                {"student_id": entry.student_id, "status": "unknown_student"}
+            )
+            continue
+
+        attendance_doc = {
+            "_id": ObjectId(),
+            "student_id": entry.student_id,
+            "course_id": roll_call.course_id,
+            "present": entry.present,
+            "date": timestamp,
+            "day": today,
+            "submitted_by": "system",
+            "updated_at": now,
+        }
+        documents.append(attendance_doc)
+        results.append(
+            {
+                "student_id": entry.student_id,
+                "status": "created",
+                "_id": str(attendance_doc["_id"]),
+            }
+        )
+
+    # Duplicates (already marked today, or repeated in this request) are
+    # rejected by the unique day index; everything else is still written.
+    if documents:
+        created_results = [r for r in results if r["status"] == "created"]
+        written = list(documents)
+        errors = await attendance_store(db).insert_many(documents)
+        for index, error in errors.items():
+            if error["code"] != DUPLICATE_KEY_ERROR:
+                raise OperationFailure(error["errmsg"], error["code"], error)
+            rejected = created_results[index]
+            rejected["status"] = "duplicate"
+            rejected.pop("_id")
+            written[index] = None
+
+        written = [doc for doc in written if doc]
+        await record_rollups(db, added=written)
+        for doc in written:
+            attendance_feed.record(MARKED, doc)
+
+    return {
+        "course_id": roll_call.course_id,
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+        "unknown_students": sum(1 for r in results if r["status"] == "unknown_student"),
+        "results": results,
+    }
+
+
+@router.get("/export")
+async def export_attendance(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    course_id: Optional[str] = None,
+    student_id: Optional[str] = None,
+    department_id: Optional[str] = None,
+    from_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    to_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Stream attendance records as NDJSON or CSV"""
+
+    query = {}
+    if student_id:
+        query["student_id"] = student_id
+    if course_id:
+        query["course_id"] = course_id
+    if department_id:
+        department_courses = [
+            str(c["_id"])
+            async for c in db.courses.find({"department_id": department_id}, {"_id": 1})
+        ]
+        if course_id and course_id not in department_courses:
+            department_courses = []
+        query["course_id"] = {"$in": department_courses}
+    days = day_range(from_day, to_day)
+    if days:
+        query["day"] = days
+
+    compress = accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {
+        "Content-Disposition": f'attachment; filename="attendance.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        stream_export(db, query, format, compress),
+        media_type=ENCODERS[format][1],
+        headers=headers,
+    )
+
+
+@router.get("/student/{student_id}", response_model=list[AttendanceView])
+async def get_student_attendance(
+    student_id: str,
+    response: Response,
+    from_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    to_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    expand: Optional[str] = Query(
+        None,
+        pattern=EXPAND_PATTERN,
+        description="Comma-separated references to resolve: student, course",
+    ),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Get attendance records for a student, one page at a time"""
 
     if not ObjectId.is_valid(student_id):
         raise HTTPException(status_code=400, detail="Invalid student ID")
 
     # Verify student exists
-    student = await db.students.find_one({"_id": ObjectId(student_id)})
+    student = await get_reference(db, "students", student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    records = await db.attendance_log.find({"student_id": student_id}).to_list(None)
-    return [{**r, "_id": str(r["_id"])} for r in records]
+    query = {"student_id": student_id}
+    days = day_range(from_day, to_day)
+    if days:
+        query["day"] = days
+
+    model, projection, names = view_fields(fields, expand)
+    records = await history_page(db, query, page, response, projection)
+    records = await expand_records(db, records, names)
+    return list_response(records, model, response)
+
+
+@router.get("/course/{course_id}", response_model=list[AttendanceView])
+async def get_course_attendance(
+    course_id: str,
+    response: Response,
+    from_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    to_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    expand: Optional[str] = Query(
+        None,
+        pattern=EXPAND_PATTERN,
+        description="Comma-separated references to resolve: student, course",
+    ),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Get attendance records for a course, one page at a time"""
+
+    if not ObjectId.is_valid(course_id):
+        raise HTTPException(status_code=400, detail="Invalid course ID")
+
+    # Verify course exists
+    course = await get_reference(db, "courses", course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    query = {"course_id": course_id}
+    days = day_range(from_day, to_day)
+    if days:
+        query["day"] = days
 
+    model, projection, names = view_fields(fields, expand)
+    records = await history_page(db, query, page, response, projection)
+    records = await expand_records(db, records, names)
+    return list_response(records, model, response)
 
-@router.get("/course/{course_id}", response_model=list[AttendanceResponse])
-async def get_course_attendance(course_id: str):
-    """Get all attendance records for a course"""
+
+@router.get("/course/{course_id}/events")
+async def stream_course_events(
+    course_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Server-sent events for a course: marked, updated, deleted and counters"""
+
+    if settings.attendance_feed_source == "off":
+        raise HTTPException(status_code=404, detail="Attendance feed is disabled")
 
     if not ObjectId.is_valid(course_id):
         raise HTTPException(status_code=400, detail="Invalid course ID")
 
-    # Verify course exists
-    course = await db.courses.find_one({"_id": ObjectId(course_id)})
+    course = await get_reference(db, "courses", course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    records = await db.attendance_log.find({"course_id": course_id}).to_list(None)
-    return [{**r, "_id": str(r["_id"])} for r in records]
+    if attendance_feed.full():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many attendance feed subscribers, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+
+    return StreamingResponse(
+        stream_events(db, course_id, settings.attendance_feed_heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def aggregate_stats(
+    db: AsyncIOMotorDatabase,
+    course_id: str,
+    from_day: Optional[str],
+    to_day: Optional[str],
+) -> list[dict]:
+    """Per-student counts for a course computed from the attendance records"""
+    days = day_range(from_day, to_day)
+    return await history_student_counts(db, course_id, days)
 
 
 @router.get("/stats/{course_id}")
-async def get_attendance_stats(course_id: str):
+async def get_attendance_stats(
+    course_id: str,
+    from_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    to_day: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    by_student: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
     """Get attendance statistics for a course"""
 
     if not ObjectId.is_valid(course_id):
         raise HTTPException(status_code=400, detail="Invalid course ID")
 
-    course = await db.courses.find_one({"_id": ObjectId(course_id)})
+    course = await get_reference(db, "courses", course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    # Get all attendance records
-    records = await db.attendance_log.find({"course_id": course_id}).to_list(None)
+    # Served from attendance_rollups; only a per-student breakdown over a
+    # date range has to be counted from the attendance records.
+    students = None
+    if by_student and (from_day or to_day):
+        students = await aggregate_stats(db, course_id, from_day, to_day)
+    elif by_student:
+        students = (
+            await db.attendance_rollups.find(
+                {"course_id": course_id, "kind": rollups.STUDENT, "total": {"$gt": 0}}
+            )
+            .sort("student_id", 1)
+            .to_list(None)
+        )
 
-    if not records:
-        return {
-            "course_id": course_id,
-            "total_records": 0,
-            "present": 0,
-            "absent": 0,
-            "attendance_percentage": 0,
-        }
+    if students is not None:
+        total = sum(s["total"] for s in students)
+        present = sum(s["present"] for s in students)
+    elif from_day or to_day:
+        query = {"course_id": course_id, "kind": rollups.DAY}
+        days = await db.attendance_rollups.find(
+            day_match(query, day_range(from_day, to_day))
+        ).to_list(None)
+        total = sum(d["total"] for d in days)
+        present = sum(d["present"] for d in days)
+    else:
+        rollup = await rollups.get_rollup(db, rollups.COURSE, course_id)
+        total, present = rollup["total"], rollup["present"]
+
+    stats = {"course_id": course_id, **attendance_summary(total, present)}
+    if students is not None:
+        stats["students"] = [
+            {
+                "student_id": s["student_id"],
+                **attendance_summary(s["total"], s["present"]),
+            }
+            for s in students
+        ]
+    return stats
+
+
+@router.get("/stats/{course_id}/student/{student_id}")
+async def get_student_course_stats(
+    course_id: str, student_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get attendance statistics for a student in a course"""
 
-    present_count = sum(1 for r in records if r["present"])
-    absent_count = len(records) - present_count
-    attendance_percentage = (present_count / len(records)) * 100 if records else 0
+    if not ObjectId.is_valid(course_id):
+        raise HTTPException(status_code=400, detail="Invalid course ID")
+    if not ObjectId.is_valid(student_id):
+        raise HTTPException(status_code=400, detail="Invalid student ID")
 
+    course = await get_reference(db, "courses", course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    student = await get_reference(db, "students", student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    rollup = await rollups.get_rollup(db, rollups.STUDENT, course_id, student_id)
     return {
         "course_id": course_id,
-        "total_records": len(records),
-        "present": present_count,
-        "absent": absent_count,
-        "attendance_percentage": round(attendance_percentage, 2),
+        "student_id": student_id,
+        **attendance_summary(rollup["total"], rollup["present"]),
+    }
+
+
+@router.get("/stats/student/{student_id}")
+async def get_student_stats(
+    student_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get attendance statistics for a student across all courses"""
+
+    if not ObjectId.is_valid(student_id):
+        raise HTTPException(status_code=400, detail="Invalid student ID")
+
+    student = await get_reference(db, "students", student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    courses = (
+        await db.attendance_rollups.find(
+            {"student_id": student_id, "kind": rollups.STUDENT, "total": {"$gt": 0}}
+        )
+        .sort("course_id", 1)
+        .to_list(None)
+    )
+
+    total = sum(c["total"] for c in courses)
+    present = sum(c["present"] for c in courses)
+    return {
+        "student_id": student_id,
+        **attendance_summary(total, present),
+        "courses": [
+            {
+                "course_id": c["course_id"],
+                **attendance_summary(c["total"], c["present"]),
+            }
+            for c in courses
+        ],
     }
 
 
 @router.put("/{attendance_id}", response_model=AttendanceResponse)
-async def update_attendance(attendance_id: str, attendance: AttendanceCreate):
+async def update_attendance(
+    attendance_id: str,
+    attendance: AttendanceCreate,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
     """Update attendance record"""
 
     if not ObjectId.is_valid(attendance_id):
         raise HTTPException(status_code=400, detail="Invalid attendance ID")
 
     # Verify student and course exist
-    student = await db.students.find_one({"_id": ObjectId(attendance.student_id)})
+    student = await get_reference(db, "students", attendance.student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    course = await db.courses.find_one({"_id": ObjectId(attendance.course_id)})
+    course = await get_reference(db, "courses", attendance.course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
@@ -143,25 +542,38 @@ async def update_attendance(attendance_id: str, attendance: AttendanceCreate):
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.attendance_log.update_one(
-        {"_id": ObjectId(attendance_id)}, {"$set": update_data}
-    )
+    try:
+        previous = await attendance_store(db).update(
+            ObjectId(attendance_id), update_data
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="Attendance already marked for this student on that day",
+        )
 
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Attendance record not found")
 
-    updated = await db.attendance_log.find_one({"_id": ObjectId(attendance_id)})
+    updated = {**previous, **update_data}
+    await record_rollups(db, removed=[previous], added=[updated])
+    attendance_feed.record(UPDATED, updated, previous)
     return {**updated, "_id": str(updated["_id"])}
 
 
 @router.delete("/{attendance_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_attendance(attendance_id: str):
+async def delete_attendance(
+    attendance_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     """Delete attendance record"""
 
     if not ObjectId.is_valid(attendance_id):
         raise HTTPException(status_code=400, detail="Invalid attendance ID")
 
-    result = await db.attendance_log.delete_one({"_id": ObjectId(attendance_id)})
+    deleted = await attendance_store(db).delete(ObjectId(attendance_id))
 
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Attendance record not found")
+
+    await record_rollups(db, removed=[deleted])
+    attendance_feed.record(DELETED, deleted)
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query, Request
 from bson import ObjectId
+from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
-from app.models import CourseCreate, CourseResponse
-from app.system.database import db
+from typing import Optional
+from app.models import CourseCreate, CourseResponse, response_projection
+from app.system.database import get_db
+from app.services.attendance_cleanup import schedule_cleanup
+from app.services.csv_import import (
+    CSV_REQUEST_BODY,
+    IMPORT_BATCH_SIZE,
+    import_response,
+)
+from app.system.conditional import Conditional, bump_version, conditional
+from app.system.pagination import PageParams, paginate
+from app.system.fieldsets import sparse_fields
+from app.system.serialization import item_response, list_response
+from app.system.repository import insert_document, update_document
+from app.system.cache import get_reference, invalidate_reference
 
 router = APIRouter(prefix="/api/courses", tags=["courses"])
 
 
 @router.post("", response_model=CourseResponse, status_code=status.HTTP_201_CREATED)
-async def create_course(course: CourseCreate):
+async def create_course(
+    course: CourseCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     # Verify department exists
-    dept = await db.departments.find_one({"_id": ObjectId(course.department_id)})
+    dept = await get_reference(db, "departments", course.department_id)
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
 
@@ -24,35 +41,87 @@ async def create_course(course: CourseCreate):
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.courses.insert_one(course_doc)
-    created = await db.courses.find_one({"_id": result.inserted_id})
+    created = await insert_document(db.courses, course_doc)
+    await bump_version(db, "courses")
     return {**created, "_id": str(created["_id"])}
 
 
+@router.post("/import", openapi_extra=CSV_REQUEST_BODY)
+async def import_courses(
+    request: Request,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Create courses from a CSV body.
+
+    Columns: course_name, department_id, semester, class, lecture_hours;
+    department_id may also be a department name.
+
+    Streams an NDJSON report: one line per rejected row, then a summary.
+    """
+    return await import_response(request, db, "courses", batch_size)
+
+
 @router.get("", response_model=list[CourseResponse])
-async def get_all_courses():
-    courses = await db.courses.find().to_list(None)
-    return [{**c, "_id": str(c["_id"])} for c in courses]
+async def get_all_courses(
+    response: Response,
+    department_id: Optional[str] = None,
+    semester: Optional[int] = None,
+    page: PageParams = Depends(),
+    fields: type[BaseModel] = Depends(sparse_fields(CourseResponse)),
+    cache: Conditional = Depends(conditional("courses")),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
+    query = {}
+    if department_id:
+        query["department_id"] = department_id
+    if semester is not None:
+        query["semester"] = semester
+
+    courses = await paginate(
+        db.courses,
+        query,
+        page,
+        response,
+        projection=response_projection(fields),
+    )
+    return cache.store(list_response(courses, fields, response))
 
 
 @router.get("/{course_id}", response_model=CourseResponse)
-async def get_course(course_id: str):
+async def get_course(
+    course_id: str,
+    response: Response,
+    fields: type[BaseModel] = Depends(sparse_fields(CourseResponse)),
+    cache: Conditional = Depends(conditional("courses", bodies=False)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
     if not ObjectId.is_valid(course_id):
         raise HTTPException(status_code=400, detail="Invalid course ID")
 
-    course = await db.courses.find_one({"_id": ObjectId(course_id)})
+    course = await db.courses.find_one(
+        {"_id": ObjectId(course_id)}, response_projection(fields)
+    )
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
-    return {**course, "_id": str(course["_id"])}
+    return item_response(course, fields, response)
 
 
 @router.put("/{course_id}", response_model=CourseResponse)
-async def update_course(course_id: str, course: CourseCreate):
+async def update_course(
+    course_id: str, course: CourseCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     if not ObjectId.is_valid(course_id):
         raise HTTPException(status_code=400, detail="Invalid course ID")
 
-    dept = await db.departments.find_one({"_id": ObjectId(course.department_id)})
+    dept = await get_reference(db, "departments", course.department_id)
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
 
@@ -65,23 +134,26 @@ async def update_course(course_id: str, course: CourseCreate):
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.courses.update_one(
-        {"_id": ObjectId(course_id)}, {"$set": update_data}
-    )
-
-    if result.matched_count == 0:
+    updated = await update_document(db.courses, course_id, update_data)
+    invalidate_reference("courses", course_id)
+    if updated is None:
         raise HTTPException(status_code=404, detail="Course not found")
+    await bump_version(db, "courses")
 
-    updated = await db.courses.find_one({"_id": ObjectId(course_id)})
     return {**updated, "_id": str(updated["_id"])}
 
 
 @router.delete("/{course_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_course(course_id: str):
+async def delete_course(course_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     if not ObjectId.is_valid(course_id):
         raise HTTPException(status_code=400, detail="Invalid course ID")
 
     result = await db.courses.delete_one({"_id": ObjectId(course_id)})
+    invalidate_reference("courses", course_id)
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Course not found")
+    await bump_version(db, "courses")
+
+    # Its attendance is removed in the background
+    await schedule_cleanup(db, "course", course_id)
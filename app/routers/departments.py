@@ -1,49 +1,100 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Response, status, Depends, Query, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from pydantic import BaseModel
 from datetime import datetime
-from app.models import DepartmentCreate, DepartmentResponse
-from app.system.database import db
+from app.models import DepartmentCreate, DepartmentResponse, response_projection
+from app.system.database import get_db
+from app.services.csv_import import (
+    CSV_REQUEST_BODY,
+    IMPORT_BATCH_SIZE,
+    import_response,
+)
+from app.system.conditional import Conditional, bump_version, conditional
+from app.system.pagination import PageParams, paginate
+from app.system.fieldsets import sparse_fields
+from app.system.serialization import item_response, list_response
+from app.system.repository import insert_document, update_document
+from app.system.cache import invalidate_reference
 
 router = APIRouter(prefix="/api/departments", tags=["departments"])
 
 
-def get_db() -> AsyncIOMotorDatabase:
-    return db
-
-
 @router.post("", response_model=DepartmentResponse, status_code=status.HTTP_201_CREATED)
-async def create_department(dept: DepartmentCreate):
+async def create_department(
+    dept: DepartmentCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     department = {
         "department_name": dept.department_name,
         "submitted_by": "system",
         "updated_at": datetime.utcnow(),
     }
-    result = await db.departments.insert_one(department)
-    created_dept = await db.departments.find_one({"_id": result.inserted_id})
+    created_dept = await insert_document(db.departments, department)
+    await bump_version(db, "departments")
     return {**created_dept, "_id": str(created_dept["_id"])}
 
 
+@router.post("/import", openapi_extra=CSV_REQUEST_BODY)
+async def import_departments(
+    request: Request,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Create departments from a CSV body with columns department_name.
+
+    Streams an NDJSON report: one line per rejected row, then a summary.
+    """
+    return await import_response(request, db, "departments", batch_size)
+
+
 @router.get("", response_model=list[DepartmentResponse])
-async def get_all_departments():
-    departments = await db.departments.find().to_list(None)
-    return [{**d, "_id": str(d["_id"])} for d in departments]
+async def get_all_departments(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: type[BaseModel] = Depends(sparse_fields(DepartmentResponse)),
+    cache: Conditional = Depends(conditional("departments")),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
+    departments = await paginate(
+        db.departments,
+        {},
+        page,
+        response,
+        projection=response_projection(fields),
+    )
+    return cache.store(list_response(departments, fields, response))
 
 
 @router.get("/{dept_id}", response_model=DepartmentResponse)
-async def get_department(dept_id: str):
+async def get_department(
+    dept_id: str,
+    response: Response,
+    fields: type[BaseModel] = Depends(sparse_fields(DepartmentResponse)),
+    cache: Conditional = Depends(conditional("departments", bodies=False)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
     if not ObjectId.is_valid(dept_id):
         raise HTTPException(status_code=400, detail="Invalid department ID")
 
-    dept = await db.departments.find_one({"_id": ObjectId(dept_id)})
+    dept = await db.departments.find_one(
+        {"_id": ObjectId(dept_id)}, response_projection(fields)
+    )
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
 
-    return {**dept, "_id": str(dept["_id"])}
+    return item_response(dept, fields, response)
 
 
 @router.put("/{dept_id}", response_model=DepartmentResponse)
-async def update_department(dept_id: str, dept: DepartmentCreate):
+async def update_department(
+    dept_id: str, dept: DepartmentCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     if not ObjectId.is_valid(dept_id):
         raise HTTPException(status_code=400, detail="Invalid department ID")
 
@@ -52,25 +103,25 @@ async def update_department(dept_id: str, dept: DepartmentCreate):
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.departments.update_one(
-        {"_id": ObjectId(dept_id)}, {"$set": update_data}
-    )
-
-    if result.matched_count == 0:
+    updated_dept = await update_document(db.departments, dept_id, update_data)
+    invalidate_reference("departments", dept_id)
+    if updated_dept is None:
         raise HTTPException(status_code=404, detail="Department not found")
+    await bump_version(db, "departments")
 
-    updated_dept = await db.departments.find_one({"_id": ObjectId(dept_id)})
     return {**updated_dept, "_id": str(updated_dept["_id"])}
 
 
 @router.delete("/{dept_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_department(dept_id: str):
+async def delete_department(dept_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     if not ObjectId.is_valid(dept_id):
         raise HTTPException(status_code=400, detail="Invalid department ID")
 
     result = await db.departments.delete_one({"_id": ObjectId(dept_id)})
+    invalidate_reference("departments", dept_id)
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Department not found")
+    await bump_version(db, "departments")
 
     return None
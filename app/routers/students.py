@@ -1,83 +1,214 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, Request
 from bson import ObjectId
+from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
-from app.models import StudentCreate, StudentResponse
-from app.system.database import db
+from typing import Optional
+from app.models import StudentCreate, StudentResponse, response_projection
+from app.system.database import get_db
+from app.services.attendance_cleanup import schedule_cleanup
+from app.services.csv_import import (
+    CSV_REQUEST_BODY,
+    IMPORT_BATCH_SIZE,
+    import_response,
+)
+from app.system.conditional import Conditional, bump_version, conditional
+from app.system.pagination import MAX_PAGE_SIZE, PageParams, paginate
+from app.system.search import (
+    DEFAULT_SEARCH_LIMIT,
+    MAX_SEARCH_LIMIT,
+    normalize,
+    prefix_range,
+)
+from app.system.fieldsets import sparse_fields
+from app.system.serialization import item_response, list_response
+from app.system.repository import insert_document, update_document
+from app.system.cache import get_reference, invalidate_reference
 
 router = APIRouter(prefix="/api/students", tags=["students"])
 
 
 @router.post("", response_model=StudentResponse, status_code=status.HTTP_201_CREATED)
-async def create_student(student: StudentCreate):
+async def create_student(
+    student: StudentCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     # Verify department exists
-    dept = await db.departments.find_one({"_id": ObjectId(student.department_id)})
+    dept = await get_reference(db, "departments", student.department_id)
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
 
     student_doc = {
         "full_name": student.full_name,
+        "search_name": normalize(student.full_name),
         "department_id": student.department_id,
         "class": student.class_,
         "submitted_by": "system",
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.students.insert_one(student_doc)
-    created = await db.students.find_one({"_id": result.inserted_id})
+    created = await insert_document(db.students, student_doc)
+    await bump_version(db, "students")
     return {**created, "_id": str(created["_id"])}
 
 
+@router.post("/import", openapi_extra=CSV_REQUEST_BODY)
+async def import_students(
+    request: Request,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Create students from a CSV body.
+
+    Columns: full_name, department_id, class; department_id may also be a
+    department name.
+
+    Streams an NDJSON report: one line per rejected row, then a summary.
+    """
+    return await import_response(request, db, "students", batch_size)
+
+
 @router.get("", response_model=list[StudentResponse])
-async def get_all_students():
-    students = await db.students.find().to_list(None)
-    return [{**s, "_id": str(s["_id"])} for s in students]
+async def get_all_students(
+    response: Response,
+    department_id: Optional[str] = None,
+    class_: Optional[str] = Query(None, alias="class"),
+    ids: Optional[str] = Query(
+        None,
+        description=f"Comma-separated student IDs (at most {MAX_PAGE_SIZE}); "
+        "returns the ones that exist in one response, without paging",
+    ),
+    page: PageParams = Depends(),
+    fields: type[BaseModel] = Depends(sparse_fields(StudentResponse)),
+    cache: Conditional = Depends(conditional("students")),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
+    query = {}
+    if department_id:
+        query["department_id"] = department_id
+    if class_:
+        query["class"] = class_
+
+    if ids is not None:
+        requested = list(dict.fromkeys(i for i in ids.split(",") if i))
+        if len(requested) > MAX_PAGE_SIZE:
+            raise HTTPException(
+                status_code=400, detail=f"At most {MAX_PAGE_SIZE} IDs per request"
+            )
+        if not all(ObjectId.is_valid(i) for i in requested):
+            raise HTTPException(status_code=400, detail="Invalid student ID")
+        query["_id"] = {"$in": [ObjectId(i) for i in requested]}
+        students = (
+            await db.students.find(query, response_projection(fields))
+            .sort("_id", 1)
+            .to_list(None)
+        )
+        return cache.store(list_response(students, fields, response))
+
+    students = await paginate(
+        db.students,
+        query,
+        page,
+        response,
+        projection=response_projection(fields),
+    )
+    return cache.store(list_response(students, fields, response))
+
+
+@router.get("/search", response_model=list[StudentResponse])
+async def search_students(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    department_id: Optional[str] = None,
+    class_: Optional[str] = Query(None, alias="class"),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    fields: type[BaseModel] = Depends(sparse_fields(StudentResponse)),
+    cache: Conditional = Depends(conditional("students")),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Students whose full name starts with ``q`` (ignoring case and accents)"""
+    if cache.cached:
+        return cache.cached
+
+    query = {"search_name": prefix_range(q)}
+    if department_id:
+        query["department_id"] = department_id
+    if class_:
+        query["class"] = class_
+
+    students = (
+        await db.students.find(query, response_projection(fields))
+        .sort("search_name", 1)
+        .limit(limit)
+        .to_list(limit)
+    )
+    return cache.store(list_response(students, fields, response))
 
 
 @router.get("/{student_id}", response_model=StudentResponse)
-async def get_student(student_id: str):
+async def get_student(
+    student_id: str,
+    response: Response,
+    fields: type[BaseModel] = Depends(sparse_fields(StudentResponse)),
+    cache: Conditional = Depends(conditional("students", bodies=False)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if cache.cached:
+        return cache.cached
+
     if not ObjectId.is_valid(student_id):
         raise HTTPException(status_code=400, detail="Invalid student ID")
 
-    student = await db.students.find_one({"_id": ObjectId(student_id)})
+    student = await db.students.find_one(
+        {"_id": ObjectId(student_id)}, response_projection(fields)
+    )
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    return {**student, "_id": str(student["_id"])}
+    return item_response(student, fields, response)
 
 
 @router.put("/{student_id}", response_model=StudentResponse)
-async def update_student(student_id: str, student: StudentCreate):
+async def update_student(
+    student_id: str, student: StudentCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     if not ObjectId.is_valid(student_id):
         raise HTTPException(status_code=400, detail="Invalid student ID")
 
-    dept = await db.departments.find_one({"_id": ObjectId(student.department_id)})
+    dept = await get_reference(db, "departments", student.department_id)
     if not dept:
         raise HTTPException(status_code=404, detail="Department not found")
 
     update_data = {
         "full_name": student.full_name,
+        "search_name": normalize(student.full_name),
         "department_id": student.department_id,
         "class": student.class_,
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.students.update_one(
-        {"_id": ObjectId(student_id)}, {"$set": update_data}
-    )
-
-    if result.matched_count == 0:
+    updated = await update_document(db.students, student_id, update_data)
+    invalidate_reference("students", student_id)
+    if updated is None:
         raise HTTPException(status_code=404, detail="Student not found")
+    await bump_version(db, "students")
 
-    updated = await db.students.find_one({"_id": ObjectId(student_id)})
     return {**updated, "_id": str(updated["_id"])}
 
 
 @router.delete("/{student_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_student(student_id: str):
+async def delete_student(student_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     if not ObjectId.is_valid(student_id):
         raise HTTPException(status_code=400, detail="Invalid student ID")
 
     result = await db.students.delete_one({"_id": ObjectId(student_id)})
+    invalidate_reference("students", student_id)
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Student not found")
+    await bump_version(db, "students")
+
+    # Its attendance is removed in the background
+    await schedule_cleanup(db, "student", student_id)
@@ -1,22 +1,57 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from bson import ObjectId
+from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
-from app.models import UserCreate, UserResponse
-from app.system.database import db
-import hashlib
+from typing import Optional
+from app.models import UserCreate, UserLogin, UserResponse, response_projection
+from app.system.database import get_db
+from app.system.pagination import PageParams, paginate
+from app.system.search import (
+    DEFAULT_SEARCH_LIMIT,
+    MAX_SEARCH_LIMIT,
+    normalize,
+    prefix_range,
+)
+from app.system.fieldsets import sparse_fields
+from app.system.serialization import item_response, list_response
+from app.system.repository import insert_document, update_document
+from app.system.passwords import (
+    DUMMY_HASH,
+    PasswordHasherBusy,
+    is_legacy_hash,
+    password_hasher,
+)
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 
-def hash_password(password: str) -> str:
-    """Simple password hashing (use bcrypt in production)"""
-    return hashlib.sha256(password.encode()).hexdigest()
+HASHER_BUSY = HTTPException(
+    status_code=503,
+    detail="Too many password operations in flight, retry shortly",
+    headers={"Retry-After": "1"},
+)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password with scrypt on the hashing thread pool"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HASHER_BUSY
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    try:
+        return await password_hasher.verify(password, stored)
+    except PasswordHasherBusy:
+        raise HASHER_BUSY
 
 
 @router.post(
     "/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED
 )
-async def create_user(user: UserCreate):
+async def create_user(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
     # Check if username exists
     existing = await db.users.find_one({"username": user.username})
     if existing:
@@ -30,46 +65,104 @@ async def create_user(user: UserCreate):
     user_doc = {
         "full_name": user.full_name,
         "username": user.username,
+        "search_username": normalize(user.username),
         "email": user.email,
-        "password": hash_password(user.password),
+        "password": await hash_password(user.password),
         "type": user.type,
         "submitted_by": "system",
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.users.insert_one(user_doc)
-    created = await db.users.find_one({"_id": result.inserted_id})
+    created = await insert_document(db.users, user_doc)
 
     # Don't return password in response
     created.pop("password", None)
     return {**created, "_id": str(created["_id"])}
 
 
+@router.post("/login", response_model=UserResponse)
+async def login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
+    user = await db.users.find_one({"username": credentials.username})
+
+    # Unknown usernames still pay for a verification so they can't be told
+    # apart from wrong passwords by timing
+    stored = user["password"] if user else DUMMY_HASH
+    if not await verify_password(credentials.password, stored) or not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+
+    # Upgrade unsalted SHA-256 hashes now that we know the password
+    if is_legacy_hash(stored):
+        await db.users.update_one(
+            {"_id": user["_id"], "password": stored},
+            {"$set": {"password": await hash_password(credentials.password)}},
+        )
+
+    user.pop("password", None)
+    return {**user, "_id": str(user["_id"])}
+
+
 @router.get("", response_model=list[UserResponse])
-async def get_all_users():
-    users = await db.users.find().to_list(None)
-    result = []
-    for u in users:
-        u.pop("password", None)
-        result.append({**u, "_id": str(u["_id"])})
-    return result
+async def get_all_users(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: type[BaseModel] = Depends(sparse_fields(UserResponse)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # The projection keeps password hashes in the database
+    users = await paginate(
+        db.users, {}, page, response, projection=response_projection(fields)
+    )
+    return list_response(users, fields, response)
+
+
+@router.get("/search", response_model=list[UserResponse])
+async def search_users(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    type: Optional[str] = Query(None, pattern="^(admin|faculty|student)$"),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    fields: type[BaseModel] = Depends(sparse_fields(UserResponse)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Users whose username starts with ``q`` (ignoring case and accents)"""
+    query = {"search_username": prefix_range(q)}
+    if type:
+        query["type"] = type
+
+    # The projection keeps password hashes in the database
+    users = (
+        await db.users.find(query, response_projection(fields))
+        .sort("search_username", 1)
+        .limit(limit)
+        .to_list(limit)
+    )
+    return list_response(users, fields, response)
 
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str):
+async def get_user(
+    user_id: str,
+    response: Response,
+    fields: type[BaseModel] = Depends(sparse_fields(UserResponse)),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    # The projection keeps the password hash in the database
+    user = await db.users.find_one(
+        {"_id": ObjectId(user_id)}, response_projection(fields)
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.pop("password", None)
-    return {**user, "_id": str(user["_id"])}
+    return item_response(user, fields, response)
 
 
 @router.put("/{user_id}", response_model=UserResponse)
-async def update_user(user_id: str, user: UserCreate):
+async def update_user(
+    user_id: str, user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
@@ -83,26 +176,24 @@ async def update_user(user_id: str, user: UserCreate):
     update_data = {
         "full_name": user.full_name,
         "username": user.username,
+        "search_username": normalize(user.username),
         "email": user.email,
-        "password": hash_password(user.password),
+        "password": await hash_password(user.password),
         "type": user.type,
         "updated_at": datetime.utcnow(),
     }
 
-    result = await db.users.update_one(
-        {"_id": ObjectId(user_id)}, {"$set": update_data}
+    updated = await update_document(
+        db.users, user_id, update_data, projection={"password": 0}
     )
-
-    if result.matched_count == 0:
+    if updated is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    updated = await db.users.find_one({"_id": ObjectId(user_id)})
-    updated.pop("password", None)
     return {**updated, "_id": str(updated["_id"])}
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(user_id: str):
+async def delete_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
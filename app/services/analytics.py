@@ -0,0 +1,207 @@
+# Attendance analytics over the rollup counters
+#
+# Daily curves and per-student percentages are aggregated from
+# attendance_rollups (one counter per course and day, and per course and
+# student), so a department- or semester-wide query is one pipeline over a
+# few documents per course rather than a pass over the attendance records,
+# and works the same for both storage layouts.
+#
+# Results are cached by the state of the courses in scope: every write bumps
+# the ``version`` of its course rollup, so ``data_version`` of a scope only
+# changes when one of its courses did.
+import hashlib
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.services import rollups
+from app.services.rollups import attendance_summary
+from app.system.dates import day_range
+
+
+async def scope_courses(
+    db: AsyncIOMotorDatabase,
+    course_id: Optional[str] = None,
+    department_id: Optional[str] = None,
+    semester: Optional[int] = None,
+) -> list[str]:
+    """Ids of the courses an analytics query covers, in _id order"""
+    query = {}
+    if course_id:
+        query["_id"] = ObjectId(course_id)
+    if department_id:
+        query["department_id"] = department_id
+    if semester is not None:
+        query["semester"] = semester
+    return [
+        str(c["_id"]) async for c in db.courses.find(query, {"_id": 1}).sort("_id", 1)
+    ]
+
+
+async def data_version(db: AsyncIOMotorDatabase, courses: list[str]) -> str:
+    """Digest of the scope and the counters/version of each course in it"""
+    digest = hashlib.blake2b(digest_size=12)
+    async for rollup in db.attendance_rollups.find(
+        {"kind": rollups.COURSE, "course_id": {"$in": courses}},
+        {"course_id": 1, "total": 1, "present": 1, "version": 1},
+    ).sort("course_id", 1):
+        digest.update(
+            f"{rollup['course_id']}:{rollup['total']}:{rollup['present']}:"
+            f"{rollup.get('version')};".encode()
+        )
+    digest.update(",".join(courses).encode())
+    return digest.hexdigest()
+
+
+async def daily_trend(
+    db: AsyncIOMotorDatabase,
+    courses: list[str],
+    from_day: Optional[str],
+    to_day: Optional[str],
+    by_course: bool,
+) -> dict:
+    """Attendance per day over the courses, overall and optionally per course"""
+    match = {"kind": rollups.DAY, "course_id": {"$in": courses}}
+    days = day_range(from_day, to_day)
+    if days:
+        match["day"] = days
+
+    facets = {
+        "days": [
+            {
+                "$group": {
+                    "_id": "$day",
+                    "total": {"$sum": "$total"},
+                    "present": {"$sum": "$present"},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ],
+        "overall": [
+            {
+                "$group": {
+                    "_id": None,
+                    "total": {"$sum": "$total"},
+                    "present": {"$sum": "$present"},
+                }
+            }
+        ],
+    }
+    if by_course:
+        facets["courses"] = [
+            {"$sort": {"course_id": 1, "day": 1}},
+            {
+                "$group": {
+                    "_id": "$course_id",
+                    "days": {
+                        "$push": {
+                            "day": "$day",
+                            "total": "$total",
+                            "present": "$present",
+                        }
+                    },
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+
+    result = await db.attendance_rollups.aggregate(
+        [{"$match": match}, {"$facet": facets}]
+    ).to_list(1)
+    result = result[0] if result else {}
+    overall = (result.get("overall") or [{"total": 0, "present": 0}])[0]
+
+    trend = {
+        **attendance_summary(overall["total"], overall["present"]),
+        "days": [
+            {"day": d["_id"], **attendance_summary(d["total"], d["present"])}
+            for d in result.get("days", [])
+        ],
+    }
+    if by_course:
+        trend["courses"] = [
+            {
+                "course_id": c["_id"],
+                "days": [
+                    {"day": d["day"], **attendance_summary(d["total"], d["present"])}
+                    for d in c["days"]
+                ],
+            }
+            for c in result.get("courses", [])
+        ]
+    return trend
+
+
+async def student_percentages(
+    db: AsyncIOMotorDatabase,
+    courses: list[str],
+    below: Optional[float],
+    min_records: int,
+    limit: int,
+) -> dict:
+    """Per-student attendance across the courses, lowest first.
+
+    With ``below`` only students under that percentage are listed; the
+    summary always covers every student in scope.
+    """
+    students = [{"$sort": {"attendance_percentage": 1, "_id": 1}}, {"$limit": limit}]
+    facets = {
+        "overall": [
+            {
+                "$group": {
+                    "_id": None,
+                    "students": {"$sum": 1},
+                    "total": {"$sum": "$total"},
+                    "present": {"$sum": "$present"},
+                }
+            }
+        ],
+        "students": students,
+    }
+    if below is not None:
+        below_match = {"$match": {"attendance_percentage": {"$lt": below}}}
+        students.insert(0, below_match)
+        facets["below"] = [below_match, {"$count": "students"}]
+
+    pipeline = [
+        {"$match": {"kind": rollups.STUDENT, "course_id": {"$in": courses}}},
+        {
+            "$group": {
+                "_id": "$student_id",
+                "total": {"$sum": "$total"},
+                "present": {"$sum": "$present"},
+                "courses": {"$sum": 1},
+            }
+        },
+        {"$match": {"total": {"$gte": max(min_records, 1)}}},
+        {
+            "$set": {
+                "attendance_percentage": {
+                    "$round": [
+                        {"$multiply": [{"$divide": ["$present", "$total"]}, 100]},
+                        2,
+                    ]
+                }
+            }
+        },
+        {"$facet": facets},
+    ]
+    result = await db.attendance_rollups.aggregate(pipeline).to_list(1)
+    result = result[0] if result else {}
+    overall = (result.get("overall") or [{"students": 0, "total": 0, "present": 0}])[0]
+    matched = (result.get("below") or [{"students": 0}])[0]["students"]
+
+    return {
+        "students_in_scope": overall["students"],
+        **attendance_summary(overall["total"], overall["present"]),
+        **({"below": below, "students_below": matched} if below is not None else {}),
+        "students": [
+            {
+                "student_id": s["_id"],
+                "courses": s["courses"],
+                **attendance_summary(s["total"], s["present"]),
+            }
+            for s in result.get("students", [])
+        ],
+    }
@@ -0,0 +1,228 @@
+# Hot/cold tiering of attendance
+#
+# ``archive_attendance`` moves every mark older than a cutoff day out of the
+# hot store into the archive: attendance_archive_buckets (one document per
+# course and day, the compact form) or attendance_archive (one document per
+# mark), per ATTENDANCE_ARCHIVE_LAYOUT. The hot collection and its indexes
+# then only hold recent semesters.
+#
+# Before any row moves it writes per (course, student) totals of everything
+# archived to attendance_archive_totals and raises the archive watermark
+# (``archive_state``): days before it may be in the archive. The rollups keep
+# counting archived marks, so stats are unaffected by archiving.
+#
+# History reads (pages, export, per-student range stats) consult the archive
+# only when the requested range starts before the watermark and the student
+# or course has archive totals; pages list archived marks first, then hot
+# ones, with the tier in the cursor. Archived marks cannot be edited.
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+
+from app.services.attendance_store import (
+    BUCKETS,
+    LOG,
+    AttendanceStore,
+    attendance_store,
+)
+from app.system.cache import reference_cache
+from app.system.config import settings
+from app.system.database import DUPLICATE_KEY_ERROR
+from app.system.pagination import NEXT_CURSOR_HEADER, PageParams
+
+ARCHIVES = {LOG: "attendance_archive", BUCKETS: "attendance_archive_buckets"}
+TOTALS = "attendance_archive_totals"
+STATE = "archive_state"
+
+# Cursor prefixes of merged history pages
+ARCHIVE_CURSOR = "a:"
+HOT_CURSOR = "h:"
+
+WRITE_BATCH = 1000
+
+
+def archive_store(db: AsyncIOMotorDatabase) -> AttendanceStore:
+    layout = settings.attendance_archive_layout
+    return attendance_store(db, layout, ARCHIVES[layout])
+
+
+async def archived_before(db: AsyncIOMotorDatabase) -> Optional[str]:
+    """The archive watermark; cached per worker like reference data"""
+    state = await reference_cache.get(
+        (STATE, "attendance"), lambda: db[STATE].find_one({"_id": "attendance"})
+    )
+    return state["before"] if state else None
+
+
+async def has_archive(db: AsyncIOMotorDatabase, field: str, value: str) -> bool:
+    """Whether a student or course (``field``) has any archived marks"""
+    totals = await reference_cache.get(
+        (TOTALS, field, value), lambda: db[TOTALS].find_one({field: value}, {"_id": 1})
+    )
+    return totals is not None
+
+
+async def archive_query(db: AsyncIOMotorDatabase, query: dict) -> Optional[dict]:
+    """The part of a history query the archive has to answer, or None"""
+    before = await archived_before(db)
+    if before is None:
+        return None
+    days = query.get("day") or {}
+    if days.get("$gte", "") >= before:
+        return None
+    for field in ("student_id", "course_id"):
+        value = query.get(field)
+        if isinstance(value, str) and not await has_archive(db, field, value):
+            return None
+    return {**query, "day": {**days, "$lt": before}}
+
+
+async def history_page(
+    db: AsyncIOMotorDatabase,
+    query: dict,
+    page: PageParams,
+    response: Response,
+    projection: Optional[dict] = None,
+) -> list[dict]:
+    """One history page over both tiers, archived marks first"""
+    hot = attendance_store(db)
+    cursor = page.cursor or ""
+    archived = await archive_query(db, query)
+
+    if cursor.startswith(HOT_CURSOR):
+        cursor = cursor[len(HOT_CURSOR) :] or None
+    elif cursor.startswith(ARCHIVE_CURSOR) or (archived is not None and not cursor):
+        if archived is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        archive_page = Response()
+        records = await archive_store(db).page(
+            archived,
+            PageParams(page.limit, cursor[len(ARCHIVE_CURSOR) :] or None),
+            archive_page,
+            projection,
+        )
+        next_cursor = archive_page.headers.get(NEXT_CURSOR_HEADER)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = ARCHIVE_CURSOR + next_cursor
+            return records
+        if len(records) == page.limit:
+            response.headers[NEXT_CURSOR_HEADER] = HOT_CURSOR
+            return records
+        # The archive ran out: fill the rest of the page from the hot tier
+        remaining = PageParams(page.limit - len(records), None)
+        return records + await hot.page(query, remaining, response, projection)
+
+    return await hot.page(query, PageParams(page.limit, cursor), response, projection)
+
+
+async def history_records(
+    db: AsyncIOMotorDatabase, query: dict, batch_size: int
+) -> AsyncIterator[dict]:
+    """Every matching record of both tiers, archived ones first"""
+    archived = await archive_query(db, query)
+    if archived is not None:
+        async for record in archive_store(db).find(archived, batch_size):
+            yield record
+    async for record in attendance_store(db).find(query, batch_size):
+        yield record
+
+
+async def history_student_counts(
+    db: AsyncIOMotorDatabase, course_id: str, days: Optional[dict]
+) -> list[dict]:
+    """Per-student counts for a course over both tiers, by student_id"""
+    counts = await attendance_store(db).student_counts(course_id, days)
+    archived = await archive_query(db, {"course_id": course_id, "day": days})
+    if archived is None:
+        return counts
+
+    merged = {c["student_id"]: c for c in counts}
+    for c in await archive_store(db).student_counts(course_id, archived["day"]):
+        total = merged.setdefault(
+            c["student_id"], {"student_id": c["student_id"], "total": 0, "present": 0}
+        )
+        total["total"] += c["total"]
+        total["present"] += c["present"]
+    return sorted(merged.values(), key=lambda c: c["student_id"])
+
+
+async def archive_totals(db: AsyncIOMotorDatabase, before: str) -> dict:
+    """Per (course, student) totals of the archive plus the hot marks before
+    ``before``, i.e. of the archive once they have moved"""
+    totals = {}
+    for counts in (
+        archive_store(db).mark_counts(),
+        attendance_store(db).mark_counts({"$lt": before}),
+    ):
+        async for group in counts:
+            key = group["_id"]
+            summary = totals.setdefault(
+                (key["course_id"], key["student_id"]),
+                {
+                    "_id": f"{key['course_id']}|{key['student_id']}",
+                    "course_id": key["course_id"],
+                    "student_id": key["student_id"],
+                    "total": 0,
+                    "present": 0,
+                    "first_day": key["day"],
+                    "last_day": key["day"],
+                },
+            )
+            summary["total"] += group["total"]
+            summary["present"] += group["present"]
+            summary["first_day"] = min(summary["first_day"], key["day"])
+            summary["last_day"] = max(summary["last_day"], key["day"])
+    return totals
+
+
+async def archive_attendance(
+    db: AsyncIOMotorDatabase,
+    before: str,
+    batch_size: int = 1000,
+    settle: Optional[float] = None,
+) -> dict:
+    """Move the hot marks of days before ``before`` to the archive.
+
+    Safe to run again after an interruption: marks already copied count as
+    duplicates and the totals are recomputed, not added to.
+    """
+    report = {"before": before, "summaries": 0, "moved": 0, "duplicates": 0}
+
+    # 1. Totals of everything that will be archived
+    operations = [
+        ReplaceOne({"_id": s["_id"]}, s, upsert=True)
+        for s in (await archive_totals(db, before)).values()
+    ]
+    for i in range(0, len(operations), WRITE_BATCH):
+        await db[TOTALS].bulk_write(operations[i : i + WRITE_BATCH], ordered=False)
+    report["summaries"] = len(operations)
+
+    # 2. Readers include the archive from here on; give every worker's
+    # cached watermark and totals time to expire before rows move
+    await db[STATE].update_one(
+        {"_id": "attendance"}, {"$max": {"before": before}}, upsert=True
+    )
+    await asyncio.sleep(settings.reference_cache_ttl if settle is None else settle)
+
+    # 3. Copy each batch to the archive, then remove it from the hot store
+    archive = archive_store(db)
+
+    async def copy(records: list[dict]):
+        errors = await archive.insert_many(records)
+        for error in errors.values():
+            if error["code"] != DUPLICATE_KEY_ERROR:
+                raise RuntimeError(f"Archiving failed: {error['errmsg']}")
+        report["duplicates"] += len(errors)
+
+    hot = attendance_store(db)
+    after = None
+    while True:
+        records, after = await hot.remove_batch(
+            {"day": {"$lt": before}}, after, batch_size, copy
+        )
+        report["moved"] += len(records)
+        if after is None:
+            return report
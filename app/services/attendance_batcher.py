@@ -0,0 +1,137 @@
+# Write-behind batching of attendance marks
+#
+# With ATTENDANCE_WRITE_BEHIND enabled, mark_attendance validates the request
+# and hands the document to the batcher instead of writing it. A background
+# task coalesces queued marks into one unordered insert_many of the
+# attendance store per batch (by size or after a few milliseconds) and
+# resolves each caller's future with its own outcome, including duplicate-key
+# rejections.
+import asyncio
+import contextlib
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.services.attendance_feed import MARKED, attendance_feed
+from app.services.attendance_store import attendance_store
+from app.services.rollups import record_rollups
+from app.system.database import DUPLICATE_KEY_ERROR
+
+
+class AttendanceQueueFull(Exception):
+    """The batcher is at capacity (or shutting down); the caller should retry"""
+
+
+class AttendanceBatcher:
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        max_batch: int = 500,
+        max_delay_ms: float = 5,
+        max_queue: int = 10000,
+    ):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closing = False
+        self.batches = 0
+        self.marks = 0
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def submit(self, document: dict) -> dict:
+        """Queue a mark and wait until its batch has been written.
+
+        Returns the stored document, raises DuplicateKeyError when the mark
+        already exists and AttendanceQueueFull when the queue is at capacity.
+        """
+        if self.closing:
+            raise AttendanceQueueFull()
+        document.setdefault("_id", ObjectId())
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((document, future))
+        except asyncio.QueueFull:
+            raise AttendanceQueueFull()
+        return await future
+
+    async def close(self):
+        """Stop accepting marks, write everything already queued, then stop"""
+        self.closing = True
+        await self.queue.join()
+        if self._runner:
+            self._runner.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._runner
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch: list):
+        try:
+            errors = await attendance_store(self.db).insert_many(
+                [document for document, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        written = [doc for i, (doc, _) in enumerate(batch) if i not in errors]
+        self.marks += len(written)
+        await record_rollups(self.db, added=written)
+        for document in written:
+            attendance_feed.record(MARKED, document)
+
+        for i, (document, future) in enumerate(batch):
+            if future.done():
+                # The caller went away; its mark was still written
+                continue
+            error = errors.get(i)
+            if error is None:
+                future.set_result(document)
+            elif error["code"] == DUPLICATE_KEY_ERROR:
+                future.set_exception(
+                    DuplicateKeyError(error["errmsg"], error["code"], error)
+                )
+            else:
+                future.set_exception(
+                    OperationFailure(error["errmsg"], error["code"], error)
+                )
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "batches": self.batches,
+            "marks": self.marks,
+        }
+
+
+def get_attendance_batcher(request: Request) -> Optional[AttendanceBatcher]:
+    """Route dependency: the running batcher, or None when write-behind is off"""
+    return getattr(request.app.state, "attendance_batcher", None)
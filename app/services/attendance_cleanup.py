@@ -0,0 +1,256 @@
+# Background removal of a deleted student's or course's attendance
+#
+# delete_student and delete_course only remove the parent document and
+# schedule a cascade job in ``cleanup_jobs`` (one per student or course,
+# shared by all workers). An AttendanceCleaner in each worker claims due jobs
+# under a lease and removes the dependent attendance in batches of
+# CLEANUP_BATCH_SIZE stored documents, walking the _id index, moving the
+# rollups down with each batch and checkpointing the last _id on the job, so
+# a restart or another worker resumes where it stopped. Archived attendance
+# goes the same way once the hot store is clear. Between batches the cleaner
+# sleeps CLEANUP_BATCH_DELAY_MS, longer while its worker is busy serving
+# requests.
+#
+# Jobs start CLEANUP_DELAY seconds after the delete (by default the
+# reference cache TTL), once no worker can still accept marks for the
+# deleted parent from a stale cache. Orphans from before this existed are
+# found with ``python -m app.commands.scan_orphans``.
+import asyncio
+import contextlib
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app.services import rollups
+from app.services.attendance_archive import TOTALS, archive_store
+from app.services.attendance_store import AttendanceStore, attendance_store
+from app.services.rollups import record_rollups
+from app.system.config import settings
+from app.system.metrics import http_requests_in_flight
+
+JOBS = "cleanup_jobs"
+ARCHIVE = "attendance_orphans"
+
+PENDING = "pending"
+DONE = "done"
+
+# Jobs clear the hot store, then the archive (app/services/attendance_archive.py)
+HOT = "hot"
+ARCHIVED = "archive"
+
+# The attendance field that refers to each kind of parent
+TARGETS = {"student": "student_id", "course": "course_id"}
+
+# Seconds a claimed job stays with its worker without a checkpoint
+LEASE = 60
+
+
+async def schedule_cleanup(
+    db: AsyncIOMotorDatabase, kind: str, target_id: str, delay: Optional[float] = None
+):
+    """Queue removal of the attendance of a deleted student or course.
+
+    Scheduling the same target again restarts its job from the beginning.
+    """
+    now = datetime.utcnow()
+    if delay is None:
+        delay = settings.cleanup_delay
+    if delay is None:
+        delay = settings.reference_cache_ttl
+    await db[JOBS].update_one(
+        {"_id": f"{kind}|{target_id}"},
+        {
+            "$set": {
+                "state": PENDING,
+                "tier": HOT,
+                "after": None,
+                "not_before": now + timedelta(seconds=delay),
+                "owner": None,
+                "lease_until": None,
+                "updated_at": now,
+            },
+            "$setOnInsert": {
+                "kind": kind,
+                "target_id": target_id,
+                "batches": 0,
+                "removed": 0,
+                "created_at": now,
+            },
+        },
+        upsert=True,
+    )
+
+
+def tier_store(db: AsyncIOMotorDatabase, tier: str) -> AttendanceStore:
+    return archive_store(db) if tier == ARCHIVED else attendance_store(db)
+
+
+def archive_records(db: AsyncIOMotorDatabase):
+    """Copy records about to be removed to attendance_orphans; a resumed
+    batch that was already copied only hits duplicate _ids"""
+
+    async def copy(records: list[dict]):
+        try:
+            await db[ARCHIVE].insert_many(records, ordered=False)
+        except BulkWriteError:
+            pass
+
+    return copy
+
+
+class AttendanceCleaner:
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        batch_size: int = 500,
+        batch_delay_ms: float = 50,
+        busy_requests: int = 50,
+        poll_interval: float = 5,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay_ms / 1000
+        self.busy_requests = busy_requests
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self.jobs = 0
+        self.batches = 0
+        self.removed = 0
+        self.throttled = 0
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop after the current batch; the job resumes from its checkpoint"""
+        if self._runner:
+            self._runner.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._runner
+
+    async def drain(self):
+        """Run every due job to completion, then return"""
+        while await self.run_next():
+            pass
+
+    async def run_next(self) -> bool:
+        """Claim and run one due job; False when there is none"""
+        job = await self._claim()
+        if job is None:
+            return False
+        await self._work(job)
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                if not await self.run_next():
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The lease expires and the job is picked up again
+                print(f"✗ Attendance cleanup failed, retrying: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db[JOBS].find_one_and_update(
+            {
+                "state": PENDING,
+                "not_before": {"$lte": now},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}],
+            },
+            {"$set": self._lease(now)},
+            sort=[("not_before", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _lease(self, now: datetime) -> dict:
+        return {"owner": self.owner, "lease_until": now + timedelta(seconds=LEASE)}
+
+    async def _throttle(self):
+        await asyncio.sleep(self.batch_delay)
+        # Back off while this worker is busy with requests
+        while http_requests_in_flight.value() > self.busy_requests:
+            self.throttled += 1
+            await asyncio.sleep(max(self.batch_delay, 0.01) * 10)
+
+    async def _work(self, job: dict):
+        field = TARGETS[job["kind"]]
+        target_id = job["target_id"]
+        tier = job.get("tier") or HOT
+        after = job.get("after")
+        self.jobs += 1
+
+        while True:
+            store = tier_store(self.db, tier)
+            records, after = await store.remove_batch(
+                {field: target_id},
+                after,
+                self.batch_size,
+                archive_records(self.db) if settings.cleanup_archive else None,
+            )
+            if records:
+                await record_rollups(self.db, removed=records)
+            self.batches += 1
+            self.removed += len(records)
+
+            now = datetime.utcnow()
+            done = after is None and tier == ARCHIVED
+            if after is None and not done:
+                # Hot marks are gone; archived ones next
+                tier = ARCHIVED
+            update = {
+                "$set": {
+                    "tier": tier,
+                    "after": after,
+                    "updated_at": now,
+                    **self._lease(now),
+                },
+                "$inc": {"batches": 1, "removed": len(records)},
+            }
+            if done:
+                update["$set"].update(state=DONE, lease_until=None, finished_at=now)
+            # Only while the job is still ours and was not scheduled again
+            result = await self.db[JOBS].update_one(
+                {"_id": job["_id"], "owner": self.owner, "state": PENDING}, update
+            )
+            if not result.matched_count or done:
+                break
+            await self._throttle()
+
+        if done and result.matched_count:
+            # The target's own counters are all zero now
+            await self.db.attendance_rollups.delete_many(
+                {"kind": rollups.STUDENT, "student_id": target_id}
+                if field == "student_id"
+                else {"course_id": target_id}
+            )
+            await self.db[TOTALS].delete_many({field: target_id})
+
+    def stats(self) -> dict:
+        return {
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "removed": self.removed,
+            "throttled": self.throttled,
+        }
+
+
+async def cleanup_jobs(
+    db: AsyncIOMotorDatabase, state: Optional[str] = None, limit: int = 100
+) -> list[dict]:
+    """Progress of the most recently scheduled cleanup jobs"""
+    query = {"state": state} if state else {}
+    jobs = []
+    async for job in db[JOBS].find(query).sort("updated_at", -1).limit(limit):
+        job["after"] = str(job["after"]) if job.get("after") else None
+        job.pop("owner", None)
+        jobs.append(job)
+    return jobs
@@ -0,0 +1,146 @@
+# Streaming export of attendance records as NDJSON or CSV
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator
+
+from bson import ObjectId
+
+from app.services.attendance_archive import history_records
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FIELDS = [
+    "_id",
+    "day",
+    "student_id",
+    "student_name",
+    "class",
+    "course_id",
+    "course_name",
+    "semester",
+    "present",
+    "submitted_by",
+    "updated_at",
+]
+
+
+async def _names(collection, ids: set, fields: dict) -> dict:
+    """Look up display fields for a batch of referenced documents"""
+    object_ids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    return {
+        str(doc["_id"]): doc
+        async for doc in collection.find({"_id": {"$in": object_ids}}, fields)
+    }
+
+
+async def _rows(db, batch: list[dict]) -> list[dict]:
+    students = await _names(
+        db.students, {r["student_id"] for r in batch}, {"full_name": 1, "class": 1}
+    )
+    courses = await _names(
+        db.courses, {r["course_id"] for r in batch}, {"course_name": 1, "semester": 1}
+    )
+
+    rows = []
+    for record in batch:
+        student = students.get(record["student_id"], {})
+        course = courses.get(record["course_id"], {})
+        updated_at = record.get("updated_at")
+        rows.append(
+            {
+                "_id": str(record["_id"]),
+                "day": record.get("day"),
+                "student_id": record["student_id"],
+                "student_name": student.get("full_name"),
+                "class": student.get("class"),
+                "course_id": record["course_id"],
+                "course_name": course.get("course_name"),
+                "semester": course.get("semester"),
+                "present": record["present"],
+                "submitted_by": record.get("submitted_by"),
+                "updated_at": updated_at.isoformat() if updated_at else None,
+            }
+        )
+    return rows
+
+
+async def export_batches(
+    db, query: dict, batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[list[dict]]:
+    """Yield export rows one cursor batch at a time, in history page order"""
+    batch = []
+    async for record in history_records(db, query, batch_size):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield await _rows(db, batch)
+            batch = []
+    if batch:
+        yield await _rows(db, batch)
+
+
+def encode_ndjson(rows: list[dict], first: bool) -> str:
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def encode_csv(rows: list[dict], first: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    if first:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+ENCODERS = {
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+    "csv": (encode_csv, "text/csv"),
+}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip: listed, or covered by
+    ``*``, with a q-value above 0"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+async def stream_export(
+    db, query: dict, format: str, compress: bool
+) -> AsyncIterator[bytes]:
+    """Encode export batches, optionally gzip-compressing them as they go"""
+    encode = ENCODERS[format][0]
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    first = True
+
+    async for rows in export_batches(db, query):
+        chunk = encode(rows, first).encode()
+        first = False
+        if gzip:
+            chunk = gzip.compress(chunk)
+        if chunk:
+            yield chunk
+
+    # An empty CSV export still gets its header row
+    if first and format == "csv":
+        chunk = encode([], True).encode()
+        yield gzip.compress(chunk) if gzip else chunk
+    if gzip:
+        yield gzip.flush()
@@ -0,0 +1,271 @@
+# Live attendance events per course
+#
+# The mark, bulk, update and delete handlers (and the write-behind batcher)
+# report every committed change to ``attendance_feed``, which fans it out to
+# the subscribers of that course. Each subscriber has a bounded buffer; one
+# that falls behind by more than ATTENDANCE_FEED_BUFFER events is evicted
+# rather than slowing down writers or growing without limit, and its client
+# reconnects.
+#
+# Handlers only see the writes of their own worker. With
+# ATTENDANCE_FEED_SOURCE=change_stream (needs a replica set) the handlers stop
+# publishing and ChangeStreamSource feeds every worker from a change stream on
+# attendance_log instead.
+import asyncio
+import contextlib
+import json
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.models import AttendanceResponse, response_fields
+from app.services import rollups
+from app.system.config import settings
+from app.system.dates import day_bucket
+
+MARKED = "marked"
+UPDATED = "updated"
+DELETED = "deleted"
+
+
+class FeedFull(Exception):
+    """The feed is at its subscriber limit; the client should retry later"""
+
+
+class Subscriber:
+    """One client's queue of events for a course"""
+
+    def __init__(self, course_id: str, max_buffer: int):
+        self.course_id = course_id
+        self.max_buffer = max_buffer
+        self.events: deque = deque()
+        self.evicted = False
+        self._ready = asyncio.Event()
+
+    def push(self, event: dict) -> bool:
+        if len(self.events) >= self.max_buffer:
+            self.evicted = True
+            self.events.clear()
+            self._ready.set()
+            return False
+        self.events.append(event)
+        self._ready.set()
+        return True
+
+    async def get(self) -> Optional[dict]:
+        """Wait for the next event; None once this subscriber was evicted"""
+        while not self.events:
+            if self.evicted:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self.events.popleft()
+
+
+def feed_record(record: dict) -> dict:
+    """The AttendanceResponse fields of a stored record, JSON ready"""
+    row = {key: record.get(key) for key in response_fields(AttendanceResponse)}
+    row["_id"] = str(record["_id"])
+    if row["updated_at"] is not None:
+        row["updated_at"] = row["updated_at"].isoformat()
+    return row
+
+
+class AttendanceFeed:
+    def __init__(self, max_buffer: int, max_subscribers: int):
+        self.max_buffer = max_buffer
+        self.max_subscribers = max_subscribers
+        self._courses: dict[str, set[Subscriber]] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self.evictions = 0
+
+    def full(self) -> bool:
+        return self.subscribers >= self.max_subscribers
+
+    def subscribe(self, course_id: str) -> Subscriber:
+        if self.full():
+            raise FeedFull()
+        subscriber = Subscriber(course_id, self.max_buffer)
+        self._courses.setdefault(course_id, set()).add(subscriber)
+        self.subscribers += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._courses.get(subscriber.course_id)
+        if subscribers and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            self.subscribers -= 1
+            if not subscribers:
+                del self._courses[subscriber.course_id]
+
+    def publish(self, kind: str, record: dict, previous: Optional[dict] = None) -> None:
+        """Deliver a change to the subscribers of the course(s) it touches.
+
+        An update that moves a record to another course reaches both.
+        """
+        event = {"type": kind, "record": feed_record(record)}
+        if previous is not None:
+            event["previous"] = feed_record(previous)
+        self.published += 1
+
+        courses = {record["course_id"]}
+        if previous is not None:
+            courses.add(previous["course_id"])
+        for course_id in courses:
+            for subscriber in list(self._courses.get(course_id, ())):
+                if subscriber.push(event):
+                    self.delivered += 1
+                else:
+                    self.evictions += 1
+                    self.unsubscribe(subscriber)
+
+    def record(self, kind: str, record: dict, previous: Optional[dict] = None):
+        """Publish a change made by this worker's handlers.
+
+        A no-op when events come from a change stream instead.
+        """
+        if settings.attendance_feed_source == "local":
+            self.publish(kind, record, previous)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "courses": len(self._courses),
+            "max_subscribers": self.max_subscribers,
+            "published": self.published,
+            "delivered": self.delivered,
+            "evictions": self.evictions,
+        }
+
+
+attendance_feed = AttendanceFeed(
+    max_buffer=settings.attendance_feed_buffer,
+    max_subscribers=settings.attendance_feed_max_subscribers,
+)
+
+
+async def day_counters(db: AsyncIOMotorDatabase, course_id: str) -> dict:
+    """Today's marks for a course, from its day rollup"""
+    day = day_bucket()
+    rollup = await rollups.get_rollup(db, rollups.DAY, course_id, day)
+    return {"day": day, "total": rollup["total"], "present": rollup["present"]}
+
+
+def count_event(counters: dict, course_id: str, event: dict):
+    """Move today's counters by the records an event removed and added"""
+    if event["type"] == DELETED:
+        removed, added = [event["record"]], []
+    else:
+        removed, added = [event.get("previous")], [event["record"]]
+    for sign, records in ((-1, removed), (1, added)):
+        for record in records:
+            if record and record["course_id"] == course_id:
+                if record["day"] == counters["day"]:
+                    counters["total"] += sign
+                    counters["present"] += sign if record["present"] else 0
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(
+    db: AsyncIOMotorDatabase, course_id: str, heartbeat: float
+) -> AsyncIterator[str]:
+    """Server-sent events for a course until the client disconnects or is evicted.
+
+    Subscribes when the response starts streaming, so a response that is
+    never sent holds no subscription. Starts with today's counters and
+    re-reads them every ``heartbeat`` seconds without events, which also keeps
+    proxies from closing the connection and corrects any drift from events
+    missed around subscribing.
+    """
+    try:
+        subscriber = attendance_feed.subscribe(course_id)
+    except FeedFull:
+        # Filled up since the handler checked
+        yield sse("evicted", {"reason": "too many subscribers, reconnect"})
+        return
+    try:
+        counters = await day_counters(db, course_id)
+        yield sse("counters", counters)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.get(), heartbeat)
+            except asyncio.TimeoutError:
+                counters = await day_counters(db, course_id)
+                yield sse("counters", counters)
+                continue
+            if event is None:
+                yield sse("evicted", {"reason": "client too slow, reconnect"})
+                return
+            count_event(counters, course_id, event)
+            yield sse(event["type"], {**event, "counters": counters})
+    finally:
+        attendance_feed.unsubscribe(subscriber)
+
+
+class ChangeStreamSource:
+    """Publishes attendance_log changes from a MongoDB change stream.
+
+    Deletes and the previous state of updates are only known when the
+    collection has changeStreamPreAndPostImages enabled; without them those
+    events carry no ``previous`` and clients rely on the periodic counters.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, feed: AttendanceFeed):
+        if settings.attendance_storage != "log":
+            raise ValueError("ATTENDANCE_FEED_SOURCE=change_stream needs log storage")
+        self.db = db
+        self.feed = feed
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._runner:
+            self._runner.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._runner
+
+    async def _run(self):
+        resume_after = None
+        pipeline = [
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+                }
+            }
+        ]
+        while True:
+            try:
+                async with self.db.attendance_log.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=resume_after,
+                ) as stream:
+                    async for change in stream:
+                        resume_after = change["_id"]
+                        self._publish(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"✗ Attendance change stream failed, resuming: {e}")
+                await asyncio.sleep(1)
+
+    def _publish(self, change: dict):
+        current = change.get("fullDocument")
+        previous = change.get("fullDocumentBeforeChange")
+        operation = change["operationType"]
+        if operation == "insert":
+            self.feed.publish(MARKED, current)
+        elif operation == "delete":
+            if previous is not None:
+                self.feed.publish(DELETED, previous)
+        elif current is not None:
+            self.feed.publish(UPDATED, current, previous)
@@ -0,0 +1,512 @@
+# Attendance storage layouts
+#
+# Handlers, the write-behind batcher, the export and the rollup rebuild read
+# and write attendance as flat records (_id, student_id, course_id, present,
+# date, day, submitted_by, updated_at) through attendance_store(db), which
+# picks the layout configured by ATTENDANCE_STORAGE:
+#
+# - "log": one attendance_log document per student, course and day.
+# - "buckets": one attendance_buckets document per course and day holding
+#   every mark of that roll call:
+#
+#     {course_id, day, submitted_by,
+#      marks: [{s: student ObjectId, p: present, i: mark ObjectId, u: updated_at}]}
+#
+#   The mark ObjectId is the record's _id and, through its timestamp, its
+#   ``date``; ``u`` is only stored once a mark has been edited. A student
+#   appears at most once per bucket: writes are conditional on
+#   ``marks.s`` and the (course_id, day) unique index turns a failed
+#   conditional upsert into a DuplicateKeyError, as the log layout does.
+#
+# Buckets are read in bucket _id order and marks in the order they were
+# taken, so history pages use a (bucket, position) cursor instead of the
+# record _id.
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from bson import ObjectId
+from fastapi import Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.system.config import settings
+from app.system.database import DUPLICATE_KEY_ERROR
+from app.system.dates import day_match
+from app.system.pagination import (
+    NEXT_CURSOR_HEADER,
+    PageParams,
+    decode_position_cursor,
+    encode_position_cursor,
+    paginate,
+)
+from app.system.repository import insert_document
+
+LOG = "log"
+BUCKETS = "buckets"
+
+# Seconds between a mark's _id and its updated_at that count as an edit
+EDIT_TOLERANCE = 1
+
+
+class AttendanceStore(ABC):
+    """Flat attendance records over one storage layout.
+
+    Queries are dicts with any of ``student_id``, ``course_id`` (a value or
+    ``{"$in": [...]}``) and ``day`` (a value or range condition).
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, collection: Optional[str] = None):
+        self.db = db
+
+    @abstractmethod
+    async def insert(self, record: dict) -> dict:
+        """Store one mark; raises DuplicateKeyError if it is already marked"""
+
+    @abstractmethod
+    async def insert_many(self, records: list[dict]) -> dict[int, dict]:
+        """Store marks unordered; returns write errors keyed by record index"""
+
+    @abstractmethod
+    async def page(
+        self,
+        query: dict,
+        page: PageParams,
+        response: Response,
+        projection: Optional[dict] = None,
+    ) -> list[dict]:
+        """One page of records, setting the next-page cursor header"""
+
+    @abstractmethod
+    def find(self, query: dict, batch_size: int) -> AsyncIterator[dict]:
+        """Every matching record, in page order"""
+
+    @abstractmethod
+    async def student_counts(self, course_id: str, days: Optional[dict]) -> list[dict]:
+        """Per-student total and present counts for a course, by student_id"""
+
+    @abstractmethod
+    def mark_counts(self, days: Optional[dict] = None) -> AsyncIterator[dict]:
+        """Counts per (course_id, student_id, day), for rebuilding rollups"""
+
+    @abstractmethod
+    async def update(self, record_id: ObjectId, fields: dict) -> Optional[dict]:
+        """Change student_id/course_id/present of a mark; returns it as it was"""
+
+    @abstractmethod
+    async def delete(self, record_id: ObjectId) -> Optional[dict]:
+        """Remove a mark; returns it, or None when there was none"""
+
+    @abstractmethod
+    async def remove_batch(
+        self,
+        query: dict,
+        after: Optional[ObjectId],
+        limit: int,
+        before_remove: Optional[Callable[[list[dict]], Awaitable]] = None,
+    ) -> tuple[list[dict], Optional[ObjectId]]:
+        """Remove the matching marks from up to ``limit`` stored documents
+        after ``after``, calling ``before_remove`` with them first.
+
+        Returns the removed records and the _id to continue after, None once
+        nothing is left.
+        """
+
+    @abstractmethod
+    def referenced(self, field: str) -> AsyncIterator[str]:
+        """Every distinct student_id or course_id the records refer to"""
+
+
+class LogStore(AttendanceStore):
+    def __init__(self, db: AsyncIOMotorDatabase, collection: Optional[str] = None):
+        super().__init__(db)
+        self.collection = db[collection or "attendance_log"]
+
+    async def insert(self, record: dict) -> dict:
+        return await insert_document(self.collection, record)
+
+    async def insert_many(self, records: list[dict]) -> dict[int, dict]:
+        try:
+            await self.collection.bulk_write(
+                [InsertOne(record) for record in records], ordered=False
+            )
+        except BulkWriteError as e:
+            return {error["index"]: error for error in e.details["writeErrors"]}
+        return {}
+
+    async def page(self, query, page, response, projection=None):
+        return await paginate(self.collection, query, page, response, projection)
+
+    def find(self, query: dict, batch_size: int):
+        return self.collection.find(query).sort("_id", 1).batch_size(batch_size)
+
+    async def student_counts(self, course_id, days):
+        pipeline = [
+            {"$match": day_match({"course_id": course_id}, days)},
+            {
+                "$group": {
+                    "_id": "$student_id",
+                    "total": {"$sum": 1},
+                    "present": {"$sum": {"$cond": ["$present", 1, 0]}},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+        groups = await self.collection.aggregate(pipeline).to_list(None)
+        return [
+            {"student_id": g["_id"], "total": g["total"], "present": g["present"]}
+            for g in groups
+        ]
+
+    def mark_counts(self, days=None):
+        pipeline = [
+            *([{"$match": {"day": days}}] if days else []),
+            {
+                "$group": {
+                    "_id": {
+                        "course_id": "$course_id",
+                        "student_id": "$student_id",
+                        "day": "$day",
+                    },
+                    "total": {"$sum": 1},
+                    "present": {"$sum": {"$cond": ["$present", 1, 0]}},
+                }
+            },
+        ]
+        return self.collection.aggregate(pipeline, allowDiskUse=True)
+
+    async def update(self, record_id, fields):
+        return await self.collection.find_one_and_update(
+            {"_id": record_id}, {"$set": fields}
+        )
+
+    async def delete(self, record_id):
+        return await self.collection.find_one_and_delete({"_id": record_id})
+
+    async def remove_batch(self, query, after, limit, before_remove=None):
+        batch = {**query, "_id": {"$gt": after}} if after is not None else query
+        records = (
+            await self.collection.find(batch).sort("_id", 1).limit(limit).to_list(limit)
+        )
+        if not records:
+            return [], None
+        if before_remove:
+            await before_remove(records)
+        last = records[-1]["_id"]
+        await self.collection.delete_many(
+            {**query, "_id": {"$gte": records[0]["_id"], "$lte": last}}
+        )
+        return records, last if len(records) == limit else None
+
+    async def referenced(self, field):
+        pipeline = [{"$group": {"_id": f"${field}"}}]
+        async for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            yield group["_id"]
+
+
+def _record(bucket: dict, mark: dict) -> dict:
+    taken = mark["i"].generation_time
+    return {
+        "_id": mark["i"],
+        "student_id": str(mark["s"]),
+        "course_id": bucket["course_id"],
+        "present": mark["p"],
+        "date": int(taken.timestamp()),
+        "day": bucket["day"],
+        "submitted_by": bucket.get("submitted_by"),
+        "updated_at": mark.get("u") or taken.replace(tzinfo=None),
+    }
+
+
+def _mark(record: dict) -> dict:
+    mark = {
+        "s": ObjectId(record["student_id"]),
+        "p": record["present"],
+        "i": record["_id"],
+    }
+    # Keep the time of an edit; a mark's own write time is implied by "i"
+    updated_at = record.get("updated_at")
+    taken = record["_id"].generation_time.replace(tzinfo=None)
+    if updated_at and (updated_at - taken).total_seconds() > EDIT_TOLERANCE:
+        mark["u"] = updated_at
+    return mark
+
+
+def _duplicate(course_id: str, day: str, student_id) -> DuplicateKeyError:
+    message = f"Student {student_id} is already marked for {course_id} on {day}"
+    return DuplicateKeyError(
+        message, DUPLICATE_KEY_ERROR, {"code": DUPLICATE_KEY_ERROR, "errmsg": message}
+    )
+
+
+class BucketStore(AttendanceStore):
+    def __init__(self, db: AsyncIOMotorDatabase, collection: Optional[str] = None):
+        super().__init__(db)
+        self.collection = db[collection or "attendance_buckets"]
+
+    def _query(self, query: dict) -> dict:
+        buckets = {key: value for key, value in query.items() if key != "student_id"}
+        if "student_id" in query:
+            student_id = query["student_id"]
+            buckets["marks.s"] = (
+                ObjectId(student_id) if ObjectId.is_valid(student_id) else student_id
+            )
+        return buckets
+
+    def _fields(self, query: dict) -> dict:
+        """Projection keeping only the marks a query asks for"""
+        fields = {"course_id": 1, "day": 1, "submitted_by": 1, "marks": 1}
+        if "marks.s" in query:
+            fields["marks"] = {"$elemMatch": {"s": query["marks.s"]}}
+        return fields
+
+    def _push_operation(self, course_id: str, day: str, marks: list, submitted_by):
+        """Append marks to a bucket unless one of their students is already in it"""
+        query = {
+            "course_id": course_id,
+            "day": day,
+            "marks.s": {"$nin": [mark["s"] for mark in marks]},
+        }
+        update = {
+            "$push": {"marks": {"$each": marks}},
+            "$setOnInsert": {"submitted_by": submitted_by},
+        }
+        return query, update
+
+    async def _push(self, course_id: str, day: str, marks: list, submitted_by):
+        query, update = self._push_operation(course_id, day, marks, submitted_by)
+        try:
+            await self.collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Either a student is already marked, or a concurrent mark created
+            # the bucket between our match and our insert
+            result = await self.collection.update_one(query, update)
+            if not result.matched_count:
+                raise _duplicate(course_id, day, marks[0]["s"])
+
+    async def insert(self, record: dict) -> dict:
+        record.setdefault("_id", ObjectId())
+        await self._push(
+            record["course_id"], record["day"], [_mark(record)], record["submitted_by"]
+        )
+        return record
+
+    async def insert_many(self, records: list[dict]) -> dict[int, dict]:
+        errors = {}
+        # (course_id, day) -> {student_id: record index}
+        groups = {}
+        for index, record in enumerate(records):
+            record.setdefault("_id", ObjectId())
+            group = groups.setdefault((record["course_id"], record["day"]), {})
+            if record["student_id"] in group:
+                duplicate = _duplicate(
+                    record["course_id"], record["day"], record["student_id"]
+                )
+                errors[index] = {"index": index, **duplicate.details}
+            else:
+                group[record["student_id"]] = index
+
+        # One conditional upsert per bucket; a bucket that already holds one
+        # of the students is retried mark by mark
+        keys = list(groups)
+        operations = []
+        for course_id, day in keys:
+            group = [records[i] for i in groups[course_id, day].values()]
+            query, update = self._push_operation(
+                course_id, day, [_mark(r) for r in group], group[0]["submitted_by"]
+            )
+            operations.append(UpdateOne(query, update, upsert=True))
+        if not operations:
+            return errors
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] != DUPLICATE_KEY_ERROR:
+                    raise
+                for index in groups[keys[error["index"]]].values():
+                    try:
+                        await self.insert(records[index])
+                    except DuplicateKeyError as duplicate:
+                        errors[index] = {"index": index, **duplicate.details}
+        return errors
+
+    async def page(self, query, page, response, projection=None):
+        query = self._query(query)
+        after, after_position = None, -1
+        if page.cursor:
+            after, after_position = decode_position_cursor(page.cursor)
+            query["_id"] = {"$gte": after}
+
+        records = []
+        last = None
+        cursor = self.collection.find(query, self._fields(query)).sort("_id", 1)
+        async for bucket in cursor:
+            start = after_position + 1 if bucket["_id"] == after else 0
+            for position in range(start, len(bucket["marks"])):
+                if len(records) == page.limit:
+                    # Another mark follows: the page is full and has a next one
+                    response.headers[NEXT_CURSOR_HEADER] = encode_position_cursor(*last)
+                    await cursor.close()
+                    return records
+                records.append(_record(bucket, bucket["marks"][position]))
+                last = (bucket["_id"], position)
+        return records
+
+    async def find(self, query: dict, batch_size: int):
+        query = self._query(query)
+        cursor = (
+            self.collection.find(query, self._fields(query))
+            .sort("_id", 1)
+            .batch_size(max(1, batch_size // 100))
+        )
+        async for bucket in cursor:
+            for mark in bucket["marks"]:
+                yield _record(bucket, mark)
+
+    async def student_counts(self, course_id, days):
+        pipeline = [
+            {"$match": day_match({"course_id": course_id}, days)},
+            {"$unwind": "$marks"},
+            {
+                "$group": {
+                    "_id": "$marks.s",
+                    "total": {"$sum": 1},
+                    "present": {"$sum": {"$cond": ["$marks.p", 1, 0]}},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+        groups = await self.collection.aggregate(pipeline).to_list(None)
+        return [
+            {"student_id": str(g["_id"]), "total": g["total"], "present": g["present"]}
+            for g in groups
+        ]
+
+    async def mark_counts(self, days=None):
+        # A student is marked at most once per bucket, so every mark is its
+        # own (course, student, day) group
+        query = {"day": days} if days else {}
+        async for bucket in self.collection.find(query, self._fields(query)):
+            for mark in bucket["marks"]:
+                yield {
+                    "_id": {
+                        "course_id": bucket["course_id"],
+                        "student_id": str(mark["s"]),
+                        "day": bucket["day"],
+                    },
+                    "total": 1,
+                    "present": 1 if mark["p"] else 0,
+                }
+
+    async def _locate(self, record_id: ObjectId) -> Optional[dict]:
+        return await self.collection.find_one(
+            {"marks.i": record_id},
+            {
+                "course_id": 1,
+                "day": 1,
+                "submitted_by": 1,
+                "marks": {"$elemMatch": {"i": record_id}},
+            },
+        )
+
+    async def update(self, record_id, fields):
+        bucket = await self._locate(record_id)
+        if bucket is None:
+            return None
+        previous = _record(bucket, bucket["marks"][0])
+        mark = {
+            "s": ObjectId(fields["student_id"]),
+            "p": fields["present"],
+            "i": record_id,
+            "u": fields["updated_at"],
+        }
+
+        if fields["course_id"] == bucket["course_id"]:
+            query = {"_id": bucket["_id"]}
+            if mark["s"] != bucket["marks"][0]["s"]:
+                query["marks.s"] = {"$ne": mark["s"]}
+            result = await self.collection.update_one(
+                query,
+                {"$set": {"marks.$[mark]": mark}},
+                array_filters=[{"mark.i": record_id}],
+            )
+            if not result.matched_count:
+                raise _duplicate(bucket["course_id"], bucket["day"], mark["s"])
+        else:
+            # Moving to another course: add to that day's bucket first so a
+            # duplicate leaves the original mark in place
+            await self._push(
+                fields["course_id"], bucket["day"], [mark], bucket.get("submitted_by")
+            )
+            await self.collection.update_one(
+                {"_id": bucket["_id"]}, {"$pull": {"marks": {"i": record_id}}}
+            )
+        return previous
+
+    async def delete(self, record_id):
+        bucket = await self.collection.find_one_and_update(
+            {"marks.i": record_id},
+            {"$pull": {"marks": {"i": record_id}}},
+            projection={
+                "course_id": 1,
+                "day": 1,
+                "submitted_by": 1,
+                "marks": {"$elemMatch": {"i": record_id}},
+            },
+        )
+        if bucket is None:
+            return None
+        return _record(bucket, bucket["marks"][0])
+
+    async def remove_batch(self, query, after, limit, before_remove=None):
+        query = self._query(query)
+        batch = {**query, "_id": {"$gt": after}} if after is not None else query
+        buckets = (
+            await self.collection.find(batch, self._fields(batch))
+            .sort("_id", 1)
+            .limit(limit)
+            .to_list(limit)
+        )
+        if not buckets:
+            return [], None
+        records = [
+            _record(bucket, mark) for bucket in buckets for mark in bucket["marks"]
+        ]
+        if before_remove:
+            await before_remove(records)
+        query["_id"] = {"$gte": buckets[0]["_id"], "$lte": buckets[-1]["_id"]}
+        if "marks.s" in query:
+            await self.collection.update_many(
+                query, {"$pull": {"marks": {"s": query["marks.s"]}}}
+            )
+        else:
+            # Every mark of a matching bucket goes, so the bucket goes
+            await self.collection.delete_many(query)
+        return records, buckets[-1]["_id"] if len(buckets) == limit else None
+
+    async def referenced(self, field):
+        if field == "course_id":
+            pipeline = [{"$group": {"_id": "$course_id"}}]
+        else:
+            pipeline = [{"$unwind": "$marks"}, {"$group": {"_id": "$marks.s"}}]
+        async for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            yield str(group["_id"])
+
+
+STORES = {LOG: LogStore, BUCKETS: BucketStore}
+
+
+def attendance_store(
+    db: AsyncIOMotorDatabase,
+    layout: Optional[str] = None,
+    collection: Optional[str] = None,
+) -> AttendanceStore:
+    """The store for ``layout``, by default the configured ATTENDANCE_STORAGE,
+    over the layout's own collection unless another ``collection`` is given"""
+    layout = layout or settings.attendance_storage
+    try:
+        return STORES[layout](db, collection)
+    except KeyError:
+        raise ValueError(f"Unknown attendance storage layout: {layout!r}")
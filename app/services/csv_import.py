@@ -0,0 +1,280 @@
+# Bulk CSV import of departments, courses and students
+#
+# Rows are validated with the same models as the create endpoints and
+# written in unordered insert_many batches. A row whose natural key (see
+# IMPORTS) already exists, or appears earlier in the file, is reported as a
+# duplicate instead of being inserted again; each batch checks its keys with
+# one indexed $or query, so memory is bounded by the batch size and the
+# department map, never by the size of the file. Department references may
+# be given by _id or by department name.
+#
+# The upload is parsed as it arrives, one CSV record at a time, so neither
+# the request body nor the file is held in full. The result is a stream of
+# report entries, one per rejected row in row order, followed by a summary.
+import codecs
+import csv
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.models import CourseCreate, DepartmentCreate, StudentCreate
+from app.system.conditional import bump_version
+from app.system.search import normalize
+
+IMPORT_BATCH_SIZE = 1000
+# A quoted field still open after this many characters is taken as
+# unterminated rather than buffering the rest of the file into one record
+MAX_RECORD_CHARS = 1024 * 1024
+
+# OpenAPI description of the raw CSV request body of the import endpoints
+CSV_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"text/csv": {"schema": {"type": "string"}}},
+    }
+}
+
+
+@dataclass(frozen=True)
+class ImportKind:
+    collection: str
+    model: type[BaseModel]
+    # Document fields that identify an existing record
+    key: tuple[str, ...]
+    references_department: bool
+
+
+IMPORTS = {
+    "departments": ImportKind(
+        "departments", DepartmentCreate, ("department_name",), False
+    ),
+    "courses": ImportKind(
+        "courses", CourseCreate, ("department_id", "class", "course_name"), True
+    ),
+    "students": ImportKind(
+        "students", StudentCreate, ("department_id", "class", "full_name"), True
+    ),
+}
+
+
+async def department_map(db: AsyncIOMotorDatabase) -> dict[str, str]:
+    """Department _id by its _id string and by its name"""
+    departments = {}
+    async for dept in db.departments.find({}, {"department_name": 1}):
+        department_id = str(dept["_id"])
+        departments[department_id] = department_id
+        departments.setdefault(dept.get("department_name"), department_id)
+    return departments
+
+
+def validation_errors(error: ValidationError) -> list[dict]:
+    return [
+        {"field": ".".join(str(part) for part in e["loc"]), "message": e["msg"]}
+        for e in error.errors()
+    ]
+
+
+def build_document(
+    kind: ImportKind, row: dict, departments: Optional[dict], now: datetime
+) -> tuple[Optional[dict], list[dict]]:
+    """Validate a CSV row into a document, or return its errors"""
+    try:
+        item = kind.model.model_validate(row)
+    except ValidationError as e:
+        return None, validation_errors(e)
+
+    document = item.model_dump(by_alias=True)
+    if kind.references_department:
+        department_id = departments.get(document["department_id"])
+        if department_id is None:
+            return None, [{"field": "department_id", "message": "Department not found"}]
+        document["department_id"] = department_id
+    if "full_name" in document:
+        document["search_name"] = normalize(document["full_name"])
+    document["submitted_by"] = "import"
+    document["updated_at"] = now
+    return document, []
+
+
+async def write_batch(
+    db: AsyncIOMotorDatabase, kind: ImportKind, batch: list[tuple[int, dict]]
+) -> list[dict]:
+    """Insert the new rows of a batch; return report entries for the rest"""
+    report = []
+    collection = db[kind.collection]
+
+    # Duplicates inside the batch, then against what is already stored
+    # (which includes earlier batches of this file)
+    unique = {}
+    for line, document in batch:
+        key = tuple(document[field] for field in kind.key)
+        if key in unique:
+            report.append({"row": line, "status": "duplicate"})
+        else:
+            unique[key] = (line, document)
+    existing = {
+        tuple(doc.get(field) for field in kind.key)
+        async for doc in collection.find(
+            {"$or": [dict(zip(kind.key, key)) for key in unique]},
+            {field: 1 for field in kind.key},
+        )
+    }
+    pending = []
+    for key, (line, document) in unique.items():
+        if key in existing:
+            report.append({"row": line, "status": "duplicate"})
+        else:
+            pending.append((line, document))
+
+    if pending:
+        try:
+            await collection.insert_many([d for _, d in pending], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                report.append(
+                    {
+                        "row": pending[error["index"]][0],
+                        "status": "failed",
+                        "errors": [{"field": None, "message": error["errmsg"]}],
+                    }
+                )
+    return report
+
+
+def parse_record(text: str) -> Optional[list[str]]:
+    """The fields of a CSV record, or None while a quoted field is still open"""
+    try:
+        return next(csv.reader([text], strict=True), [])
+    except csv.Error as e:
+        if "unexpected end of data" in str(e) and len(text) < MAX_RECORD_CHARS:
+            return None
+        # Malformed: parse it leniently, as csv does by default
+        return next(csv.reader([text]), [])
+
+
+async def csv_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[list[str]]:
+    """Parse a UTF-8 CSV byte stream as it arrives, one record at a time;
+    blank lines are skipped and a quoted field may span lines"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    record = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            record += line + "\n"
+            fields = parse_record(record)
+            if fields is None:
+                continue
+            record = ""
+            if fields:
+                yield fields
+    record += buffer + decoder.decode(b"", final=True)
+    if record:
+        fields = next(csv.reader([record]), [])
+        if fields:
+            yield fields
+
+
+def row_dict(header: list[str], fields: list[str]) -> dict:
+    """A record keyed by the header, like csv.DictReader: extra values under
+    None, missing ones as None"""
+    row = dict(zip(header, fields))
+    if len(fields) > len(header):
+        row[None] = fields[len(header) :]
+    for key in header[len(fields) :]:
+        row[key] = None
+    return row
+
+
+async def import_rows(
+    db: AsyncIOMotorDatabase,
+    kind_name: str,
+    records: AsyncIterable[list[str]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> AsyncIterator[dict]:
+    """Import parsed CSV ``records`` (header first) and yield a report entry
+    per rejected row in row order, then ``{"summary": ...}``.
+
+    ``row`` numbers are CSV record numbers, the header being row 1. Entries
+    are held back until their batch is written, so at most ``batch_size``
+    rows are buffered.
+    """
+    kind = IMPORTS[kind_name]
+    departments = await department_map(db) if kind.references_department else None
+    now = datetime.utcnow()
+    counts = {"rows": 0, "created": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+    batch = []
+    invalid = []
+
+    async def flush():
+        report = await write_batch(db, kind, batch) if batch else []
+        created = len(batch) - len(report)
+        if created:
+            counts["created"] += created
+            await bump_version(db, kind.collection)
+        for entry in report:
+            counts["duplicates" if entry["status"] == "duplicate" else "failed"] += 1
+        report = sorted(report + invalid, key=lambda e: e["row"])
+        batch.clear()
+        invalid.clear()
+        return report
+
+    header = None
+    line = 1
+    async for fields in records:
+        if header is None:
+            header = fields
+            continue
+        line += 1
+        counts["rows"] += 1
+        document, errors = build_document(
+            kind, row_dict(header, fields), departments, now
+        )
+        if errors:
+            counts["invalid"] += 1
+            invalid.append({"row": line, "status": "invalid", "errors": errors})
+        else:
+            batch.append((line, document))
+        if len(batch) + len(invalid) == batch_size:
+            for entry in await flush():
+                yield entry
+    if batch or invalid:
+        for entry in await flush():
+            yield entry
+
+    yield {"summary": counts}
+
+
+class ImportResponse(StreamingResponse):
+    """A StreamingResponse whose body is still reading the request.
+
+    StreamingResponse normally listens on ``receive`` for a disconnect while
+    it streams, which would take the request body away from the import; here
+    the body iterator is the only reader and a disconnect surfaces there as
+    ClientDisconnect.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+async def import_response(
+    request: Request, db: AsyncIOMotorDatabase, kind_name: str, batch_size: int
+) -> StreamingResponse:
+    """Import the CSV request body as it is received, streaming the report
+    as NDJSON"""
+
+    async def report():
+        records = csv_records(request.stream())
+        async for entry in import_rows(db, kind_name, records, batch_size):
+            yield json.dumps(entry) + "\n"
+
+    return ImportResponse(report(), media_type="application/x-ndjson")
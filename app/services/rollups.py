@@ -0,0 +1,125 @@
+# Incrementally maintained attendance counters
+#
+# attendance_rollups holds one counter document per course, per
+# (course, student) and per (course, day). Writers of attendance records call
+# record_rollups with the record(s) they removed and added so the counters
+# move with $inc; rebuild_rollups recomputes them from the records, and
+# repairs any update that failed. Archived records keep counting. Student
+# counters that drop back to 0 stay behind and are not listed in stats.
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.services.attendance_archive import archive_store
+from app.services.attendance_store import attendance_store
+
+COURSE = "course"
+STUDENT = "student"
+DAY = "day"
+
+
+def rollup_keys(record: dict) -> list[dict]:
+    """Return the identity of every rollup an attendance record counts toward"""
+    keys = [
+        {
+            "_id": f"{COURSE}|{record['course_id']}",
+            "kind": COURSE,
+            "course_id": record["course_id"],
+        },
+        {
+            "_id": f"{STUDENT}|{record['course_id']}|{record['student_id']}",
+            "kind": STUDENT,
+            "course_id": record["course_id"],
+            "student_id": record["student_id"],
+        },
+    ]
+    # Legacy records without a day bucket only count toward the totals
+    if record.get("day"):
+        keys.append(
+            {
+                "_id": f"{DAY}|{record['course_id']}|{record['day']}",
+                "kind": DAY,
+                "course_id": record["course_id"],
+                "day": record["day"],
+            }
+        )
+    return keys
+
+
+def rollup_operations(removed=(), added=()) -> list[UpdateOne]:
+    """Build the $inc updates for records removed from and added to the log.
+
+    Deltas for the same rollup are merged, so an update that only flips
+    ``present`` becomes a single present +/-1 with no change to the total.
+    """
+    deltas = {}
+    for sign, records in ((-1, removed), (1, added)):
+        for record in records:
+            for key in rollup_keys(record):
+                delta = deltas.setdefault(key["_id"], [key, 0, 0])
+                delta[1] += sign
+                delta[2] += sign if record["present"] else 0
+
+    # Every course with a counter change gets a new version on its course
+    # rollup, even when only its student or day counters moved; cached
+    # analytics are keyed by these (see app/services/analytics.py)
+    changed = {
+        key["course_id"] for key, total, present in deltas.values() if total or present
+    }
+    operations = []
+    for key, total, present in deltas.values():
+        update = {
+            "$inc": {"total": total, "present": present},
+            "$setOnInsert": {k: v for k, v in key.items() if k != "_id"},
+        }
+        if key["kind"] == COURSE and key["course_id"] in changed:
+            update["$set"] = {"version": ObjectId()}
+        elif not (total or present):
+            continue
+        operations.append(UpdateOne({"_id": key["_id"]}, update, upsert=True))
+    return operations
+
+
+async def apply_rollups(db, removed=(), added=()):
+    operations = rollup_operations(removed, added)
+    if operations:
+        await db.attendance_rollups.bulk_write(operations, ordered=False)
+
+
+async def record_rollups(db, removed=(), added=()):
+    """apply_rollups after the records were written: a failure is logged,
+    not raised, since the write itself stands"""
+    try:
+        await apply_rollups(db, removed, added)
+    except Exception as e:
+        # rebuild_rollups repairs the counters
+        print(f"✗ Failed to update attendance rollups: {e}")
+
+
+def attendance_summary(total: int, present: int) -> dict:
+    return {
+        "total_records": total,
+        "present": present,
+        "absent": total - present,
+        "attendance_percentage": round(present / total * 100, 2) if total else 0,
+    }
+
+
+async def get_rollup(db, *parts: str) -> dict:
+    """Read one rollup by its key parts, e.g. ("course", course_id)"""
+    rollup = await db.attendance_rollups.find_one({"_id": "|".join(parts)})
+    return rollup or {"total": 0, "present": 0}
+
+
+async def compute_rollups(db) -> dict:
+    """Recompute every rollup from the attendance records, hot and archived,
+    keyed by rollup _id"""
+    expected = {}
+    for store in (attendance_store(db), archive_store(db)):
+        async for group in store.mark_counts():
+            for key in rollup_keys(group["_id"]):
+                rollup = expected.setdefault(
+                    key["_id"], {**key, "total": 0, "present": 0}
+                )
+                rollup["total"] += group["total"]
+                rollup["present"] += group["present"]
+    return expected
@@ -0,0 +1,249 @@
+# Admission control per route class
+#
+# Every API request is sorted into a class (see ``route_class``) with its own
+# concurrency limit, a bounded queue of requests waiting for a slot and a
+# maximum wait. A request that finds the queue full or waits too long gets
+# an immediate 503 with Retry-After instead of tying up a MongoDB connection,
+# so a burst of list pulls, stats or exports cannot starve the roll call.
+#
+# Classes are served in priority order: while writes are queued, no point
+# or heavy read is let in even if its own class has free slots. Keep the sum
+# of the limits under MONGO_MAX_POOL_SIZE so admitted requests never queue
+# for a connection instead.
+#
+# Health, readiness, metrics and docs are never limited, nor are the
+# long-lived attendance event streams (the feed caps its own subscribers).
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from typing import Optional
+
+from app.system.config import settings
+from app.system.metrics import Counter, Gauge, Histogram, registry
+
+WRITES = "writes"
+POINT_READS = "point_reads"
+HEAVY_READS = "heavy_reads"
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Exports, stats, analytics, imports and paged list/history pulls
+HEAVY_PATHS = re.compile(
+    r"^/api/(?:"
+    r"attendance/(?:export|stats/.+|student/[^/]+|course/[^/]+)"
+    r"|analytics/.+"
+    r"|(?:departments|courses|students|users)(?:/import)?"
+    r")/?$"
+)
+UNLIMITED_PATHS = re.compile(r"^/api/attendance/course/[^/]+/events/?$")
+
+admission_queue_time = registry.register(
+    Histogram(
+        "admission_queue_seconds",
+        "Time admitted requests waited for a slot by route class",
+        ("class",),
+    )
+)
+admission_rejections = registry.register(
+    Counter(
+        "admission_rejections_total",
+        "Requests shed by admission control by route class and reason",
+        ("class", "reason"),
+    )
+)
+admission_requests = registry.register(
+    Gauge(
+        "admission_requests",
+        "Requests holding (active) or waiting for a slot by route class",
+        ("class", "state"),
+    )
+)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """The admission class of a request, or None when it is not limited"""
+    if not path.startswith("/api/") or UNLIMITED_PATHS.match(path):
+        return None
+    if path.endswith("/import") and method == "POST":
+        return HEAVY_READS
+    if method in WRITE_METHODS:
+        return WRITES
+    if HEAVY_PATHS.match(path):
+        return HEAVY_READS
+    return POINT_READS
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class AdmissionClass:
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "max_wait": self.max_wait,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    """Concurrency slots per class; ``classes`` are given highest priority first"""
+
+    def __init__(self, classes: list[AdmissionClass]):
+        self.classes = {c.name: c for c in classes}
+
+    def _blocked(self, admission: AdmissionClass) -> bool:
+        """Whether a higher-priority class has requests waiting"""
+        for other in self.classes.values():
+            if other is admission:
+                return False
+            if other.waiters:
+                return True
+        return False
+
+    async def acquire(self, name: str) -> float:
+        """Wait for a slot; returns the seconds waited, raises Rejected"""
+        admission = self.classes[name]
+        if (
+            not admission.waiters
+            and admission.active < admission.limit
+            and not self._blocked(admission)
+        ):
+            admission.active += 1
+            admission.admitted += 1
+            return 0.0
+        if len(admission.waiters) >= admission.queue:
+            admission.rejected += 1
+            raise Rejected("queue_full")
+
+        start = time.perf_counter()
+        slot = asyncio.get_running_loop().create_future()
+        admission.waiters.append(slot)
+        try:
+            await asyncio.wait_for(slot, admission.max_wait)
+        except asyncio.TimeoutError:
+            admission.timed_out += 1
+            raise Rejected("timeout")
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot granted meanwhile
+            if slot.done() and not slot.cancelled():
+                self.release(name)
+            raise
+        finally:
+            if slot in admission.waiters:
+                admission.waiters.remove(slot)
+                # Lower classes may have been held back by this waiter
+                self._dispatch()
+        admission.admitted += 1
+        return time.perf_counter() - start
+
+    def release(self, name: str):
+        self.classes[name].active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to waiters, highest-priority class first"""
+        for admission in self.classes.values():
+            while admission.waiters and admission.active < admission.limit:
+                slot = admission.waiters.popleft()
+                if not slot.done():
+                    admission.active += 1
+                    slot.set_result(None)
+            if admission.waiters:
+                return
+
+    def stats(self) -> dict:
+        return {name: admission.stats() for name, admission in self.classes.items()}
+
+    def collect(self):
+        for name, admission in self.classes.items():
+            admission_requests.set(name, "active", value=admission.active)
+            admission_requests.set(name, "waiting", value=len(admission.waiters))
+
+
+admission_controller = AdmissionController(
+    [
+        AdmissionClass(
+            WRITES,
+            settings.admission_writes_limit,
+            settings.admission_writes_queue,
+            settings.admission_writes_wait,
+        ),
+        AdmissionClass(
+            POINT_READS,
+            settings.admission_point_reads_limit,
+            settings.admission_point_reads_queue,
+            settings.admission_point_reads_wait,
+        ),
+        AdmissionClass(
+            HEAVY_READS,
+            settings.admission_heavy_reads_limit,
+            settings.admission_heavy_reads_queue,
+            settings.admission_heavy_reads_wait,
+        ),
+    ]
+)
+registry.collectors.append(admission_controller.collect)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests through ``admission_controller``"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        name = None
+        if scope["type"] == "http" and settings.admission_control:
+            name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            waited = await self.controller.acquire(name)
+        except Rejected as e:
+            admission_rejections.inc(name, e.reason)
+            await self._reject(send)
+            return
+
+        admission_queue_time.observe(waited, name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Server busy, retry later"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(settings.admission_retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
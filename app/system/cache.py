@@ -0,0 +1,197 @@
+# In-process LRU + TTL cache for small, rarely changing reference data
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.system.config import settings
+
+
+class AsyncTTLCache:
+    """LRU cache whose entries expire after ``ttl`` seconds.
+
+    Concurrent misses for the same key share a single load (single-flight).
+    Meant for one event loop, so no locking is needed; ``invalidate`` bumps a
+    per-key generation so a load already in flight cannot store a value that
+    predates the invalidation.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._loading: dict = {}
+        self._tasks: set = set()
+        self._generations: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+
+        self.misses += 1
+        future = self._loading.get(key)
+        if future is None:
+
+            async def load_one(keys: list) -> dict:
+                return {key: await loader()}
+
+            future = self._start([key], load_one)[key]
+        return await asyncio.shield(future)
+
+    async def get_many(
+        self,
+        keys: Iterable[Hashable],
+        loader: Callable[[list], Awaitable[dict]],
+    ) -> dict:
+        """Look up several keys, loading every miss with one ``loader`` call.
+
+        ``loader`` gets the missing keys and returns a dict of the values it
+        found; keys it leaves out are cached as None. Keys another caller is
+        already loading are awaited instead of loaded again.
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        self.misses += len(missing)
+        futures = {key: self._loading[key] for key in missing if key in self._loading}
+        new = [key for key in missing if key not in futures]
+        if new:
+            futures.update(self._start(new, loader))
+        for key, future in futures.items():
+            found[key] = await asyncio.shield(future)
+        return found
+
+    def _start(
+        self, keys: list, loader: Callable[[list], Awaitable[dict]]
+    ) -> dict[Hashable, asyncio.Future]:
+        """Load ``keys`` in a task of its own, so a caller that is cancelled
+        (e.g. its client went away) does not fail the others waiting on it"""
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in keys}
+        generations = {key: self._generations.get(key, 0) for key in keys}
+        self._loading.update(futures)
+
+        async def load():
+            try:
+                loaded = await loader(keys)
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                    # Mark the exception as retrieved when nobody was waiting
+                    future.exception()
+                return
+            finally:
+                for key in keys:
+                    del self._loading[key]
+
+            for key, future in futures.items():
+                value = loaded.get(key)
+                if self._generations.get(key, 0) == generations[key]:
+                    self._store(key, value)
+                future.set_result(value)
+
+        task = loop.create_task(load())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return futures
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self.invalidations += 1
+
+    def clear(self):
+        for key in list(self._entries):
+            self.invalidate(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# Students, courses and departments looked up by _id. Other workers see a
+# change at most ``reference_cache_ttl`` seconds late; this process sees it
+# immediately because the update/delete handlers invalidate their entry.
+reference_cache = AsyncTTLCache(
+    maxsize=settings.reference_cache_size, ttl=settings.reference_cache_ttl
+)
+
+
+async def get_reference(
+    db: AsyncIOMotorDatabase, collection: str, document_id: str
+) -> Optional[dict]:
+    """Return a cached student/course/department document, or None.
+
+    The returned document is shared between callers and must not be modified.
+    """
+    if not ObjectId.is_valid(document_id):
+        return None
+    return await reference_cache.get(
+        (collection, document_id),
+        lambda: db[collection].find_one({"_id": ObjectId(document_id)}),
+    )
+
+
+def invalidate_reference(collection: str, document_id: str):
+    reference_cache.invalidate((collection, document_id))
+
+
+async def get_references(
+    db: AsyncIOMotorDatabase, collection: str, document_ids: Iterable[str]
+) -> dict[str, Optional[dict]]:
+    """Cached documents for several ids, fetching all misses in one ``$in`` query.
+
+    Maps every valid id to its document, or None when it does not exist.
+    """
+    ids = [i for i in dict.fromkeys(document_ids) if ObjectId.is_valid(i)]
+
+    async def load(keys: list) -> dict:
+        cursor = db[collection].find({"_id": {"$in": [ObjectId(k[1]) for k in keys]}})
+        return {(collection, str(doc["_id"])): doc async for doc in cursor}
+
+    docs = await reference_cache.get_many([(collection, i) for i in ids], load)
+    return {key[1]: doc for key, doc in docs.items()}
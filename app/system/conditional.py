@@ -0,0 +1,161 @@
+# Conditional GET for rarely changing collections
+#
+# Every write to departments, courses or students replaces that collection's
+# version marker in ``collection_versions`` (shared by all workers). GET
+# handlers tag their response with an ETag made of the marker and the request
+# URL, so a poll carrying a matching If-None-Match gets a 304 after reading
+# only the marker. The last fast-path body per ETag is also kept in a
+# per-worker LRU, so a poll without If-None-Match skips the full read and
+# serialization as long as nothing changed.
+import hashlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+from bson import ObjectId
+from fastapi import Depends, Request, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.system.config import settings
+from app.system.database import get_db
+
+VERSIONS = "collection_versions"
+
+
+async def bump_version(db: AsyncIOMotorDatabase, collection: str):
+    """Mark ``collection`` as changed; call after every write that matched"""
+    await db[VERSIONS].update_one(
+        {"_id": collection}, {"$set": {"version": ObjectId()}}, upsert=True
+    )
+
+
+async def current_version(db: AsyncIOMotorDatabase, collection: str) -> str:
+    doc = await db[VERSIONS].find_one({"_id": collection})
+    if doc is None:
+        # Never bumped (new database, or markers dropped): start a version
+        # now rather than reuse one that may predate the data
+        await bump_version(db, collection)
+        doc = await db[VERSIONS].find_one({"_id": collection})
+    return str(doc["version"])
+
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``tag``"""
+    opaque = tag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU of serialized response bodies by ETag, bounded by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def get(self, tag: str) -> Optional[Response]:
+        entry = self._entries.get(tag)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(tag)
+        self.hits += 1
+        body, headers, media_type = entry
+        return Response(body, headers=headers, media_type=media_type)
+
+    def put(self, tag: str, response: Response):
+        body = response.body
+        if len(body) > self.max_bytes or tag in self._entries:
+            return
+        headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key not in ("content-length", "content-type")
+        }
+        self._entries[tag] = (body, headers, response.media_type)
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            _, (evicted, _, _) = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+        }
+
+
+response_cache = ResponseCache(settings.response_cache_bytes)
+
+
+def request_etag(request: Request, name: str, version: str) -> str:
+    """Weak ETag for this request's URL at ``version`` of the data ``name``"""
+    url = f"{request.url.path}?{request.url.query}".encode()
+    digest = hashlib.blake2b(url, digest_size=8).hexdigest()
+    return f'W/"{name}.{version}.{digest}"'
+
+
+def etag_headers(tag: str) -> dict:
+    return {"ETag": tag, "Cache-Control": "no-cache"}
+
+
+def revalidate(request: Request, tag: str, bodies: bool = True) -> Optional[Response]:
+    """A 304 when the client already has ``tag``, else the cached body if any"""
+    if etag_matches(request.headers.get("if-none-match", ""), tag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=etag_headers(tag))
+    if bodies and settings.response_cache_bytes:
+        return response_cache.get(tag)
+    return None
+
+
+class Conditional:
+    """ETag state of one GET request.
+
+    ``cached`` is a ready response (304, or the cached body) the handler
+    should return as is; otherwise pass the handler's result through
+    ``store``.
+    """
+
+    def __init__(self, tag: str, cached: Optional[Response]):
+        self.tag = tag
+        self.cached = cached
+
+    def store(self, result: Any) -> Any:
+        if isinstance(result, Response) and result.status_code == 200:
+            response_cache.put(self.tag, result)
+        return result
+
+
+def conditional(collection: str, bodies: bool = True):
+    """Dependency that tags a GET on ``collection`` with its current ETag.
+
+    Only fast-path responses are cached, so ``bodies=False`` (handlers that
+    return documents) or FAST_SERIALIZATION=false skip the cache lookup.
+    """
+
+    async def dependency(
+        request: Request,
+        response: Response,
+        db: AsyncIOMotorDatabase = Depends(get_db),
+    ) -> Conditional:
+        tag = request_etag(request, collection, await current_version(db, collection))
+        response.headers.update(etag_headers(tag))
+        return Conditional(
+            tag, revalidate(request, tag, bodies and settings.fast_serialization)
+        )
+
+    return dependency
@@ -0,0 +1,99 @@
+# Application settings, read from the environment (or a .env file)
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    mongodb_url: str = "mongodb://localhost:27017"
+    database_name: str = "master"
+
+    # Motor / PyMongo connection pool
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: Optional[int] = None
+    # Comma separated wire compressors, e.g. "zstd,snappy,zlib"
+    mongo_compressors: str = ""
+
+    # Seconds /ready waits for a ping before reporting not ready
+    readiness_timeout: float = 2.0
+
+    institution_timezone: str = "UTC"
+
+    # Log requests slower than this (ms) with their MongoDB command breakdown
+    slow_request_ms: Optional[float] = None
+
+    # List endpoints: project + dump JSON directly instead of re-validating
+    # through response_model. json_backend is "pydantic" or "orjson".
+    fast_serialization: bool = True
+    json_backend: str = "pydantic"
+
+    # Attendance layout: "log" (a document per mark) or "buckets" (a document
+    # per course and day); see app/services/attendance_store.py
+    attendance_storage: str = "log"
+    # Form of archived attendance, "buckets" (compact) or "log"; see
+    # app/services/attendance_archive.py
+    attendance_archive_layout: str = "buckets"
+
+    # Write-behind batching of POST /api/attendance
+    attendance_write_behind: bool = False
+    attendance_batch_size: int = 500
+    attendance_batch_delay_ms: float = 5
+    attendance_queue_size: int = 10000
+
+    # Live attendance events: "local" (this worker's handlers publish),
+    # "change_stream" (a change stream on attendance_log; needs a replica
+    # set) or "off". Buffer is per subscriber; heartbeat is in seconds.
+    attendance_feed_source: str = "local"
+    attendance_feed_buffer: int = 2000
+    attendance_feed_max_subscribers: int = 1000
+    attendance_feed_heartbeat: float = 15.0
+
+    # Background removal of a deleted student's or course's attendance: the
+    # job starts cleanup_delay seconds (default: the reference cache TTL)
+    # after the delete and removes cleanup_batch_size documents per batch,
+    # pausing cleanup_batch_delay_ms between batches and longer while more
+    # than cleanup_busy_requests requests are in flight. cleanup_archive
+    # copies the removed records to attendance_orphans first.
+    cleanup_worker: bool = True
+    cleanup_delay: Optional[float] = None
+    cleanup_batch_size: int = 500
+    cleanup_batch_delay_ms: float = 50
+    cleanup_busy_requests: int = 50
+    cleanup_archive: bool = False
+
+    # Admission control per route class (app/system/admission.py): requests
+    # running at once, requests allowed to wait and seconds they may wait
+    # before a 503. Keep the limits' sum under mongo_max_pool_size.
+    admission_control: bool = True
+    admission_writes_limit: int = 48
+    admission_writes_queue: int = 2000
+    admission_writes_wait: float = 10.0
+    admission_point_reads_limit: int = 32
+    admission_point_reads_queue: int = 500
+    admission_point_reads_wait: float = 2.0
+    admission_heavy_reads_limit: int = 8
+    admission_heavy_reads_queue: int = 64
+    admission_heavy_reads_wait: float = 1.0
+    admission_retry_after: int = 2
+
+    # Threads running scrypt for register/login, and how many jobs may wait
+    password_hash_workers: int = 4
+    password_hash_max_waiting: int = 256
+
+    # Student/course/department lookups cached per worker process
+    reference_cache_size: int = 10000
+    reference_cache_ttl: float = 30.0
+
+    # Bytes of department/course/student list bodies kept per worker by
+    # ETag, served while the collection is unchanged (0 disables)
+    response_cache_bytes: int = 32 * 1024 * 1024
+
+
+settings = Settings()
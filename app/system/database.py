@@ -1,44 +1,202 @@
 # MongoDB Setup
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+#
+# The Motor client is created per process inside the FastAPI lifespan (so
+# every uvicorn/gunicorn worker gets its own pool after forking) and handed
+# to route handlers through the get_db dependency.
 import asyncio
+from contextlib import asynccontextmanager
 
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-DATABASE_NAME = os.getenv("DATABASE_NAME", "attendance_db")
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING
 
-# mongodb_client = None
-# db = None
+from app.system.config import settings
+from app.system.metrics import mongo_command_metrics
 
+# Server error code for a unique index violation
+DUPLICATE_KEY_ERROR = 11000
 
-# async def connect_to_mongo():
-#     global mongodb_client, db
-#     mongodb_client = AsyncIOMotorClient(MONGODB_URL)
-#     db = mongodb_client[DATABASE_NAME]
-#     print("✓ Connected to MongoDB")
+# Seconds between attempts to create indexes while MongoDB is unreachable
+INDEX_RETRY_DELAY = 5
 
 
-# async def close_mongo_connection():
-#     global mongodb_client
-#     if mongodb_client:
-#         mongodb_client.close()
-#     print("✗ Disconnected from MongoDB")
+def create_client(**overrides) -> AsyncIOMotorClient:
+    """Build a Motor client from settings; this does not touch the network"""
+    options = {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.mongo_wait_queue_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongo_socket_timeout_ms,
+        "event_listeners": [mongo_command_metrics],
+    }
+    if settings.mongo_compressors:
+        options["compressors"] = settings.mongo_compressors
+    options.update(overrides)
+    return AsyncIOMotorClient(
+        settings.mongodb_url,
+        **{key: value for key, value in options.items() if value is not None},
+    )
 
-client = AsyncIOMotorClient(MONGODB_URL)
-client.get_io_loop = asyncio.get_event_loop
 
+@asynccontextmanager
+async def connect():
+    """Open a client for the duration of the block and yield the database"""
+    client = create_client()
+    try:
+        yield client.get_database(settings.database_name)
+    finally:
+        client.close()
+
+
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    """Route dependency returning the database opened by the app lifespan"""
+    return request.app.state.db
 
-# Async function to send a ping to confirm a successful connection
-def ping_db():
+
+async def ping(db: AsyncIOMotorDatabase, timeout: float) -> bool:
+    """Send a ping to confirm the database is reachable"""
     try:
-        # Send a ping to confirm a successful connection
-        print("checking connection")
-        client.admin.command("ping")
-        print("✓ Connected to MongoDB")
-    except Exception as e:
-        print("✗ Failed to connect to MongoDB")
-        raise e
-
-
-# Async function to get database and collections
-db = client.get_database("master")
-ping_db()
\ No newline at end of file
+        await asyncio.wait_for(db.command("ping"), timeout)
+        return True
+    except Exception:
+        return False
+
+
+async def prepare(db: AsyncIOMotorDatabase, state):
+    """Create indexes in the background, retrying until MongoDB is reachable.
+
+    ``state.indexes_ready`` is set once they exist; /ready reports on it.
+    """
+    while True:
+        try:
+            await ensure_indexes(db)
+            state.indexes_ready = True
+            print("✓ Connected to MongoDB")
+            return
+        except Exception as e:
+            print(f"✗ Failed to prepare MongoDB, retrying: {e}")
+            await asyncio.sleep(INDEX_RETRY_DELAY)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create the indexes the API relies on (no-op when they already exist)"""
+    # One attendance record per student, course and day. Legacy records
+    # without a day bucket are left out until they are backfilled.
+    await db.attendance_log.create_index(
+        [("student_id", ASCENDING), ("course_id", ASCENDING), ("day", ASCENDING)],
+        name="student_course_day_unique",
+        unique=True,
+        partialFilterExpression={"day": {"$exists": True}},
+    )
+    # Per-course statistics and date range filters
+    await db.attendance_log.create_index(
+        [("course_id", ASCENDING), ("day", ASCENDING)], name="course_day"
+    )
+    # Keyset pagination (_id order) under the list endpoint filters
+    await db.attendance_log.create_index(
+        [("student_id", ASCENDING), ("_id", ASCENDING)], name="student_id"
+    )
+    await db.attendance_log.create_index(
+        [("course_id", ASCENDING), ("_id", ASCENDING)], name="course_id"
+    )
+    # Bucketed layout (ATTENDANCE_STORAGE=buckets): one document per course
+    # and day, marks found by student or by their own id
+    await db.attendance_buckets.create_index(
+        [("course_id", ASCENDING), ("day", ASCENDING)],
+        name="course_day_unique",
+        unique=True,
+    )
+    await db.attendance_buckets.create_index(
+        [("course_id", ASCENDING), ("_id", ASCENDING)], name="course_id"
+    )
+    await db.attendance_buckets.create_index(
+        [("marks.s", ASCENDING), ("_id", ASCENDING)], name="marks_student"
+    )
+    await db.attendance_buckets.create_index([("marks.i", ASCENDING)], name="marks_id")
+    await db.students.create_index(
+        [("department_id", ASCENDING), ("_id", ASCENDING)], name="department_id"
+    )
+    await db.students.create_index(
+        [("class", ASCENDING), ("_id", ASCENDING)], name="class"
+    )
+    await db.courses.create_index(
+        [("department_id", ASCENDING), ("_id", ASCENDING)], name="department_id"
+    )
+    await db.courses.create_index(
+        [("semester", ASCENDING), ("_id", ASCENDING)], name="semester"
+    )
+    # Natural keys checked by the CSV import to skip existing records
+    await db.departments.create_index(
+        [("department_name", ASCENDING)], name="department_name"
+    )
+    await db.courses.create_index(
+        [
+            ("department_id", ASCENDING),
+            ("class", ASCENDING),
+            ("course_name", ASCENDING),
+        ],
+        name="natural_key",
+    )
+    await db.students.create_index(
+        [("department_id", ASCENDING), ("class", ASCENDING), ("full_name", ASCENDING)],
+        name="natural_key",
+    )
+    # Rollup reads: by course (per student / per day) and by student
+    await db.attendance_rollups.create_index(
+        [("course_id", ASCENDING), ("kind", ASCENDING), ("day", ASCENDING)],
+        name="course_kind_day",
+    )
+    await db.attendance_rollups.create_index(
+        [("student_id", ASCENDING), ("kind", ASCENDING)],
+        name="student_kind",
+        sparse=True,
+    )
+    # Due background cleanup jobs (app/services/attendance_cleanup.py)
+    await db.cleanup_jobs.create_index(
+        [("state", ASCENDING), ("not_before", ASCENDING)], name="state_not_before"
+    )
+    # Archived attendance (app/services/attendance_archive.py), read like the
+    # hot collections of the same layout
+    await db.attendance_archive.create_index(
+        [("student_id", ASCENDING), ("_id", ASCENDING)], name="student_id"
+    )
+    await db.attendance_archive.create_index(
+        [("course_id", ASCENDING), ("_id", ASCENDING)], name="course_id"
+    )
+    await db.attendance_archive.create_index(
+        [("course_id", ASCENDING), ("day", ASCENDING)], name="course_day"
+    )
+    await db.attendance_archive_buckets.create_index(
+        [("course_id", ASCENDING), ("day", ASCENDING)],
+        name="course_day_unique",
+        unique=True,
+    )
+    await db.attendance_archive_buckets.create_index(
+        [("course_id", ASCENDING), ("_id", ASCENDING)], name="course_id"
+    )
+    await db.attendance_archive_buckets.create_index(
+        [("marks.s", ASCENDING), ("_id", ASCENDING)], name="marks_student"
+    )
+    await db.attendance_archive_totals.create_index(
+        [("student_id", ASCENDING)], name="student_id"
+    )
+    await db.attendance_archive_totals.create_index(
+        [("course_id", ASCENDING)], name="course_id"
+    )
+    # Name prefix search (app/system/search.py), alone or within a
+    # department and class
+    await db.students.create_index([("search_name", ASCENDING)], name="search_name")
+    await db.students.create_index(
+        [
+            ("department_id", ASCENDING),
+            ("class", ASCENDING),
+            ("search_name", ASCENDING),
+        ],
+        name="department_class_search_name",
+    )
+    await db.users.create_index(
+        [("search_username", ASCENDING)], name="search_username"
+    )
@@ -0,0 +1,50 @@
+# Institution calendar helpers
+from datetime import datetime, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from app.system.config import settings
+
+INSTITUTION_TIMEZONE = ZoneInfo(settings.institution_timezone)
+
+# Query parameter pattern for day buckets
+DAY_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
+
+def day_bucket(moment: Optional[datetime] = None) -> str:
+    """Return the institution-local calendar day (YYYY-MM-DD) for a moment.
+
+    Naive datetimes are treated as UTC, matching the ``datetime.utcnow()``
+    values stored in ``updated_at``.
+    """
+    if moment is None:
+        moment = datetime.now(timezone.utc)
+    elif moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(INSTITUTION_TIMEZONE).strftime("%Y-%m-%d")
+
+
+def day_bucket_from_timestamp(timestamp: float) -> str:
+    """Return the institution-local calendar day for a unix timestamp"""
+    return day_bucket(datetime.fromtimestamp(timestamp, tz=timezone.utc))
+
+
+def day_range(from_day: Optional[str], to_day: Optional[str]) -> Optional[dict]:
+    """Return a Mongo condition on ``day`` for an inclusive range, if any"""
+    if not from_day and not to_day:
+        return None
+    condition = {}
+    if from_day:
+        condition["$gte"] = from_day
+    if to_day:
+        condition["$lte"] = to_day
+    return condition
+
+
+def day_match(query: dict, days: Optional[dict]) -> dict:
+    """``query`` narrowed to a ``day_range`` condition, when there is one.
+
+    A missing range must leave ``day`` out: ``{"day": None}`` matches no
+    attendance at all.
+    """
+    return {**query, "day": days} if days else query
@@ -0,0 +1,52 @@
+# Sparse fieldsets (?fields=)
+#
+# Read endpoints take ``fields``, a comma-separated list of response keys as
+# they appear in the JSON (e.g. ``_id,full_name``). The keys are checked
+# against the endpoint's response model and the dependency hands the handler
+# that model reduced to them (``partial_model``); handlers fetch with its
+# ``response_projection`` and serialize through it, so only the selected
+# fields leave MongoDB and go over the wire. ``_id`` is always included.
+# Anything outside the response model, password hashes in particular, cannot
+# be selected.
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+from app.models import partial_model, response_fields
+
+
+def split_fields(fields: str) -> list[str]:
+    return [key for key in map(str.strip, fields.split(",")) if key]
+
+
+def select_fields(model: type[BaseModel], keys: Iterable[str]) -> type[BaseModel]:
+    """``model`` reduced to ``keys`` (and ``_id``); ``model`` itself for all"""
+    wanted = set(keys)
+    unknown = wanted.difference(response_fields(model))
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    wanted.add("_id")
+    selected = tuple(key for key in response_fields(model) if key in wanted)
+    if selected == response_fields(model):
+        return model
+    return partial_model(model, selected)
+
+
+def sparse_fields(model: type[BaseModel]):
+    """Dependency that turns ``?fields=`` into a reduced ``model``"""
+
+    def dependency(
+        fields: Optional[str] = Query(
+            None,
+            description="Comma-separated fields to return (default all): "
+            + ", ".join(response_fields(model)),
+        ),
+    ) -> type[BaseModel]:
+        if not fields:
+            return model
+        return select_fields(model, split_fields(fields))
+
+    return dependency
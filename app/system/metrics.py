@@ -0,0 +1,293 @@
+# Request and MongoDB command instrumentation, exposed in Prometheus format
+#
+# MetricsMiddleware times every HTTP request by route template. The
+# MongoCommandMetrics listener is registered on the Motor client and times
+# every command by collection; while a request is being served it also
+# attributes the commands to that request (Motor copies the context into its
+# executor threads), which is what makes N+1 query patterns visible.
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+from pymongo import monitoring
+
+from app.system.config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {value}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for labels, series in values:
+            for bound, count in zip(self.buckets, series):
+                lines.append(
+                    f"{self.name}_bucket{_labels(names, labels + (bound,))} {count}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}"
+            )
+            lines.append(
+                f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}"
+            )
+            lines.append(
+                f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}"
+            )
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        # Callbacks refreshing gauges from other components just before render
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route and status code",
+        ("method", "route", "status"),
+    )
+)
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route",
+        ("method", "route"),
+    )
+)
+http_requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests currently being served")
+)
+http_request_mongo_commands = registry.register(
+    Histogram(
+        "http_request_mongo_commands",
+        "MongoDB commands issued per HTTP request",
+        ("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+mongo_command_duration = registry.register(
+    Histogram(
+        "mongo_command_duration_seconds",
+        "MongoDB command latency by collection and command",
+        ("collection", "command"),
+    )
+)
+mongo_command_failures = registry.register(
+    Counter(
+        "mongo_command_failures_total",
+        "Failed MongoDB commands by collection and command",
+        ("collection", "command"),
+    )
+)
+
+
+class RequestTrace:
+    """MongoDB commands issued while serving one HTTP request"""
+
+    def __init__(self):
+        self.commands: list[tuple[str, str, float]] = []
+
+    def breakdown(self) -> dict:
+        summary = defaultdict(lambda: {"count": 0, "ms": 0.0})
+        for collection, command, seconds in self.commands:
+            entry = summary[f"{collection}.{command}"]
+            entry["count"] += 1
+            entry["ms"] = round(entry["ms"] + seconds * 1000, 3)
+        return dict(summary)
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else "-"
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event) -> tuple[str, str, float]:
+        collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        seconds = event.duration_micros / 1e6
+        mongo_command_duration.observe(seconds, collection, event.command_name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.commands.append((collection, event.command_name, seconds))
+        return collection, event.command_name, seconds
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        collection, command, _ = self._finish(event)
+        mongo_command_failures.inc(collection, command)
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and Mongo commands per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            current_trace.reset(token)
+
+            # Label by route template, not raw path, to keep cardinality low
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests.inc(method, path, status)
+            http_request_duration.observe(elapsed, method, path)
+            http_request_mongo_commands.observe(len(trace.commands), method, path)
+
+            if (
+                settings.slow_request_ms is not None
+                and elapsed * 1000 >= settings.slow_request_ms
+            ):
+                print(
+                    f"⚠ Slow request {method} {scope['path']} -> {status} "
+                    f"in {elapsed * 1000:.1f}ms, "
+                    f"{len(trace.commands)} MongoDB commands: {trace.breakdown()}"
+                )
+
+
+def register_stats(name: str, help: str, source: Callable[[], Optional[dict]]):
+    """Expose a component's ``stats()`` dict as a gauge labelled by stat"""
+    gauge = registry.register(Gauge(name, help, ("stat",)))
+
+    def collect():
+        for key, value in (source() or {}).items():
+            if isinstance(value, (int, float)):
+                gauge.set(key, value=value)
+
+    registry.collectors.append(collect)
+    return gauge
@@ -0,0 +1,77 @@
+# Keyset pagination on _id for list endpoints
+import base64
+import binascii
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query, Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """``limit`` and ``cursor`` query parameters shared by list endpoints"""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(
+            None, description=f"Value of the previous page's {NEXT_CURSOR_HEADER}"
+        ),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_position_cursor(container_id: ObjectId, position: int) -> str:
+    """Cursor for an item at ``position`` inside the document ``container_id``"""
+    return f"{encode_cursor(container_id)}.{position}"
+
+
+def decode_position_cursor(cursor: str) -> tuple[ObjectId, int]:
+    container, _, position = cursor.partition(".")
+    if not position.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return decode_cursor(container), int(position)
+
+
+async def paginate(
+    collection,
+    query: dict,
+    page: PageParams,
+    response: Response,
+    projection: Optional[dict] = None,
+) -> list[dict]:
+    """Fetch one page of ``query`` in _id order.
+
+    When more documents follow, the cursor for the next page is returned in
+    the ``X-Next-Cursor`` response header.
+    """
+    if page.cursor:
+        query = {**query, "_id": {"$gt": decode_cursor(page.cursor)}}
+
+    # Read one extra document to know whether there is a next page
+    docs = (
+        await collection.find(query, projection)
+        .sort("_id", 1)
+        .limit(page.limit + 1)
+        .to_list(page.limit + 1)
+    )
+    if len(docs) > page.limit:
+        docs = docs[: page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1]["_id"])
+    return docs
@@ -0,0 +1,150 @@
+# Password hashing with scrypt, run off the event loop
+#
+# hashlib.scrypt is deliberately slow and memory hard (tens of milliseconds
+# per call). It releases the GIL, so a small thread pool keeps it from
+# stalling the event loop while bounding how much CPU logins can take.
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.system.config import settings
+
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+SALT_BYTES = 16
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashing jobs are already waiting for a worker thread"""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+
+def scrypt_hash(password: str) -> str:
+    """Hash a password into ``scrypt$n$r$p$salt$hash``"""
+    salt = os.urandom(SALT_BYTES)
+    derived = hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=SCRYPT_N,
+        r=SCRYPT_R,
+        p=SCRYPT_P,
+        dklen=SCRYPT_DKLEN,
+    )
+    return (
+        f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$"
+        f"{_b64encode(salt)}${_b64encode(derived)}"
+    )
+
+
+def is_legacy_hash(stored: str) -> bool:
+    """Unsalted SHA-256 hex digests written before scrypt was introduced"""
+    return not stored.startswith("scrypt$")
+
+
+def scrypt_verify(password: str, stored: str) -> bool:
+    if is_legacy_hash(stored):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+
+    # A malformed stored hash fails verification instead of the request
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        expected = base64.b64decode(expected, validate=True)
+        derived = hashlib.scrypt(
+            password.encode(),
+            salt=base64.b64decode(salt, validate=True),
+            n=int(n),
+            r=int(r),
+            p=int(p),
+            dklen=len(expected),
+        )
+    except (ValueError, binascii.Error) as e:
+        print(f"✗ Malformed scrypt password hash: {e}")
+        return False
+    return hmac.compare_digest(derived, expected)
+
+
+class PasswordHasher:
+    """Runs hashing jobs on a bounded thread pool and records queue time"""
+
+    def __init__(self, workers: int, max_waiting: int):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _job(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        queued = started - submitted
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+            self.queue_seconds_total += queued
+            self.queue_seconds_max = max(self.queue_seconds_max, queued)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_seconds_total += time.perf_counter() - started
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.waiting += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._job, time.perf_counter(), fn, *args
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self.run(scrypt_hash, password)
+
+    async def verify(self, password: str, stored: str) -> bool:
+        return await self.run(scrypt_verify, password, stored)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "waiting": self.waiting,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_seconds_total": round(self.queue_seconds_total, 6),
+                "queue_seconds_max": round(self.queue_seconds_max, 6),
+                "run_seconds_total": round(self.run_seconds_total, 6),
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_waiting=settings.password_hash_max_waiting,
+)
+
+# Verified against when the username does not exist, so unknown users take
+# as long to reject as wrong passwords
+DUMMY_HASH = scrypt_hash(base64.b64encode(os.urandom(SALT_BYTES)).decode())
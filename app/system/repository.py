@@ -0,0 +1,30 @@
+# Write helpers that return the stored document in a single round trip
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+
+
+async def insert_document(collection: AsyncIOMotorCollection, document: dict) -> dict:
+    """Insert a document and return it with its new _id (no read-back)"""
+    result = await collection.insert_one(document)
+    return {**document, "_id": result.inserted_id}
+
+
+async def update_document(
+    collection: AsyncIOMotorCollection,
+    document_id: str,
+    fields: dict,
+    projection: Optional[dict] = None,
+) -> Optional[dict]:
+    """``$set`` fields on a document and return it as it is after the update.
+
+    Returns None when no document has that _id.
+    """
+    return await collection.find_one_and_update(
+        {"_id": ObjectId(document_id)},
+        {"$set": fields},
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
@@ -0,0 +1,32 @@
+# Name prefix search
+#
+# Searchable names are stored a second time in normalized form (accents
+# stripped, case folded, whitespace collapsed) in a field next to the
+# original: students.search_name for full_name, users.search_username for
+# username. Writers set it with ``normalize``; searches turn the typed prefix
+# into a range on that field, which an index answers without a scan.
+import re
+import unicodedata
+
+from fastapi import HTTPException
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# Sorts after every character a normalized name can continue with
+PREFIX_END = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    """Accent-free, case-folded ``text`` with single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", stripped.casefold()).strip()
+
+
+def prefix_range(q: str) -> dict:
+    """Condition on a normalized field matching names that start with ``q``"""
+    prefix = normalize(q)
+    if not prefix:
+        raise HTTPException(status_code=400, detail="Search text is empty")
+    return {"$gte": prefix, "$lt": prefix + PREFIX_END}
@@ -0,0 +1,87 @@
+# Fast JSON path for list endpoints
+#
+# The default FastAPI path copies every document, validates it against the
+# response_model and then encodes it again. For large lists the documents
+# are instead fetched with a projection of the response fields, reshaped in
+# one pass (ObjectId -> str, missing optional fields -> null) and dumped
+# straight to JSON bytes, skipping the second validation.
+#
+# Responses reduced by ``?fields=`` (app/system/fieldsets.py) always come
+# back as a ready Response: the endpoint's full response_model would reject
+# the missing fields.
+from functools import lru_cache
+from typing import Any, Iterable, Union
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from app.models import PartialResponse, response_fields
+from app.system.config import settings
+
+try:
+    import orjson
+except ImportError:  # optional backend
+    orjson = None
+
+_rows_adapter = TypeAdapter(list[dict[str, Any]])
+
+
+def to_rows(docs: Iterable[dict], fields: tuple[str, ...]) -> list[dict]:
+    rows = []
+    for doc in docs:
+        row = {key: doc.get(key) for key in fields}
+        row["_id"] = str(doc["_id"])
+        rows.append(row)
+    return rows
+
+
+def dump_json(rows: list[dict]) -> bytes:
+    if settings.json_backend == "orjson" and orjson is not None:
+        return orjson.dumps(rows)
+    return _rows_adapter.dump_json(rows)
+
+
+@lru_cache
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+def list_response(
+    docs: list[dict], model: type[BaseModel], response: Response
+) -> Union[Response, list[dict]]:
+    """Serialize documents for a list endpoint declared with ``response_model``.
+
+    Headers already set on the injected ``response`` (e.g. the next-page
+    cursor) are carried over to the returned response.
+    """
+    if not settings.fast_serialization and not issubclass(model, PartialResponse):
+        return [{**doc, "_id": str(doc["_id"])} for doc in docs]
+
+    rows = to_rows(docs, response_fields(model))
+    if settings.fast_serialization:
+        content = dump_json(rows)
+    else:
+        adapter = _list_adapter(model)
+        content = adapter.dump_json(adapter.validate_python(rows), by_alias=True)
+
+    return Response(content, media_type="application/json", headers=_headers(response))
+
+
+def item_response(
+    doc: dict, model: type[BaseModel], response: Response
+) -> Union[Response, dict]:
+    """Serialize a document for an item endpoint declared with ``response_model``"""
+    item = {**doc, "_id": str(doc["_id"])}
+    if not issubclass(model, PartialResponse):
+        return item
+    return Response(
+        model.model_validate(item).model_dump_json(by_alias=True),
+        media_type="application/json",
+        headers=_headers(response),
+    )
+
+
+def _headers(response: Response) -> dict:
+    return {
+        key: value for key, value in response.headers.items() if key != "content-length"
+    }
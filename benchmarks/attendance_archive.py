@@ -0,0 +1,126 @@
+"""Hot-path attendance latency before and after archiving old years.
+
+Seeds several years of daily attendance, measures the current-term reads
+(a student's and a course's history since the start of the term, ranged
+per-student stats) and a full student history, archives everything but the
+last --keep-days days, then measures again. Also reports the size of the
+hot collection and of the archive.
+
+By default this runs on the in-memory stand-in; use ``--backend mongo`` for
+real numbers from the MongoDB at MONGODB_URL.
+
+    python -m benchmarks.attendance_archive --students 2000 --years 3 --keep-days 120
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from datetime import date, timedelta
+
+from fastapi import Response
+
+from app.routers.attendance import aggregate_stats
+from app.services.attendance_archive import (
+    ARCHIVES,
+    archive_attendance,
+    history_page,
+)
+from app.system.cache import reference_cache
+from app.system.config import settings
+from app.system.database import create_client
+from app.system.pagination import PageParams
+from benchmarks import seed as seeding
+from benchmarks.attendance_storage import COLLECTIONS, timed
+from benchmarks.fake_mongo import FakeMongoClient
+
+BENCH_DATABASE = "attendance_archive_bench"
+
+
+async def collection_size(db, name: str) -> dict:
+    stats = await db.command("collStats", name)
+    return {
+        "documents": stats["count"],
+        "data_bytes": stats["size"],
+        "index_bytes": stats["totalIndexSize"],
+    }
+
+
+async def measure(db, dataset, term_start: str, args) -> dict:
+    rng = random.Random(args.seed)
+    course_id = rng.choice(dataset.courses)
+    student_id = rng.choice(dataset.students)
+    week = dataset.days[-7:]
+
+    def page(query: dict, limit: int):
+        return lambda: history_page(db, query, PageParams(limit, None), Response())
+
+    return {
+        "hot": await collection_size(db, COLLECTIONS[settings.attendance_storage]),
+        "student_term_page_100_ms": await timed(
+            page({"student_id": student_id, "day": {"$gte": term_start}}, 100),
+            args.rounds,
+        ),
+        "course_term_page_1000_ms": await timed(
+            page({"course_id": course_id, "day": {"$gte": term_start}}, 1000),
+            args.rounds,
+        ),
+        "stats_week_by_student_ms": await timed(
+            lambda: aggregate_stats(db, course_id, week[0], week[-1]), args.rounds
+        ),
+        "student_full_history_page_100_ms": await timed(
+            page({"student_id": student_id}, 100), args.rounds
+        ),
+    }
+
+
+async def main(args):
+    settings.attendance_storage = args.layout
+    settings.attendance_archive_layout = args.archive_layout
+    client = FakeMongoClient() if args.backend == "fake" else create_client()
+    await client.drop_database(BENCH_DATABASE)
+    db = client[BENCH_DATABASE]
+    try:
+        dataset = await seeding.seed(
+            db,
+            departments=args.departments,
+            courses_per_class=args.courses_per_class,
+            students=args.students,
+            days=args.years * 365,
+            seed=args.seed,
+        )
+        cutoff = date.fromisoformat(dataset.days[-1]) - timedelta(days=args.keep_days)
+        term_start = (cutoff + timedelta(days=1)).isoformat()
+
+        before = await measure(db, dataset, term_start, args)
+        archived = await archive_attendance(
+            db, cutoff.isoformat(), args.batch_size, settle=0
+        )
+        reference_cache.clear()
+        after = await measure(db, dataset, term_start, args)
+        archive = await collection_size(db, ARCHIVES[args.archive_layout])
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    report = {
+        "marks": dataset.attendance_rows,
+        "archived": archived,
+        "archive": archive,
+        "before": before,
+        "after": after,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "mongo"), default="fake")
+    seeding.add_arguments(parser)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--keep-days", type=int, default=120)
+    parser.add_argument("--layout", choices=tuple(COLLECTIONS), default="log")
+    parser.add_argument("--archive-layout", choices=tuple(ARCHIVES), default="buckets")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""Compare in-Python stats counting with aggregation and rollup reads.
+
+Seeds one course with N attendance rows for each requested size and times
+the previous ``to_list`` + generator count, then the course totals and the
+per-student breakdown each counted with a ``$group`` pipeline and read from
+the rollups by ``get_attendance_stats``.
+
+    python -m benchmarks.attendance_stats --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from app.commands.rebuild_rollups import reconcile
+from app.routers import attendance
+from app.system.database import create_client, ensure_indexes
+
+BENCH_DATABASE = "attendance_bench"
+STUDENTS_PER_COURSE = 120
+INSERT_BATCH = 10_000
+
+
+async def seed(db, course_id: str, rows: int):
+    await db.attendance_log.delete_many({})
+    start = date(2025, 1, 1)
+    batch = []
+    for i in range(rows):
+        day = start + timedelta(days=i // STUDENTS_PER_COURSE)
+        batch.append(
+            {
+                "student_id": f"student-{i % STUDENTS_PER_COURSE}",
+                "course_id": course_id,
+                "present": i % 4 != 0,
+                "day": day.isoformat(),
+            }
+        )
+        if len(batch) == INSERT_BATCH:
+            await db.attendance_log.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.attendance_log.insert_many(batch, ordered=False)
+
+
+async def python_count(db, course_id: str):
+    records = await db.attendance_log.find({"course_id": course_id}).to_list(None)
+    return sum(1 for r in records if r["present"])
+
+
+async def course_aggregation(db, course_id: str):
+    """Course totals counted from the records, as stats did before rollups"""
+    pipeline = [
+        {"$match": {"course_id": course_id}},
+        {
+            "$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "present": {"$sum": {"$cond": ["$present", 1, 0]}},
+            }
+        },
+    ]
+    return await db.attendance_log.aggregate(pipeline).to_list(None)
+
+
+def rollup_stats(db, course_id: str, by_student: bool):
+    return attendance.get_attendance_stats(
+        course_id, from_day=None, to_day=None, by_student=by_student, db=db
+    )
+
+
+async def timed(fn, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+async def main(sizes: list[int], rounds: int):
+    client = create_client()
+    db = client[BENCH_DATABASE]
+    report = []
+
+    try:
+        course = await db.courses.insert_one({"course_name": "Bench 101"})
+        course_id = str(course.inserted_id)
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db, course_id, size)
+            await reconcile(db)
+            report.append(
+                {
+                    "rows": size,
+                    "python_ms": await timed(
+                        lambda: python_count(db, course_id), rounds
+                    ),
+                    "aggregation_ms": await timed(
+                        lambda: course_aggregation(db, course_id), rounds
+                    ),
+                    "rollup_ms": await timed(
+                        lambda: rollup_stats(db, course_id, False), rounds
+                    ),
+                    "student_aggregation_ms": await timed(
+                        lambda: attendance.aggregate_stats(db, course_id, None, None),
+                        rounds,
+                    ),
+                    "student_rollup_ms": await timed(
+                        lambda: rollup_stats(db, course_id, True), rounds
+                    ),
+                }
+            )
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.rounds))
@@ -0,0 +1,116 @@
+"""Compare the log and bucketed attendance layouts: size and read latency.
+
+Seeds the same generated institution once per layout and reports document
+count, data and index size per mark (from collStats), and median latency of
+a ranged per-student stats query, a course history page, a student history
+page and a full course export.
+
+By default this runs on the in-memory stand-in, whose sizes are uncompressed
+BSON with estimated index sizes; use ``--backend mongo`` for real on-disk
+numbers from the MongoDB at MONGODB_URL.
+
+    python -m benchmarks.attendance_storage --students 5000 --days 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from fastapi import Response
+
+from app.routers.attendance import aggregate_stats
+from app.services.attendance_store import BUCKETS, LOG, attendance_store
+from app.system.config import settings
+from app.system.database import create_client
+from app.system.pagination import PageParams
+from benchmarks import seed as seeding
+from benchmarks.fake_mongo import FakeMongoClient
+
+BENCH_DATABASE = "attendance_bench"
+COLLECTIONS = {LOG: "attendance_log", BUCKETS: "attendance_buckets"}
+
+
+async def timed(fn, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+async def export_course(store, course_id: str):
+    async for _ in store.find({"course_id": course_id}, 1000):
+        pass
+
+
+async def measure(db, layout: str, args) -> dict:
+    settings.attendance_storage = layout
+    dataset = await seeding.seed(
+        db,
+        departments=args.departments,
+        courses_per_class=args.courses_per_class,
+        students=args.students,
+        days=args.days,
+        seed=args.seed,
+    )
+    store = attendance_store(db)
+    stats = await db.command("collStats", COLLECTIONS[layout])
+    marks = dataset.attendance_rows
+
+    rng = random.Random(args.seed)
+    course_id = rng.choice(dataset.courses)
+    student_id = rng.choice(dataset.students)
+    week = dataset.days[-7:]
+
+    return {
+        "layout": layout,
+        "marks": marks,
+        "documents": stats["count"],
+        "data_bytes": stats["size"],
+        "index_bytes": stats["totalIndexSize"],
+        "data_bytes_per_mark": round(stats["size"] / marks, 1),
+        "index_bytes_per_mark": round(stats["totalIndexSize"] / marks, 1),
+        "stats_week_by_student_ms": await timed(
+            lambda: aggregate_stats(db, course_id, week[0], week[-1]), args.rounds
+        ),
+        "course_page_1000_ms": await timed(
+            lambda: store.page(
+                {"course_id": course_id}, PageParams(1000, None), Response()
+            ),
+            args.rounds,
+        ),
+        "student_page_100_ms": await timed(
+            lambda: store.page(
+                {"student_id": student_id}, PageParams(100, None), Response()
+            ),
+            args.rounds,
+        ),
+        "course_export_ms": await timed(
+            lambda: export_course(store, course_id), args.rounds
+        ),
+    }
+
+
+async def main(args):
+    client = FakeMongoClient() if args.backend == "fake" else create_client()
+    report = []
+    try:
+        for layout in (LOG, BUCKETS):
+            await client.drop_database(BENCH_DATABASE)
+            report.append(await measure(client[BENCH_DATABASE], layout, args))
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "mongo"), default="fake")
+    seeding.add_arguments(parser)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Compare N single attendance marks against one bulk roll-call.
+
+Runs the attendance handlers in-process against the MongoDB at MONGODB_URL,
+using a scratch database that is dropped afterwards.
+
+    python -m benchmarks.bulk_attendance --students 120 --rounds 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+
+from app.models import AttendanceBulkCreate, AttendanceCreate
+from app.routers import attendance
+from app.system.database import create_client, ensure_indexes
+
+BENCH_DATABASE = "attendance_bench"
+
+
+async def seed(db, students: int):
+    course = await db.courses.insert_one(
+        {"course_name": "Bench 101", "updated_at": datetime.utcnow()}
+    )
+    result = await db.students.insert_many(
+        [{"full_name": f"Student {i}", "class": "A"} for i in range(students)]
+    )
+    return str(course.inserted_id), [str(i) for i in result.inserted_ids]
+
+
+async def single_marks(db, course_id: str, student_ids: list[str]) -> float:
+    start = time.perf_counter()
+    for student_id in student_ids:
+        await attendance.mark_attendance(
+            AttendanceCreate(student_id=student_id, course_id=course_id, present=True),
+            db=db,
+            batcher=None,
+        )
+    return time.perf_counter() - start
+
+
+async def bulk_mark(db, course_id: str, student_ids: list[str]) -> float:
+    roll_call = AttendanceBulkCreate(
+        course_id=course_id,
+        entries=[{"student_id": sid, "present": True} for sid in student_ids],
+    )
+    start = time.perf_counter()
+    await attendance.bulk_mark_attendance(roll_call, db=db)
+    return time.perf_counter() - start
+
+
+async def main(students: int, rounds: int):
+    client = create_client()
+    db = client[BENCH_DATABASE]
+    await ensure_indexes(db)
+    timings = {"single": [], "bulk": []}
+
+    try:
+        course_id, student_ids = await seed(db, students)
+        for _ in range(rounds):
+            await db.attendance_log.delete_many({})
+            timings["single"].append(await single_marks(db, course_id, student_ids))
+            await db.attendance_log.delete_many({})
+            timings["bulk"].append(await bulk_mark(db, course_id, student_ids))
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    report = {
+        "students": students,
+        "rounds": rounds,
+        **{
+            name: {
+                "median_ms": round(statistics.median(values) * 1000, 2),
+                "marks_per_sec": round(students / statistics.median(values), 1),
+            }
+            for name, values in timings.items()
+        },
+    }
+    report["speedup"] = round(
+        report["single"]["median_ms"] / report["bulk"]["median_ms"], 1
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=120)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.students, args.rounds))
@@ -0,0 +1,1306 @@
+"""In-memory stand-in for the Motor client, for benchmarks without MongoDB.
+
+Implements the subset of the Motor API the app uses: ``find`` cursors
+(sort/skip/limit/batch_size, async iteration, ``to_list``), ``find_one``,
+``insert_one``/``insert_many``, ``update_one``/``update_many``,
+``replace_one``, ``delete_one``/``delete_many``, ``find_one_and_update``/
+``find_one_and_delete``, ``bulk_write``, ``aggregate``, ``count_documents``,
+``distinct``, ``create_index`` (unique, sparse and partial indexes are
+enforced) and ``command("ping")``.
+
+Documents live in plain dicts. The leading field of every index gets a hash
+lookup so equality and ``$in`` queries on indexed fields do not scan the whole
+collection; everything else is a scan. Every operation yields to the event
+loop once, like a driver round trip would.
+
+    from benchmarks.fake_mongo import FakeMongoClient
+    db = FakeMongoClient()["attendance_bench"]
+"""
+
+import asyncio
+import heapq
+import math
+import re
+from datetime import datetime
+from functools import cmp_to_key
+from itertools import chain
+
+import bson
+from bson import ObjectId
+from pymongo import (
+    DeleteMany,
+    DeleteOne,
+    InsertOne,
+    ReplaceOne,
+    UpdateMany,
+    UpdateOne,
+)
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+from app.system.database import DUPLICATE_KEY_ERROR
+
+MISSING = object()
+
+# Documents handed out per event loop yield while iterating a cursor
+ITERATION_BATCH = 101
+
+
+async def round_trip():
+    await asyncio.sleep(0)
+
+
+def copy_value(value):
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def get_path(doc, path: str):
+    """Value at a dotted path; crossing an array collects every element's value"""
+    return walk(doc, path.split("."))
+
+
+def walk(value, parts: list):
+    for n, part in enumerate(parts):
+        if isinstance(value, dict):
+            if part not in value:
+                return MISSING
+            value = value[part]
+        elif isinstance(value, list):
+            if part.isdigit():
+                if int(part) >= len(value):
+                    return MISSING
+                value = value[int(part)]
+                continue
+            found = [walk(item, parts[n:]) for item in value if isinstance(item, dict)]
+            found = [item for item in found if item is not MISSING]
+            return found or MISSING
+        else:
+            return MISSING
+    return value
+
+
+def resolve_paths(doc, path: str, array_filters) -> list[str]:
+    """Expand ``$[]`` and ``$[name]`` (arrayFilters) into concrete paths"""
+    if "$[" not in path:
+        return [path]
+    paths = [[]]
+    for part in path.split("."):
+        if not part.startswith("$["):
+            paths = [prefix + [part] for prefix in paths]
+            continue
+        name = part[2:-1]
+        expanded = []
+        for prefix in paths:
+            array = get_path(doc, ".".join(prefix))
+            if not isinstance(array, list):
+                continue
+            for index, item in enumerate(array):
+                wrapped = {name: item}
+                if name and not all(
+                    matches(wrapped, f)
+                    for f in array_filters or ()
+                    if next(iter(f)).split(".")[0] == name
+                ):
+                    continue
+                expanded.append(prefix + [str(index)])
+        paths = expanded
+    return [".".join(parts) for parts in paths]
+
+
+def set_path(doc, path: str, value):
+    *parents, last = path.split(".")
+    target = doc
+    for part in parents:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        index = int(last)
+        target.extend([None] * (index + 1 - len(target)))
+        target[index] = value
+    else:
+        target[last] = value
+
+
+def unset_path(doc, path: str):
+    *parents, last = path.split(".")
+    target = get_path(doc, ".".join(parents)) if parents else doc
+    if isinstance(target, dict):
+        target.pop(last, None)
+    elif isinstance(target, list) and last.isdigit() and int(last) < len(target):
+        target[int(last)] = None
+
+
+# Comparison and sorting follow MongoDB's cross-type order
+def type_rank(value) -> int:
+    if value is MISSING or value is None:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime):
+        return 8
+    return 9
+
+
+def compare(a, b) -> int:
+    rank_a, rank_b = type_rank(a), type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 0:
+        return 0
+    if rank_a == 3:
+        a, b = list(a.items()), list(b.items())
+    try:
+        return -1 if a < b else (1 if a > b else 0)
+    except TypeError:
+        return 0
+
+
+sort_key = cmp_to_key(compare)
+
+
+def values_equal(value, target) -> bool:
+    if value is MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(values_equal(item, target) for item in value)
+    if isinstance(value, bool) != isinstance(target, bool):
+        return False
+    return value == target
+
+
+def ordered(op):
+    def check(value, target):
+        if isinstance(value, list) and not isinstance(target, list):
+            return any(check(item, target) for item in value)
+        if value is MISSING or type_rank(value) != type_rank(target):
+            return False
+        return op(compare(value, target))
+
+    return check
+
+
+def regex_match(value, pattern, options=""):
+    if not isinstance(value, str):
+        return False
+    if isinstance(pattern, str):
+        flags = re.IGNORECASE if "i" in options else 0
+        pattern = re.compile(pattern, flags)
+    return pattern.search(value) is not None
+
+
+QUERY_OPERATORS = {
+    "$eq": values_equal,
+    "$ne": lambda value, target: not values_equal(value, target),
+    "$gt": ordered(lambda c: c > 0),
+    "$gte": ordered(lambda c: c >= 0),
+    "$lt": ordered(lambda c: c < 0),
+    "$lte": ordered(lambda c: c <= 0),
+    "$in": lambda value, targets: any(values_equal(value, t) for t in targets),
+    "$nin": lambda value, targets: not any(values_equal(value, t) for t in targets),
+    "$exists": lambda value, flag: (value is not MISSING) == bool(flag),
+    "$size": lambda value, size: isinstance(value, list) and len(value) == size,
+}
+
+
+def is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and next(iter(value)).startswith("$")
+
+
+def matches(doc, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$expr":
+            if not truthy(evaluate(condition, doc)):
+                return False
+        elif not condition_matches(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def condition_matches(value, condition) -> bool:
+    if isinstance(condition, re.Pattern):
+        return regex_match(value, condition)
+    if not is_operator_dict(condition):
+        return values_equal(value, condition)
+    for op, target in condition.items():
+        if op == "$regex":
+            if not regex_match(value, target, condition.get("$options", "")):
+                return False
+        elif op == "$options":
+            continue
+        elif op == "$not":
+            if condition_matches(value, target):
+                return False
+        elif op == "$elemMatch":
+            if not isinstance(value, list) or not any(
+                (
+                    matches(item, target)
+                    if not is_operator_dict(target)
+                    else condition_matches(item, target)
+                )
+                for item in value
+            ):
+                return False
+        elif op in QUERY_OPERATORS:
+            if not QUERY_OPERATORS[op](value, target):
+                return False
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported")
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy_value(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(fields.values()):
+        result = {"_id": doc["_id"]} if include_id and "_id" in doc else {}
+        for field, spec in fields.items():
+            value = get_path(doc, field)
+            if isinstance(spec, dict) and "$elemMatch" in spec:
+                # Only the first array element matching the condition
+                value = next(
+                    (
+                        [item]
+                        for item in (value if isinstance(value, list) else [])
+                        if matches(item, spec["$elemMatch"])
+                    ),
+                    MISSING,
+                )
+            if value is not MISSING:
+                set_path(result, field, copy_value(value))
+        return result
+    result = copy_value(doc)
+    for field in fields:
+        unset_path(result, field)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def sort_documents(docs: list, spec, limit: int = 0) -> list:
+    spec = normalize_keys(spec)
+    if limit and len(spec) == 1:
+        field, direction = spec[0]
+        pick = heapq.nsmallest if direction > 0 else heapq.nlargest
+        return pick(limit, docs, key=lambda doc: sort_key(get_path(doc, field)))
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda doc: sort_key(get_path(doc, field)), reverse=direction < 0)
+    return docs[:limit] if limit else docs
+
+
+def normalize_keys(keys) -> list:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [(key, direction) for key, direction in keys]
+
+
+# Updates
+def apply_update(doc: dict, update: dict, inserting=False, array_filters=None):
+    for op, fields in update.items():
+        if op in ("$set", "$setOnInsert"):
+            if op == "$setOnInsert" and not inserting:
+                continue
+            for path, value in fields.items():
+                for concrete in resolve_paths(doc, path, array_filters):
+                    set_path(doc, concrete, copy_value(value))
+        elif op == "$unset":
+            for path in fields:
+                for concrete in resolve_paths(doc, path, array_filters):
+                    unset_path(doc, concrete)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                for concrete in resolve_paths(doc, path, array_filters):
+                    current = get_path(doc, concrete)
+                    set_path(
+                        doc, concrete, (0 if current is MISSING else current) + amount
+                    )
+        elif op in ("$min", "$max"):
+            for path, value in fields.items():
+                current = get_path(doc, path)
+                keep = (
+                    compare(value, current) < 0
+                    if op == "$min"
+                    else compare(value, current) > 0
+                )
+                if current is MISSING or keep:
+                    set_path(doc, path, copy_value(value))
+        elif op in ("$push", "$addToSet"):
+            for path, value in fields.items():
+                items = (
+                    value["$each"]
+                    if isinstance(value, dict) and "$each" in value
+                    else [value]
+                )
+                current = get_path(doc, path)
+                if current is MISSING:
+                    current = []
+                    set_path(doc, path, current)
+                for item in items:
+                    if op == "$push" or item not in current:
+                        current.append(copy_value(item))
+        elif op == "$pull":
+            for path, target in fields.items():
+                current = get_path(doc, path)
+                if isinstance(current, list):
+                    current[:] = [
+                        item
+                        for item in current
+                        if not (
+                            matches(item, target)
+                            if isinstance(item, dict)
+                            and isinstance(target, dict)
+                            and not is_operator_dict(target)
+                            else (
+                                condition_matches(item, target)
+                                if is_operator_dict(target)
+                                else values_equal(item, target)
+                            )
+                        )
+                    ]
+        else:
+            raise NotImplementedError(f"Update operator {op} is not supported")
+
+
+def upsert_seed(query: dict) -> dict:
+    """The document an upsert starts from: the query's equality fields"""
+    doc = {}
+    for key, value in query.items():
+        if key.startswith("$"):
+            continue
+        if is_operator_dict(value):
+            if "$eq" in value:
+                set_path(doc, key, copy_value(value["$eq"]))
+            continue
+        set_path(doc, key, copy_value(value))
+    return doc
+
+
+# Aggregation expressions
+def truthy(value) -> bool:
+    return not (value is MISSING or value is None or value is False or value == 0)
+
+
+def evaluate(expression, doc):
+    if isinstance(expression, str) and expression.startswith("$$"):
+        return doc if expression == "$$ROOT" else MISSING
+    if isinstance(expression, str) and expression.startswith("$"):
+        return get_path(doc, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not is_operator_dict(expression):
+        return {key: plain(evaluate(value, doc)) for key, value in expression.items()}
+
+    ((op, args),) = expression.items()
+    if op == "$literal":
+        return args
+    if op == "$cond":
+        if isinstance(args, dict):
+            args = [args["if"], args["then"], args["else"]]
+        condition, then, otherwise = args
+        return evaluate(then if truthy(evaluate(condition, doc)) else otherwise, doc)
+    if op == "$ifNull":
+        *candidates, fallback = args
+        for candidate in candidates:
+            value = evaluate(candidate, doc)
+            if value is not MISSING and value is not None:
+                return value
+        return evaluate(fallback, doc)
+
+    values = [
+        plain(v) for v in evaluate(args if isinstance(args, list) else [args], doc)
+    ]
+    if op in EXPRESSION_OPERATORS:
+        return EXPRESSION_OPERATORS[op](*values)
+    raise NotImplementedError(f"Expression operator {op} is not supported")
+
+
+def plain(value):
+    return None if value is MISSING else value
+
+
+def divide(a, b):
+    return None if a is None or b in (None, 0) else a / b
+
+
+def array_sum(*values):
+    if len(values) == 1 and isinstance(values[0], list):
+        values = values[0]
+    return sum(
+        v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)
+    )
+
+
+EXPRESSION_OPERATORS = {
+    "$eq": lambda a, b: compare(a, b) == 0 and type_rank(a) == type_rank(b),
+    "$ne": lambda a, b: not (compare(a, b) == 0 and type_rank(a) == type_rank(b)),
+    "$gt": lambda a, b: compare(a, b) > 0,
+    "$gte": lambda a, b: compare(a, b) >= 0,
+    "$lt": lambda a, b: compare(a, b) < 0,
+    "$lte": lambda a, b: compare(a, b) <= 0,
+    "$and": lambda *values: all(truthy(v) for v in values),
+    "$or": lambda *values: any(truthy(v) for v in values),
+    "$not": lambda value: not truthy(value),
+    "$add": lambda *values: sum(values),
+    "$subtract": lambda a, b: a - b,
+    "$multiply": lambda *values: math.prod(values),
+    "$divide": divide,
+    "$sum": array_sum,
+    "$size": lambda value: len(value),
+    "$toString": lambda value: None if value is None else str(value),
+    "$toObjectId": lambda value: ObjectId(value),
+    "$in": lambda value, items: value in items,
+    "$concat": lambda *values: None if None in values else "".join(values),
+    "$substrCP": lambda value, start, length: value[start : start + length],
+    "$toLower": lambda value: (value or "").lower(),
+    "$round": lambda value, places=0: None if value is None else round(value, places),
+}
+
+
+class Accumulator:
+    def __init__(self, op: str, expression):
+        self.op = op
+        self.expression = expression
+
+    def initial(self):
+        return {
+            "$sum": 0,
+            "$push": [],
+            "$addToSet": [],
+            "$avg": (0, 0),
+            "$count": 0,
+        }.get(self.op, MISSING)
+
+    def add(self, state, doc):
+        if self.op == "$count":
+            return state + 1
+        value = evaluate(self.expression, doc)
+        if self.op == "$sum":
+            return state + (
+                value
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+                else 0
+            )
+        if self.op == "$avg":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return state[0] + value, state[1] + 1
+            return state
+        if self.op == "$push":
+            state.append(plain(value))
+            return state
+        if self.op == "$addToSet":
+            if plain(value) not in state:
+                state.append(plain(value))
+            return state
+        if self.op == "$first":
+            return plain(value) if state is MISSING else state
+        if self.op == "$last":
+            return plain(value)
+        if self.op in ("$min", "$max"):
+            if value is MISSING or value is None:
+                return state
+            if state is MISSING:
+                return value
+            better = (
+                compare(value, state) < 0
+                if self.op == "$min"
+                else compare(value, state) > 0
+            )
+            return value if better else state
+        raise NotImplementedError(f"Accumulator {self.op} is not supported")
+
+    def result(self, state):
+        if self.op == "$avg":
+            return state[0] / state[1] if state[1] else None
+        return plain(state)
+
+
+def group_stage(docs, spec: dict) -> list:
+    key_expression = spec["_id"]
+    accumulators = {
+        field: Accumulator(*next(iter(definition.items())))
+        for field, definition in spec.items()
+        if field != "_id"
+    }
+    groups = {}
+    for doc in docs:
+        key = plain(evaluate(key_expression, doc))
+        hashable = hashable_key(key)
+        state = groups.get(hashable)
+        if state is None:
+            state = groups[hashable] = [
+                key,
+                {field: acc.initial() for field, acc in accumulators.items()},
+            ]
+        values = state[1]
+        for field, acc in accumulators.items():
+            values[field] = acc.add(values[field], doc)
+    return [
+        {
+            "_id": key,
+            **{field: accumulators[field].result(v) for field, v in values.items()},
+        }
+        for key, values in groups.values()
+    ]
+
+
+def hashable_key(value):
+    if isinstance(value, dict):
+        return tuple((key, hashable_key(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(hashable_key(item) for item in value)
+    return value
+
+
+def project_stage(docs, spec: dict) -> list:
+    if all(value in (0, 1) for value in spec.values()):
+        return [project(doc, spec) for doc in docs]
+    result = []
+    for doc in docs:
+        out = {"_id": doc.get("_id")} if spec.get("_id", 1) not in (0, False) else {}
+        for key, value in spec.items():
+            if key == "_id" and value in (0, False, 1, True):
+                continue
+            if value in (1, True):
+                field = get_path(doc, key)
+                if field is not MISSING:
+                    out[key] = copy_value(field)
+            else:
+                field = evaluate(value, doc)
+                if field is not MISSING:
+                    out[key] = field
+        result.append(out)
+    return result
+
+
+def unwind_stage(docs, spec) -> list:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    result = []
+    for doc in docs:
+        value = get_path(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = copy_value(doc)
+                set_path(unwound, path, item)
+                result.append(unwound)
+        elif keep_empty or (
+            value is not MISSING and value is not None and not isinstance(value, list)
+        ):
+            result.append(doc)
+    return result
+
+
+class FakeCursor:
+    """Chainable find cursor; the query runs on first read"""
+
+    def __init__(
+        self,
+        collection,
+        filter=None,
+        projection=None,
+        sort=None,
+        skip=0,
+        limit=0,
+        **kwargs,
+    ):
+        self.collection = collection
+        self.filter = normalize_filter(filter)
+        self.projection = projection
+        self._sort = normalize_keys(sort) if sort else None
+        self._skip = skip
+        self._limit = limit
+        self._results = None
+
+    def sort(self, key, direction=None):
+        self._sort = (
+            [(key, direction or 1)] if isinstance(key, str) else normalize_keys(key)
+        )
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    async def close(self):
+        self._results = iter(())
+
+    def _run(self) -> list:
+        docs = [
+            doc
+            for doc in self.collection._candidates(self.filter)
+            if matches(doc, self.filter)
+        ]
+        window = self._skip + self._limit if self._limit else 0
+        if self._sort:
+            docs = sort_documents(docs, self._sort, window)
+        docs = docs[self._skip : window or None]
+        return [project(doc, self.projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        await round_trip()
+        if self._results is None:
+            self._results = iter(self._run())
+        if length:
+            return [doc for _, doc in zip(range(length), self._results)]
+        return list(self._results)
+
+    def __aiter__(self):
+        self._served = 0
+        return self
+
+    async def __anext__(self):
+        if self._results is None or self._served % ITERATION_BATCH == 0:
+            await round_trip()
+        if self._results is None:
+            self._results = iter(self._run())
+        self._served += 1
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeAggregateCursor(FakeCursor):
+    def __init__(self, collection, pipeline: list):
+        super().__init__(collection)
+        self.pipeline = pipeline
+
+    def _run(self) -> list:
+        pipeline = list(self.pipeline)
+        if pipeline and "$match" in pipeline[0]:
+            query = pipeline.pop(0)["$match"]
+            docs = [d for d in self.collection._candidates(query) if matches(d, query)]
+        else:
+            docs = list(self.collection._docs.values())
+        for stage in pipeline:
+            ((name, spec),) = stage.items()
+            docs = self.collection.database._stage(name, spec, docs)
+        return [copy_value(doc) for doc in docs]
+
+
+def normalize_filter(filter) -> dict:
+    if filter is None:
+        return {}
+    if not isinstance(filter, dict):
+        return {"_id": filter}
+    return filter
+
+
+class Index:
+    def __init__(self, name: str, keys: list, unique=False, sparse=False, partial=None):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.sparse = sparse
+        self.partial = partial
+        self.entries = {}
+
+    def covers(self, doc) -> bool:
+        if self.partial and not matches(doc, self.partial):
+            return False
+        if self.sparse and all(get_path(doc, f) is MISSING for f, _ in self.keys):
+            return False
+        return True
+
+    def key(self, doc):
+        return tuple(hashable_key(plain(get_path(doc, f))) for f, _ in self.keys)
+
+    def entry_bytes(self, doc) -> int:
+        """Approximate bytes this index spends on a document: one key per
+        array element for multikey fields, plus a record id each"""
+        if not self.covers(doc):
+            return 0
+        values = [plain(get_path(doc, f)) for f, _ in self.keys]
+        entries = math.prod(len(v) for v in values if isinstance(v, list) and v)
+        sample = [v[0] if isinstance(v, list) and v else v for v in values]
+        key = {str(n): value for n, value in enumerate(sample)}
+        return entries * (len(bson.encode(key)) + 8)
+
+    def info(self) -> dict:
+        info = {"key": self.keys}
+        if self.unique:
+            info["unique"] = True
+        if self.sparse:
+            info["sparse"] = True
+        if self.partial:
+            info["partialFilterExpression"] = self.partial
+        return info
+
+
+def lookup_values(doc, field: str) -> list:
+    value = plain(get_path(doc, field))
+    values = value if isinstance(value, list) else [value]
+    return list(dict.fromkeys(map(hashable_key, values)))
+
+
+class FakeCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._indexes = {"_id_": Index("_id_", [("_id", 1)])}
+        # Leading field of each index -> value -> {_id: doc}; a document
+        # holding an array there is filed under each element (multikey)
+        self._lookups = {}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # Index maintenance
+    def _check_unique(self, doc, replacing=MISSING):
+        for index in self._indexes.values():
+            if not (index.unique and index.covers(doc)):
+                continue
+            owner = index.entries.get(index.key(doc))
+            if owner is not None and owner != replacing:
+                message = (
+                    f"E11000 duplicate key error collection: {self.full_name} "
+                    f"index: {index.name} dup key: {index.key(doc)}"
+                )
+                raise DuplicateKeyError(
+                    message,
+                    DUPLICATE_KEY_ERROR,
+                    {"code": DUPLICATE_KEY_ERROR, "errmsg": message},
+                )
+
+    def _index(self, doc):
+        for index in self._indexes.values():
+            if index.unique and index.covers(doc):
+                index.entries[index.key(doc)] = doc["_id"]
+        for field, lookup in self._lookups.items():
+            for value in lookup_values(doc, field):
+                lookup.setdefault(value, {})[doc["_id"]] = doc
+
+    def _unindex(self, doc):
+        for index in self._indexes.values():
+            if index.unique and index.covers(doc):
+                index.entries.pop(index.key(doc), None)
+        for field, lookup in self._lookups.items():
+            for value in lookup_values(doc, field):
+                bucket = lookup.get(value)
+                if bucket is not None:
+                    bucket.pop(doc["_id"], None)
+                    if not bucket:
+                        del lookup[value]
+
+    def _candidates(self, query: dict):
+        """Documents that may match: a hash lookup when the query allows it"""
+        _id = query.get("_id", MISSING)
+        if _id is not MISSING and not is_operator_dict(_id):
+            doc = self._docs.get(_id)
+            return [doc] if doc is not None else []
+        if isinstance(_id, dict) and set(_id) == {"$in"}:
+            return [self._docs[i] for i in dict.fromkeys(_id["$in"]) if i in self._docs]
+        for field, lookup in self._lookups.items():
+            if field not in query:
+                continue
+            condition = query[field]
+            if not is_operator_dict(condition) and not isinstance(
+                condition, (list, dict, re.Pattern)
+            ):
+                return list(lookup.get(condition, {}).values())
+            if isinstance(condition, dict) and set(condition) == {"$in"}:
+                return list(
+                    chain.from_iterable(
+                        lookup.get(value, {}).values()
+                        for value in dict.fromkeys(condition["$in"])
+                    )
+                )
+        return list(self._docs.values())
+
+    def _insert(self, document: dict):
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        doc = copy_value(document)
+        if doc["_id"] in self._docs:
+            self._check_unique(doc)
+            raise self._duplicate_id(doc)
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = doc
+        self._index(doc)
+        return doc["_id"]
+
+    def _duplicate_id(self, doc):
+        message = (
+            f"E11000 duplicate key error collection: {self.full_name} "
+            f"index: _id_ dup key: {doc['_id']}"
+        )
+        return DuplicateKeyError(
+            message,
+            DUPLICATE_KEY_ERROR,
+            {"code": DUPLICATE_KEY_ERROR, "errmsg": message},
+        )
+
+    def _replace(self, old: dict, new: dict):
+        if new.get("_id", old["_id"]) != old["_id"]:
+            raise OperationFailure(
+                "Performing an update on the path '_id' would modify the immutable field '_id'",
+                66,
+            )
+        new["_id"] = old["_id"]
+        self._check_unique(new, replacing=old["_id"])
+        self._unindex(old)
+        self._docs[old["_id"]] = new
+        self._index(new)
+
+    def _remove(self, doc: dict):
+        self._unindex(doc)
+        del self._docs[doc["_id"]]
+
+    def _first(self, filter, sort=None):
+        cursor = FakeCursor(self, filter, sort=sort, limit=1)
+        docs = [d for d in self._candidates(cursor.filter) if matches(d, cursor.filter)]
+        if cursor._sort:
+            docs = sort_documents(docs, cursor._sort, 1)
+        return docs[0] if docs else None
+
+    def _update(
+        self, filter, update, upsert=False, multi=False, sort=None, array_filters=None
+    ):
+        """Apply an update; returns (matched, modified, upserted_id, before, after)"""
+        filter = normalize_filter(filter)
+        if multi:
+            targets = [d for d in self._candidates(filter) if matches(d, filter)]
+        else:
+            first = self._first(filter, sort)
+            targets = [first] if first is not None else []
+        replacement = update and not is_operator_dict(update)
+        before = after = None
+        modified = 0
+        for doc in targets:
+            if replacement:
+                new = {"_id": doc["_id"], **copy_value(update)}
+            else:
+                new = copy_value(doc)
+                apply_update(new, update, array_filters=array_filters)
+            if new != doc:
+                self._replace(doc, new)
+                modified += 1
+            before, after = doc, self._docs[doc["_id"]]
+        if targets or not upsert:
+            return len(targets), modified, None, before, after
+
+        new = upsert_seed(filter) if not replacement else {}
+        if replacement:
+            new.update(copy_value(update))
+            if "_id" in filter and not is_operator_dict(filter["_id"]):
+                new.setdefault("_id", filter["_id"])
+        else:
+            apply_update(new, update, inserting=True)
+        _id = self._insert(new)
+        return 0, 0, _id, None, self._docs[_id]
+
+    def _delete(self, filter, multi=False, sort=None) -> list:
+        filter = normalize_filter(filter)
+        if multi:
+            targets = [d for d in self._candidates(filter) if matches(d, filter)]
+        else:
+            first = self._first(filter, sort)
+            targets = [first] if first is not None else []
+        for doc in targets:
+            self._remove(doc)
+        return targets
+
+    # Motor API
+    def find(self, filter=None, projection=None, **kwargs) -> FakeCursor:
+        return FakeCursor(self, filter, projection, **kwargs)
+
+    async def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs):
+        await round_trip()
+        doc = self._first(normalize_filter(filter), sort)
+        return project(doc, projection) if doc is not None else None
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        await round_trip()
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(
+        self, documents, ordered: bool = True, **kwargs
+    ) -> InsertManyResult:
+        await round_trip()
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError(
+                bulk_result(nInserted=len(inserted), writeErrors=errors)
+            )
+        return InsertManyResult(inserted, True)
+
+    async def update_one(
+        self, filter, update, upsert=False, sort=None, array_filters=None, **kwargs
+    ) -> UpdateResult:
+        await round_trip()
+        matched, modified, upserted, _, _ = self._update(
+            filter, update, upsert, sort=sort, array_filters=array_filters
+        )
+        return update_result(matched, modified, upserted)
+
+    async def update_many(
+        self, filter, update, upsert=False, array_filters=None, **kwargs
+    ) -> UpdateResult:
+        await round_trip()
+        matched, modified, upserted, _, _ = self._update(
+            filter, update, upsert, multi=True, array_filters=array_filters
+        )
+        return update_result(matched, modified, upserted)
+
+    async def replace_one(
+        self, filter, replacement, upsert=False, **kwargs
+    ) -> UpdateResult:
+        await round_trip()
+        matched, modified, upserted, _, _ = self._update(filter, replacement, upsert)
+        return update_result(matched, modified, upserted)
+
+    async def delete_one(self, filter, **kwargs) -> DeleteResult:
+        await round_trip()
+        return DeleteResult({"n": len(self._delete(filter))}, True)
+
+    async def delete_many(self, filter, **kwargs) -> DeleteResult:
+        await round_trip()
+        return DeleteResult({"n": len(self._delete(filter, multi=True))}, True)
+
+    async def find_one_and_update(
+        self,
+        filter,
+        update,
+        projection=None,
+        sort=None,
+        upsert=False,
+        return_document=False,
+        array_filters=None,
+        **kwargs,
+    ):
+        await round_trip()
+        _, _, _, before, after = self._update(
+            filter, update, upsert, sort=sort, array_filters=array_filters
+        )
+        doc = after if return_document else before
+        return project(doc, projection) if doc is not None else None
+
+    async def find_one_and_replace(self, filter, replacement, **kwargs):
+        return await self.find_one_and_update(filter, replacement, **kwargs)
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        await round_trip()
+        removed = self._delete(filter, sort=sort)
+        return project(removed[0], projection) if removed else None
+
+    async def bulk_write(
+        self, requests, ordered: bool = True, **kwargs
+    ) -> BulkWriteResult:
+        await round_trip()
+        counts = {
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+        }
+        upserted, errors = [], []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    counts["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    matched, modified, upserted_id, _, _ = self._update(
+                        request._filter,
+                        request._doc,
+                        request._upsert,
+                        multi=isinstance(request, UpdateMany),
+                        array_filters=getattr(request, "_array_filters", None),
+                    )
+                    counts["nMatched"] += matched
+                    counts["nModified"] += modified
+                    if upserted_id is not None:
+                        counts["nUpserted"] += 1
+                        upserted.append({"index": index, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    removed = self._delete(
+                        request._filter, multi=isinstance(request, DeleteMany)
+                    )
+                    counts["nRemoved"] += len(removed)
+                else:
+                    raise NotImplementedError(
+                        f"{type(request).__name__} is not supported"
+                    )
+            except DuplicateKeyError as e:
+                errors.append(
+                    {"index": index, "code": e.code, "errmsg": str(e), "op": request}
+                )
+                if ordered:
+                    break
+        result = bulk_result(upserted=upserted, writeErrors=errors, **counts)
+        if errors:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def aggregate(self, pipeline: list, **kwargs) -> FakeAggregateCursor:
+        return FakeAggregateCursor(self, pipeline)
+
+    async def count_documents(self, filter=None, **kwargs) -> int:
+        await round_trip()
+        filter = normalize_filter(filter)
+        count = sum(1 for d in self._candidates(filter) if matches(d, filter))
+        if kwargs.get("skip"):
+            count = max(0, count - kwargs["skip"])
+        if kwargs.get("limit"):
+            count = min(count, kwargs["limit"])
+        return count
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        await round_trip()
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter=None, **kwargs) -> list:
+        await round_trip()
+        filter = normalize_filter(filter)
+        values = []
+        for doc in self._candidates(filter):
+            if not matches(doc, filter):
+                continue
+            value = get_path(doc, key)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not MISSING and item not in values:
+                    values.append(item)
+        return values
+
+    async def create_index(
+        self,
+        keys,
+        name=None,
+        unique=False,
+        sparse=False,
+        partialFilterExpression=None,
+        **kwargs,
+    ) -> str:
+        await round_trip()
+        keys = normalize_keys(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name in self._indexes:
+            return name
+        index = Index(name, keys, unique, sparse, partialFilterExpression)
+        if unique:
+            for doc in self._docs.values():
+                if not index.covers(doc):
+                    continue
+                key = index.key(doc)
+                if key in index.entries:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.full_name} index: {name}",
+                        DUPLICATE_KEY_ERROR,
+                    )
+                index.entries[key] = doc["_id"]
+        self._indexes[name] = index
+        field = keys[0][0]
+        if field != "_id" and field not in self._lookups:
+            lookup = self._lookups[field] = {}
+            for doc in self._docs.values():
+                for value in lookup_values(doc, field):
+                    lookup.setdefault(value, {})[doc["_id"]] = doc
+        return name
+
+    def _stats(self) -> dict:
+        """collStats-like sizes: uncompressed BSON, index size estimated"""
+        size = sum(len(bson.encode(doc)) for doc in self._docs.values())
+        index_sizes = {
+            name: sum(index.entry_bytes(doc) for doc in self._docs.values())
+            for name, index in self._indexes.items()
+        }
+        count = len(self._docs)
+        return {
+            "ns": self.full_name,
+            "count": count,
+            "size": size,
+            "avgObjSize": size // count if count else 0,
+            "storageSize": size,
+            "nindexes": len(index_sizes),
+            "indexSizes": index_sizes,
+            "totalIndexSize": sum(index_sizes.values()),
+            "ok": 1.0,
+        }
+
+    async def drop_index(self, name: str):
+        await round_trip()
+        self._indexes.pop(name)
+
+    async def index_information(self) -> dict:
+        await round_trip()
+        return {name: index.info() for name, index in self._indexes.items()}
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+
+def bulk_result(**values) -> dict:
+    result = {
+        "nInserted": 0,
+        "nUpserted": 0,
+        "nMatched": 0,
+        "nModified": 0,
+        "nRemoved": 0,
+        "upserted": [],
+        "writeErrors": [],
+        "writeConcernErrors": [],
+    }
+    result.update(values)
+    return result
+
+
+def update_result(matched: int, modified: int, upserted) -> UpdateResult:
+    raw = {"n": matched + (1 if upserted is not None else 0), "nModified": modified}
+    if upserted is not None:
+        raw["upserted"] = upserted
+    raw["updatedExisting"] = matched > 0
+    return UpdateResult(raw, True)
+
+
+class FakeDatabase:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = FakeCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> FakeCollection:
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> list:
+        await round_trip()
+        return [name for name, c in self._collections.items() if c._docs]
+
+    async def drop_collection(self, name: str):
+        await round_trip()
+        self._collections.pop(name, None)
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        await round_trip()
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        if name == "collStats":
+            value = command[name] if isinstance(command, dict) else args[0]
+            return self[value]._stats()
+        raise OperationFailure(f"Command {name} is not supported by the fake", 59)
+
+    def _stage(self, name: str, spec, docs: list) -> list:
+        """Apply one aggregation stage (other than a leading $match)"""
+        if name == "$match":
+            return [doc for doc in docs if matches(doc, spec)]
+        if name == "$group":
+            return group_stage(docs, spec)
+        if name == "$sort":
+            return sort_documents(list(docs), spec)
+        if name == "$limit":
+            return docs[:spec]
+        if name == "$skip":
+            return docs[spec:]
+        if name == "$project":
+            return project_stage(docs, spec)
+        if name in ("$addFields", "$set"):
+            result = []
+            for doc in docs:
+                doc = copy_value(doc)
+                for key, value in spec.items():
+                    set_path(doc, key, plain(evaluate(value, doc)))
+                result.append(doc)
+            return result
+        if name == "$unwind":
+            return unwind_stage(docs, spec)
+        if name == "$count":
+            return [{spec: len(docs)}] if docs else []
+        if name == "$facet":
+            result = {}
+            for field, stages in spec.items():
+                facet = list(docs)
+                for stage in stages:
+                    ((stage_name, stage_spec),) = stage.items()
+                    facet = self._stage(stage_name, stage_spec, facet)
+                result[field] = facet
+            return [result]
+        raise NotImplementedError(f"Aggregation stage {name} is not supported")
+
+
+class FakeMongoClient:
+    def __init__(self, *args, **kwargs):
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = FakeDatabase(self, name)
+        return database
+
+    def get_database(self, name: str, **kwargs) -> FakeDatabase:
+        return self[name]
+
+    async def drop_database(self, name):
+        await round_trip()
+        self._databases.pop(getattr(name, "name", name), None)
+
+    def close(self):
+        self._databases.clear()
@@ -0,0 +1,296 @@
+"""Run load scenarios against the API in-process and report JSON.
+
+The app is driven through httpx's ASGI transport, so the numbers cover
+routing, validation, handlers and serialization without a network hop. By
+default the database is the in-memory stand-in from ``benchmarks.fake_mongo``;
+``--backend mongo`` uses the MongoDB at MONGODB_URL instead. The database is
+seeded by ``benchmarks.seed`` before the scenarios run:
+
+- roll_call: a morning burst, one ``POST /api/attendance`` per enrolled
+  student of several courses, ``--concurrency`` requests in flight
+- roll_call_bulk: the same for other courses through ``POST /api/attendance/bulk``
+- stats: dashboard clients polling ``/api/attendance/stats`` (course totals,
+  per-student breakdown and a last-week range)
+- history: paging through student and course history by ``X-Next-Cursor``
+
+Each scenario reports throughput and p50/p95/p99 latency; save the output
+per commit and diff it to catch regressions.
+
+    python -m benchmarks.load --students 5000 --days 10 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+
+import httpx
+
+from app.main import app
+from app.services.attendance_batcher import AttendanceBatcher
+from app.system.config import settings
+from app.system.database import create_client
+from app.system.pagination import NEXT_CURSOR_HEADER
+from benchmarks import seed as seeding
+from benchmarks.fake_mongo import FakeMongoClient
+
+BENCH_DATABASE = "attendance_bench"
+SCENARIOS = ("roll_call", "roll_call_bulk", "stats", "history")
+
+
+class Recorder:
+    """Latency and status of every request in a scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.started = time.perf_counter()
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        self.statuses[response.status_code] += 1
+        return response
+
+    def report(self, **extra) -> dict:
+        elapsed = time.perf_counter() - self.started
+        latencies = self.latencies or [0.0]
+        cuts = (
+            statistics.quantiles(latencies, n=100)
+            if len(latencies) > 1
+            else latencies * 99
+        )
+        return {
+            "requests": len(self.latencies),
+            "statuses": {
+                str(code): count for code, count in sorted(self.statuses.items())
+            },
+            "seconds": round(elapsed, 3),
+            "throughput_rps": round(len(self.latencies) / elapsed, 1) if elapsed else 0,
+            "p50_ms": round(cuts[49], 2),
+            "p95_ms": round(cuts[94], 2),
+            "p99_ms": round(cuts[98], 2),
+            "max_ms": round(max(latencies), 2),
+            **extra,
+        }
+
+
+async def bounded(jobs, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with limit:
+            return await job
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+async def roll_call(
+    client, dataset: seeding.Dataset, courses: list[str], concurrency: int
+):
+    recorder = Recorder()
+    jobs = [
+        recorder.request(
+            client,
+            "POST",
+            "/api/attendance",
+            json={"student_id": student_id, "course_id": course_id, "present": True},
+        )
+        for course_id in courses
+        for student_id in dataset.rosters[course_id]
+    ]
+    random.Random(0).shuffle(jobs)
+    await bounded(jobs, concurrency)
+    return recorder.report(courses=len(courses))
+
+
+async def roll_call_bulk(
+    client, dataset: seeding.Dataset, courses: list[str], concurrency: int
+):
+    recorder = Recorder()
+    jobs = []
+    for course_id in courses:
+        roster = dataset.rosters[course_id]
+        # The bulk endpoint takes up to 1000 entries per request
+        for i in range(0, len(roster), 1000):
+            entries = [{"student_id": s, "present": True} for s in roster[i : i + 1000]]
+            jobs.append(
+                recorder.request(
+                    client,
+                    "POST",
+                    "/api/attendance/bulk",
+                    json={"course_id": course_id, "entries": entries},
+                )
+            )
+    await bounded(jobs, concurrency)
+    marks = sum(len(dataset.rosters[c]) for c in courses)
+    return recorder.report(courses=len(courses), marks=marks)
+
+
+async def stats_polling(client, dataset: seeding.Dataset, pollers: int, polls: int):
+    recorder = Recorder()
+    week = dataset.days[-7:]
+
+    async def poller(rng: random.Random):
+        for i in range(polls):
+            course_id = rng.choice(dataset.courses)
+            params = [
+                {},
+                {"by_student": "true"},
+                {"from_day": week[0], "to_day": week[-1]},
+            ][i % 3]
+            await recorder.request(
+                client, "GET", f"/api/attendance/stats/{course_id}", params=params
+            )
+
+    await asyncio.gather(*(poller(random.Random(p)) for p in range(pollers)))
+    return recorder.report(pollers=pollers)
+
+
+async def history_pull(
+    client, dataset: seeding.Dataset, students: int, courses: int, concurrency: int
+):
+    recorder = Recorder()
+    rows = 0
+
+    async def pull(url: str, limit: int):
+        nonlocal rows
+        cursor = None
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = await recorder.request(client, "GET", url, params=params)
+            rows += len(response.json())
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if not cursor:
+                return
+
+    rng = random.Random(1)
+    jobs = [
+        pull(f"/api/attendance/student/{s}", 100)
+        for s in rng.sample(dataset.students, min(students, len(dataset.students)))
+    ] + [
+        pull(f"/api/attendance/course/{c}", 1000)
+        for c in rng.sample(dataset.courses, min(courses, len(dataset.courses)))
+    ]
+    await bounded(jobs, concurrency)
+    return recorder.report(rows=rows)
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args):
+    client = FakeMongoClient() if args.backend == "fake" else create_client()
+    db = client[BENCH_DATABASE]
+    app.state.db = db
+    app.state.indexes_ready = True
+    batcher = None
+
+    try:
+        await client.drop_database(BENCH_DATABASE)
+        start = time.perf_counter()
+        dataset = await seeding.seed(
+            db,
+            departments=args.departments,
+            courses_per_class=args.courses_per_class,
+            students=args.students,
+            days=args.days,
+            seed=args.seed,
+        )
+        seed_seconds = round(time.perf_counter() - start, 2)
+
+        if args.write_behind:
+            batcher = AttendanceBatcher(
+                db,
+                max_batch=settings.attendance_batch_size,
+                max_delay_ms=settings.attendance_batch_delay_ms,
+                max_queue=settings.attendance_queue_size,
+            )
+            batcher.start()
+            app.state.attendance_batcher = batcher
+
+        # Roll-call scenarios mark disjoint courses so neither sees duplicates
+        courses = random.Random(args.seed).sample(dataset.courses, len(dataset.courses))
+        single = courses[: args.roll_call_courses]
+        bulk = courses[args.roll_call_courses : 2 * args.roll_call_courses]
+
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as http:
+            for scenario in args.scenarios:
+                if scenario == "roll_call":
+                    results[scenario] = await roll_call(
+                        http, dataset, single, args.concurrency
+                    )
+                elif scenario == "roll_call_bulk":
+                    results[scenario] = await roll_call_bulk(
+                        http, dataset, bulk, args.concurrency
+                    )
+                elif scenario == "stats":
+                    results[scenario] = await stats_polling(
+                        http, dataset, args.pollers, args.polls
+                    )
+                elif scenario == "history":
+                    results[scenario] = await history_pull(
+                        http,
+                        dataset,
+                        args.history_students,
+                        args.history_courses,
+                        args.concurrency,
+                    )
+
+        report = {
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "write_behind": args.write_behind,
+            "dataset": dataset.summary(),
+            "seed_seconds": seed_seconds,
+            "scenarios": results,
+        }
+        output = json.dumps(report, indent=2)
+        print(output)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+    finally:
+        if batcher:
+            await batcher.close()
+            del app.state.attendance_batcher
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "mongo"), default="fake")
+    seeding.add_arguments(parser)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--roll-call-courses", type=int, default=8)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--polls", type=int, default=30)
+    parser.add_argument("--history-students", type=int, default=50)
+    parser.add_argument("--history-courses", type=int, default=5)
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    asyncio.run(main(parser.parse_args()))
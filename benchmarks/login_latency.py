@@ -0,0 +1,120 @@
+"""Login and read latency while faculty log in under background load.
+
+Runs a login storm through ``users.login`` while other requests
+(``GET /api/students/{id}``, driven through the app in-process with httpx)
+keep the event loop busy, against the MongoDB at MONGODB_URL. Compares
+scrypt on the hashing thread pool with scrypt run inline on the event loop,
+reporting p50/p99 for both kinds of request.
+
+    python -m benchmarks.login_latency --logins 200 --readers 20
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.models import UserLogin
+from app.routers import users
+from app.system import passwords
+from app.system.database import create_client, ensure_indexes
+
+BENCH_DATABASE = "attendance_bench"
+
+
+class InlineHasher(passwords.PasswordHasher):
+    """Hashes on the event loop, i.e. what offloading avoids"""
+
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+def summary(latencies: list[float]) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def storm(
+    db, http: httpx.AsyncClient, student_id: str, logins: int, readers: int
+) -> dict:
+    login_latencies = []
+    read_latencies = []
+    done = asyncio.Event()
+
+    async def reader():
+        while not done.is_set():
+            start = time.perf_counter()
+            response = await http.get(f"/api/students/{student_id}")
+            response.raise_for_status()
+            read_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    async def one_login(i):
+        start = time.perf_counter()
+        await users.login(UserLogin(username=f"faculty{i % 50}", password="pw"), db=db)
+        login_latencies.append(time.perf_counter() - start)
+
+    background = [asyncio.create_task(reader()) for _ in range(readers)]
+    await asyncio.gather(*(one_login(i) for i in range(logins)))
+    done.set()
+    await asyncio.gather(*background)
+    return {"login": summary(login_latencies), "read": summary(read_latencies)}
+
+
+async def main(logins: int, readers: int):
+    client = create_client()
+    db = client[BENCH_DATABASE]
+    app.state.db = db
+    app.state.indexes_ready = True
+    report = {}
+
+    try:
+        await ensure_indexes(db)
+        await db.users.insert_many(
+            [
+                {
+                    "full_name": f"Faculty {i}",
+                    "username": f"faculty{i}",
+                    "email": f"faculty{i}@example.com",
+                    "password": passwords.scrypt_hash("pw"),
+                    "type": "faculty",
+                }
+                for i in range(50)
+            ]
+        )
+        student = await db.students.insert_one(
+            {"full_name": "Bench Student", "department_id": "d", "class": "A"}
+        )
+        student_id = str(student.inserted_id)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as http:
+            pool = passwords.password_hasher
+            users.password_hasher = InlineHasher(workers=1, max_waiting=logins)
+            report["inline"] = await storm(db, http, student_id, logins, readers)
+            users.password_hasher = pool
+            report["thread_pool"] = await storm(db, http, student_id, logins, readers)
+            report["thread_pool"]["hasher"] = pool.stats()
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.readers))
@@ -0,0 +1,139 @@
+"""Name search: indexed prefix search vs downloading every student.
+
+Seeds --students students (no attendance) and replays someone typing a name
+into the search box, one request per keystroke:
+
+- ``download_all``: what the front end did before, paging through
+  ``GET /api/students`` by ``X-Next-Cursor`` at the largest page size and
+  filtering the names client-side;
+- ``search``: ``GET /api/students/search?q=<prefix>``, alone and within one
+  department and class.
+
+Reports the median latency per keystroke, the bytes transferred and the
+number of matches. The response cache is disabled so every request does the
+work. By default this runs on the in-memory stand-in (which scans instead of
+using the index); use ``--backend mongo`` for real numbers.
+
+    python -m benchmarks.name_search --students 100000 --backend mongo
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.system.conditional import response_cache
+from app.system.database import create_client
+from app.system.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.system.search import normalize
+from benchmarks import seed as seeding
+from benchmarks.fake_mongo import FakeMongoClient
+
+BENCH_DATABASE = "name_search_bench"
+
+
+async def download_all(http: httpx.AsyncClient, prefix: str) -> dict:
+    """Every student page by page, then the names matching ``prefix``"""
+    sent = 0
+    students = []
+    params = {"limit": MAX_PAGE_SIZE}
+    while True:
+        response = await http.get("/api/students", params=params)
+        response.raise_for_status()
+        sent += len(response.content)
+        students.extend(response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    wanted = normalize(prefix)
+    matches = [s for s in students if normalize(s["full_name"]).startswith(wanted)]
+    return {"bytes": sent, "matches": len(matches)}
+
+
+async def search(http: httpx.AsyncClient, prefix: str, **filters) -> dict:
+    response = await http.get("/api/students/search", params={"q": prefix, **filters})
+    response.raise_for_status()
+    return {"bytes": len(response.content), "matches": len(response.json())}
+
+
+async def keystrokes(name: str, request, rounds: int) -> dict:
+    """Median latency and the total transfer of typing ``name``"""
+    timings = []
+    sent = 0
+    matches = 0
+    for length in range(1, len(name) + 1):
+        prefix = name[:length]
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = await request(prefix)
+            samples.append(time.perf_counter() - start)
+        timings.append(statistics.median(samples))
+        sent += result["bytes"]
+        matches = result["matches"]
+    return {
+        "keystrokes": len(name),
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+        "bytes": sent,
+        "final_matches": matches,
+    }
+
+
+async def main(args):
+    client = FakeMongoClient() if args.backend == "fake" else create_client()
+    db = client[BENCH_DATABASE]
+    app.state.db = db
+    app.state.indexes_ready = True
+    response_cache.max_bytes = 0
+
+    try:
+        await client.drop_database(BENCH_DATABASE)
+        dataset = await seeding.seed(
+            db,
+            departments=args.departments,
+            courses_per_class=args.courses_per_class,
+            students=args.students,
+            days=0,
+            seed=args.seed,
+        )
+        student = await db.students.find_one({})
+        name = student["full_name"].split()[0][: args.typed]
+        scoped = {"department_id": student["department_id"], "class": student["class"]}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as http:
+            results = {
+                "download_all": await keystrokes(
+                    name, lambda q: download_all(http, q), args.download_rounds
+                ),
+                "search": await keystrokes(
+                    name, lambda q: search(http, q), args.rounds
+                ),
+                "search_department_class": await keystrokes(
+                    name, lambda q: search(http, q, **scoped), args.rounds
+                ),
+            }
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    report = {"students": len(dataset.students), "typed": name, **results}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "mongo"), default="fake")
+    seeding.add_arguments(parser)
+    parser.add_argument("--typed", type=int, default=4, help="Characters typed")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--download-rounds", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,210 @@
+"""Generate a realistic institution for load tests.
+
+Departments have courses per class and semester; students belong to a
+department and class and attend every course of their class. Past days get
+one attendance mark per enrolled student per course, written through the
+configured ATTENDANCE_STORAGE layout, then the rollups are rebuilt so stats
+endpoints see the history.
+
+    python -m benchmarks.seed --students 20000 --days 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+
+from app.commands.rebuild_rollups import reconcile
+from app.services.attendance_store import attendance_store
+from app.system.database import create_client, ensure_indexes
+from app.system.dates import day_bucket
+from app.system.search import normalize
+
+BENCH_DATABASE = "attendance_bench"
+INSERT_BATCH = 10_000
+CLASSES = ("A", "B", "C", "D")
+FIRST_NAMES = ("Asha", "Ravi", "Meera", "Arjun", "Kavya", "Nikhil", "Priya", "Rahul")
+LAST_NAMES = ("Sharma", "Iyer", "Patel", "Singh", "Rao", "Das", "Nair", "Gupta")
+
+
+@dataclass
+class Dataset:
+    departments: list[str] = field(default_factory=list)
+    courses: list[str] = field(default_factory=list)
+    students: list[str] = field(default_factory=list)
+    # course _id -> student _ids enrolled in it
+    rosters: dict[str, list[str]] = field(default_factory=dict)
+    days: list[str] = field(default_factory=list)
+    attendance_rows: int = 0
+
+    def summary(self) -> dict:
+        return {
+            "departments": len(self.departments),
+            "courses": len(self.courses),
+            "students": len(self.students),
+            "days": len(self.days),
+            "attendance_rows": self.attendance_rows,
+        }
+
+
+async def insert_batched(collection, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == INSERT_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+def attendance_rows(dataset: Dataset, rng: random.Random, present_rate: float):
+    now = datetime.utcnow()
+    for day in dataset.days:
+        timestamp = int(datetime.fromisoformat(day).timestamp())
+        for course_id, roster in dataset.rosters.items():
+            for student_id in roster:
+                yield {
+                    "student_id": student_id,
+                    "course_id": course_id,
+                    "present": rng.random() < present_rate,
+                    "date": timestamp,
+                    "day": day,
+                    "submitted_by": "system",
+                    "updated_at": now,
+                }
+
+
+async def seed(
+    db,
+    departments: int = 10,
+    courses_per_class: int = 2,
+    students: int = 20_000,
+    days: int = 10,
+    present_rate: float = 0.85,
+    seed: int = 0,
+) -> Dataset:
+    """Fill ``db`` with a generated institution and return its ids"""
+    rng = random.Random(seed)
+    dataset = Dataset()
+    now = datetime.utcnow()
+    await ensure_indexes(db)
+
+    department_docs = [
+        {
+            "_id": ObjectId(),
+            "department_name": f"Department {d}",
+            "submitted_by": "system",
+            "updated_at": now,
+        }
+        for d in range(departments)
+    ]
+    await insert_batched(db.departments, department_docs)
+    dataset.departments = [str(d["_id"]) for d in department_docs]
+
+    course_docs = []
+    for department_id in dataset.departments:
+        for class_ in CLASSES:
+            for c in range(courses_per_class):
+                course_docs.append(
+                    {
+                        "_id": ObjectId(),
+                        "course_name": f"Course {class_}{c}",
+                        "department_id": department_id,
+                        "semester": rng.randint(1, 8),
+                        "class": class_,
+                        "lecture_hours": rng.randint(2, 5),
+                        "submitted_by": "system",
+                        "updated_at": now,
+                    }
+                )
+    await insert_batched(db.courses, course_docs)
+    dataset.courses = [str(c["_id"]) for c in course_docs]
+
+    student_docs = []
+    for s in range(students):
+        full_name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {s}"
+        student_docs.append(
+            {
+                "_id": ObjectId(),
+                "full_name": full_name,
+                "search_name": normalize(full_name),
+                "department_id": rng.choice(dataset.departments),
+                "class": rng.choice(CLASSES),
+                "submitted_by": "system",
+                "updated_at": now,
+            }
+        )
+    await insert_batched(db.students, student_docs)
+    dataset.students = [str(s["_id"]) for s in student_docs]
+
+    # Everyone attends every course of their department and class
+    by_class = {}
+    for s in student_docs:
+        by_class.setdefault((s["department_id"], s["class"]), []).append(str(s["_id"]))
+    for c in course_docs:
+        dataset.rosters[str(c["_id"])] = by_class.get(
+            (c["department_id"], c["class"]), []
+        )
+
+    # History ends yesterday so today's roll call never collides with it
+    yesterday = date.fromisoformat(day_bucket()) - timedelta(days=1)
+    dataset.days = [(yesterday - timedelta(days=d)).isoformat() for d in range(days)][
+        ::-1
+    ]
+    store = attendance_store(db)
+    batch = []
+    for row in attendance_rows(dataset, rng, present_rate):
+        batch.append(row)
+        if len(batch) == INSERT_BATCH:
+            await store.insert_many(batch)
+            batch = []
+    if batch:
+        await store.insert_many(batch)
+    dataset.attendance_rows = sum(len(r) for r in dataset.rosters.values()) * days
+
+    await reconcile(db)
+    return dataset
+
+
+async def main(args):
+    client = create_client()
+    db = client[BENCH_DATABASE]
+    try:
+        await client.drop_database(BENCH_DATABASE)
+        start = time.perf_counter()
+        dataset = await seed(
+            db,
+            departments=args.departments,
+            courses_per_class=args.courses_per_class,
+            students=args.students,
+            days=args.days,
+            seed=args.seed,
+        )
+        report = {
+            **dataset.summary(),
+            "seconds": round(time.perf_counter() - start, 2),
+            "database": BENCH_DATABASE,
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        client.close()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--courses-per-class", type=int, default=2)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""Microbenchmark of list serialization: response_model path vs fast path.
+
+Builds N attendance documents in memory (no MongoDB needed) and times:
+
+- ``model``: the previous handler path, a dict copy per document, validation
+  against ``list[AttendanceResponse]`` and JSON encoding as FastAPI does it;
+- ``fast``: ``to_rows`` + ``TypeAdapter.dump_json``;
+- ``fast_orjson``: ``to_rows`` + orjson, when orjson is installed;
+- ``sparse``: the fast path for ``?fields=_id,present``.
+
+Also reports the size of each body and the time a client takes to decode it.
+
+    python -m benchmarks.serialization --sizes 1000 10000 50000
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models import AttendanceResponse, partial_model, response_fields
+from app.system import serialization
+
+MODEL_ADAPTER = TypeAdapter(list[AttendanceResponse])
+SPARSE_MODEL = partial_model(AttendanceResponse, ("_id", "present"))
+
+
+def make_docs(count: int) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "student_id": str(ObjectId()),
+            "course_id": str(ObjectId()),
+            "present": i % 4 != 0,
+            "day": "2025-01-01",
+            "submitted_by": "system",
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def model_path(docs: list[dict]) -> bytes:
+    rows = [{**d, "_id": str(d["_id"])} for d in docs]
+    validated = MODEL_ADAPTER.validate_python(rows)
+    content = MODEL_ADAPTER.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def fast_path(docs: list[dict]) -> bytes:
+    rows = serialization.to_rows(docs, response_fields(AttendanceResponse))
+    return serialization._rows_adapter.dump_json(rows)
+
+
+def orjson_path(docs: list[dict]) -> bytes:
+    rows = serialization.to_rows(docs, response_fields(AttendanceResponse))
+    return serialization.orjson.dumps(rows)
+
+
+def sparse_path(docs: list[dict]) -> bytes:
+    rows = serialization.to_rows(docs, response_fields(SPARSE_MODEL))
+    return serialization._rows_adapter.dump_json(rows)
+
+
+def timed(fn, arg, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main(sizes: list[int], rounds: int):
+    paths = {"model": model_path, "fast": fast_path}
+    if serialization.orjson is not None:
+        paths["fast_orjson"] = orjson_path
+    paths["sparse"] = sparse_path
+
+    report = []
+    for size in sizes:
+        docs = make_docs(size)
+        row = {"items": size}
+        for name, fn in paths.items():
+            row[f"{name}_ms"] = timed(fn, docs, rounds)
+            body = fn(docs)
+            row[f"{name}_bytes"] = len(body)
+            row[f"{name}_decode_ms"] = timed(json.loads, body, rounds)
+        report.append(row)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.sizes, args.rounds)
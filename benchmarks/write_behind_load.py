@@ -0,0 +1,112 @@
+"""Load-test POST /api/attendance with write-behind batching off and on.
+
+Fires a roll-call burst (every student of several courses marked at once,
+with a bounded number of requests in flight) through ``mark_attendance``
+against the MongoDB at MONGODB_URL and reports marks per second and
+latency percentiles for each mode.
+
+    python -m benchmarks.write_behind_load --students 2000 --courses 5 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from app.models import AttendanceCreate
+from app.routers import attendance
+from app.services.attendance_batcher import AttendanceBatcher
+from app.system.config import settings
+from app.system.database import create_client, ensure_indexes
+
+BENCH_DATABASE = "attendance_bench"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def burst(db, marks: list[AttendanceCreate], concurrency: int, batcher):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    rejected = 0
+
+    async def one(mark):
+        nonlocal rejected
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await attendance.mark_attendance(mark, db=db, batcher=batcher)
+            except HTTPException:
+                rejected += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(mark) for mark in marks))
+    elapsed = time.perf_counter() - start
+    return {
+        "marks": len(marks),
+        "rejected": rejected,
+        "marks_per_sec": round(len(marks) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def main(students: int, courses: int, concurrency: int):
+    client = create_client()
+    db = client[BENCH_DATABASE]
+    report = {}
+
+    try:
+        await ensure_indexes(db)
+        student_ids = (
+            await db.students.insert_many(
+                [{"full_name": f"Student {i}"} for i in range(students)]
+            )
+        ).inserted_ids
+        course_ids = (
+            await db.courses.insert_many(
+                [{"course_name": f"Course {i}"} for i in range(courses)]
+            )
+        ).inserted_ids
+        marks = [
+            AttendanceCreate(
+                student_id=str(student_id), course_id=str(course_id), present=True
+            )
+            for course_id in course_ids
+            for student_id in student_ids
+        ]
+
+        await db.attendance_log.delete_many({})
+        report["direct"] = await burst(db, marks, concurrency, None)
+
+        await db.attendance_log.delete_many({})
+        batcher = AttendanceBatcher(
+            db,
+            max_batch=settings.attendance_batch_size,
+            max_delay_ms=settings.attendance_batch_delay_ms,
+            max_queue=settings.attendance_queue_size,
+        )
+        batcher.start()
+        report["write_behind"] = await burst(db, marks, concurrency, batcher)
+        await batcher.close()
+        report["write_behind"]["batches"] = batcher.batches
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.students, args.courses, args.concurrency))
@@ -0,0 +1,176 @@
+"""Count MongoDB round trips and latency for every create/update endpoint.
+
+Each write handler is called in-process against the MongoDB at MONGODB_URL
+(scratch database, dropped afterwards) with a command listener attached.
+The ``legacy`` rows time the previous write-then-``find_one`` pattern for
+the same document so the saving is visible side by side.
+
+    python -m benchmarks.write_round_trips --rounds 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from bson import ObjectId
+from pymongo import monitoring
+
+from app.models import (
+    AttendanceCreate,
+    CourseCreate,
+    DepartmentCreate,
+    StudentCreate,
+    UserCreate,
+)
+from app.routers import attendance, courses, departments, students, users
+from app.system.database import create_client, ensure_indexes
+
+BENCH_DATABASE = "attendance_bench"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def measure(counter: CommandCounter, fn, rounds: int) -> dict:
+    timings = []
+    commands = []
+    for i in range(rounds):
+        before = counter.count
+        start = time.perf_counter()
+        await fn(i)
+        timings.append(time.perf_counter() - start)
+        commands.append(counter.count - before)
+    return {
+        "round_trips": statistics.mean(commands),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+    }
+
+
+async def legacy_insert(collection, document: dict):
+    result = await collection.insert_one(document)
+    return await collection.find_one({"_id": result.inserted_id})
+
+
+async def legacy_update(collection, document_id, fields: dict):
+    result = await collection.update_one({"_id": document_id}, {"$set": fields})
+    if result.matched_count:
+        return await collection.find_one({"_id": document_id})
+
+
+async def main(rounds: int):
+    counter = CommandCounter()
+    client = create_client(event_listeners=[counter])
+    db = client[BENCH_DATABASE]
+    report = {}
+
+    try:
+        await ensure_indexes(db)
+        dept = await departments.create_department(
+            DepartmentCreate(department_name="Bench"), db=db
+        )
+        course_body = CourseCreate(
+            course_name="Bench 101",
+            department_id=dept["_id"],
+            semester=1,
+            **{"class": "A"},
+            lecture_hours=3,
+        )
+        course = await courses.create_course(course_body, db=db)
+        student_body = StudentCreate(
+            full_name="Bench Student", department_id=dept["_id"], **{"class": "A"}
+        )
+        student = await students.create_student(student_body, db=db)
+        roster = await db.students.insert_many(
+            [{"full_name": f"Student {i}"} for i in range(rounds)]
+        )
+        marks = []
+
+        async def mark(i):
+            marks.append(
+                await attendance.mark_attendance(
+                    AttendanceCreate(
+                        student_id=str(roster.inserted_ids[i]),
+                        course_id=course["_id"],
+                        present=True,
+                    ),
+                    db=db,
+                    batcher=None,
+                )
+            )
+
+        endpoints = {
+            "create_department": lambda i: departments.create_department(
+                DepartmentCreate(department_name=f"Dept {i}"), db=db
+            ),
+            "update_department": lambda i: departments.update_department(
+                dept["_id"], DepartmentCreate(department_name=f"Dept {i}"), db=db
+            ),
+            "create_course": lambda i: courses.create_course(course_body, db=db),
+            "update_course": lambda i: courses.update_course(
+                course["_id"], course_body, db=db
+            ),
+            "create_student": lambda i: students.create_student(student_body, db=db),
+            "update_student": lambda i: students.update_student(
+                student["_id"], student_body, db=db
+            ),
+            "create_user": lambda i: users.create_user(
+                UserCreate(
+                    full_name="Bench User",
+                    username=f"bench{i}",
+                    email=f"bench{i}@example.com",
+                    password="secret",
+                    type="faculty",
+                ),
+                db=db,
+            ),
+            "update_attendance": lambda i: attendance.update_attendance(
+                marks[0]["_id"],
+                AttendanceCreate(
+                    student_id=marks[0]["student_id"],
+                    course_id=course["_id"],
+                    present=i % 2 == 0,
+                ),
+                db=db,
+            ),
+        }
+        report["mark_attendance"] = await measure(counter, mark, rounds)
+        for name, fn in endpoints.items():
+            report[name] = await measure(counter, fn, rounds)
+
+        report["legacy_insert_then_find"] = await measure(
+            counter,
+            lambda i: legacy_insert(db.departments, {"department_name": f"L{i}"}),
+            rounds,
+        )
+        report["legacy_update_then_find"] = await measure(
+            counter,
+            lambda i: legacy_update(
+                db.departments, ObjectId(dept["_id"]), {"department_name": f"L{i}"}
+            ),
+            rounds,
+        )
+    finally:
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds))
@@ -0,0 +1,74 @@
+"""Attendance history payloads, run in-process against the in-memory Motor
+stand-in from ``benchmarks.fake_mongo``."""
+
+import asyncio
+
+import httpx
+
+from app.main import app
+from benchmarks.fake_mongo import FakeMongoClient
+
+STORED_KEYS = {
+    "_id",
+    "student_id",
+    "course_id",
+    "present",
+    "day",
+    "submitted_by",
+    "updated_at",
+}
+
+
+async def history(*queries: str) -> list:
+    app.state.db = FakeMongoClient()["history_test"]
+    app.state.indexes_ready = True
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        department = await http.post("/api/departments", json={"department_name": "D"})
+        department_id = department.json()["_id"]
+        course = await http.post(
+            "/api/courses",
+            json={
+                "course_name": "C",
+                "department_id": department_id,
+                "semester": 1,
+                "class": "A",
+                "lecture_hours": 3,
+            },
+        )
+        student = await http.post(
+            "/api/students",
+            json={"full_name": "S", "department_id": department_id, "class": "A"},
+        )
+        student_id = student.json()["_id"]
+        mark = await http.post(
+            "/api/attendance",
+            json={
+                "student_id": student_id,
+                "course_id": course.json()["_id"],
+                "present": True,
+            },
+        )
+        assert mark.status_code == 201
+
+        responses = []
+        for query in queries:
+            response = await http.get(f"/api/attendance/student/{student_id}{query}")
+            assert response.status_code == 200, response.text
+            responses.append(response.json())
+        return responses
+
+
+def test_default_history_has_only_stored_fields():
+    (records,) = asyncio.run(history(""))
+    assert [set(record) for record in records] == [STORED_KEYS]
+
+
+def test_references_appear_only_when_expanded():
+    expanded, selected = asyncio.run(
+        history("?expand=student", "?fields=present,course")
+    )
+    assert set(expanded[0]) == STORED_KEYS | {"student"}
+    assert expanded[0]["student"]["full_name"] == "S"
+    assert set(selected[0]) == {"_id", "present", "course"}
+    assert selected[0]["course"]["course_name"] == "C"